@@ -0,0 +1,171 @@
+# benchmarks/response_parser_benchmark.py
+"""
+Response parser benchmark and fuzzer.
+
+Runs models.response_parser over the saved model responses of
+benchmarks/response_corpus (plus assets/response.py):
+
+*   checks the commands found against expected.json,
+*   feeds every response in random chunk sizes, like a stream, and checks
+    the result is the same as parsing it whole,
+*   mutates the responses (cut fences, stray quotes, heredocs without their
+    delimiter, continuations...) and checks the parser never fails, never
+    returns empty commands and stays linear on pathological input,
+*   measures the throughput of whole and streamed parsing.
+
+Usage:
+    python benchmarks/response_parser_benchmark.py [--fuzz 500] [--seed 0] [--repeat 200]
+
+Exits with status 1 when a check fails.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from assets.response import response_text # noqa: E402
+from models.response_parser import ResponseParser, parse_response # noqa: E402
+
+CORPUS_DIR = os.path.join(REPO_ROOT, "benchmarks", "response_corpus")
+
+# Fragments inserted by the mutation fuzzer, the ones that change the parser state
+FRAGMENTS = ["```", "```bash\n", "```python\n", "~~~\n", "'", '"', "`", "\\\n", "<<EOF\n", "<<-END\n",
+             "EOF\n", "$ ", "> ", "(", ")", "{\n", "}\n", "do\n", "done\n", "if true; then\n", "fi\n",
+             "case x in\n", "esac\n", " |\n", " &&\n", "# 1. step\n", "\n", "\r\n", "$(", "\t"]
+
+# Seconds allowed to parse each pathological document below
+PATHOLOGICAL_BUDGET = 2.0
+
+
+def load_corpus() -> dict[str, str]:
+    docs = {}
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.md"))):
+        with open(path, encoding="utf-8") as file:
+            docs[os.path.basename(path)] = file.read()
+    docs["assets/response.py"] = response_text
+    return docs
+
+
+def parse_streamed(text: str, rng: random.Random, max_chunk: int = 40) -> list:
+    parser = ResponseParser()
+    commands = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_chunk)
+        commands += parser.feed(text[position:position + size])
+        position += size
+    return commands + parser.close()
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    for _ in range(rng.randint(1, 6)):
+        position = rng.randint(0, len(text))
+        action = rng.random()
+        if action < 0.5:
+            text = text[:position] + rng.choice(FRAGMENTS) + text[position:]
+        elif action < 0.8:
+            text = text[:position] + text[position + rng.randint(1, 20):]
+        else:
+            text = text[:position] # Response cut short, like a stream that stopped
+    return text
+
+
+def check_expected(docs: dict[str, str]) -> list[str]:
+    with open(os.path.join(CORPUS_DIR, "expected.json"), encoding="utf-8") as file:
+        expected = json.load(file)
+    failures = []
+    for name, commands in expected.items():
+        found = [
+            {"command": c.command, "language": c.language, "step": c.step, "risky": c.risky}
+            for c in parse_response(docs[name])
+        ]
+        if found != commands:
+            failures.append(f"{name}: expected {json.dumps(commands)}\n  got {json.dumps(found)}")
+    return failures
+
+
+def fuzz(docs: dict[str, str], iterations: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    failures = []
+    names = list(docs)
+    for iteration in range(iterations):
+        name = rng.choice(names)
+        text = docs[name] if iteration < len(names) * 4 else mutate(docs[name], rng)
+        try:
+            whole = parse_response(text)
+            streamed = parse_streamed(text, rng)
+        except Exception as e:
+            failures.append(f"{name} #{iteration}: {type(e).__name__}: {e}\n{text!r}")
+            continue
+        if whole != streamed:
+            failures.append(f"{name} #{iteration}: streamed result differs from whole\n{text!r}")
+        elif any(not c.command.strip() for c in whole):
+            failures.append(f"{name} #{iteration}: empty command\n{text!r}")
+    return failures
+
+
+def check_pathological() -> list[str]:
+    """Inputs that keep a statement open forever must still parse in linear time."""
+    documents = {
+        "unclosed quote": "```bash\necho 'start\n" + "line of text\n" * 50000 + "```\n",
+        "unclosed heredoc": "```bash\ncat <<EOF\n" + "data\n" * 50000,
+        "continuations": "```bash\n" + "echo a \\\n" * 50000 + "```\n",
+        "long line": "```bash\necho " + "x" * 2_000_000 + "\n```\n",
+        "many blocks": "```bash\nls\n```\n" * 50000,
+    }
+    failures = []
+    for name, text in documents.items():
+        start = time.perf_counter()
+        parse_streamed(text, random.Random(0), max_chunk=4096)
+        elapsed = time.perf_counter() - start
+        if elapsed > PATHOLOGICAL_BUDGET:
+            failures.append(f"pathological '{name}': {elapsed:.2f}s (budget {PATHOLOGICAL_BUDGET:g}s)")
+    return failures
+
+
+def benchmark(docs: dict[str, str], repeat: int):
+    text = "\n".join(docs.values()) * repeat
+    size_mb = len(text.encode("utf-8")) / 1e6
+    print(f"Benchmark input: {size_mb:.1f} MB ({len(docs)} responses x {repeat})")
+
+    start = time.perf_counter()
+    commands = parse_response(text)
+    elapsed = time.perf_counter() - start
+    print(f"  whole:    {size_mb / elapsed:7.1f} MB/s  {len(commands) / elapsed:10.0f} commands/s")
+
+    start = time.perf_counter()
+    streamed = parse_streamed(text, random.Random(0), max_chunk=64)
+    elapsed = time.perf_counter() - start
+    print(f"  streamed: {size_mb / elapsed:7.1f} MB/s  {len(streamed) / elapsed:10.0f} commands/s (chunks of 1-64 chars)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=500, help="fuzzing iterations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=200, help="copies of the corpus parsed by the benchmark")
+    args = parser.parse_args()
+
+    docs = load_corpus()
+    failures = check_expected(docs)
+    failures += fuzz(docs, args.fuzz, args.seed)
+    failures += check_pathological()
+    benchmark(docs, args.repeat)
+
+    if failures:
+        print(f"\nFAIL: {len(failures)} check(s)")
+        for failure in failures[:20]:
+            print(f"- {failure}")
+        return 1
+    print(f"\nOK ({len(docs)} responses, {args.fuzz} fuzzing iterations)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
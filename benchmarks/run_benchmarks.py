@@ -0,0 +1,391 @@
+# benchmarks/run_benchmarks.py
+"""
+Benchmark suite of the command execution and AI suggestion paths.
+
+Runs headless: the views get a stub page, and the AI requests go to the
+offline mock provider with an injected delay, so neither a display nor a
+network (or API key) is needed. Measures:
+
+*   command_runner: run_command_thread latency for small outputs, run in
+    a fresh shell and in a shell session, and throughput for large ones,
+*   response_parsing: App.get_commands on large synthetic responses,
+*   app_view: adding, reconciling (update_response) and deleting cells at
+    10/100/1000 cells, with the page updates each one costs,
+*   ask_ai: end-to-end "Ask AI" latency, from the click to the suggested
+    cells being added, alone and for cells asking at the same time.
+
+Results are printed as JSON (a summary goes to stderr), to be kept and
+compared over time: with --output FILE.jsonl each run appends one line.
+The per stage timings of the app's own tracing are included.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--only app_view,ask_ai] [--quick] [--ai-delay 0.2] [--output results.jsonl]
+
+Exits with status 1 when a benchmark fails.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Settings are read when utils.constants is imported: nothing may touch the
+# user's cache, history or session, and no request may reach a real model
+_SCRATCH_DIR = tempfile.mkdtemp(prefix="ai-terminal-bench-")
+os.environ["AI_TERMINAL_CACHE_DIR"] = _SCRATCH_DIR
+os.environ["AI_TERMINAL_LLM_PROVIDER"] = "mock"
+os.environ["AI_TERMINAL_AI_PREFETCH"] = "0"
+os.environ["AI_TERMINAL_NO_HISTORY"] = "1"
+os.environ.setdefault("AI_TERMINAL_LOG_LEVEL", "WARNING")
+
+import flet as ft # noqa: E402
+from models.app import App # noqa: E402
+from models.session import SessionStore # noqa: E402
+from services.command_runner import run_command_thread # noqa: E402
+from services.llm_model_sdks.client_registry import LLMClientRegistry # noqa: E402
+from services.llm_model_sdks.mock.mock_client import MockClient # noqa: E402
+from services.shell_session import ShellSessionPool, close_all_sessions # noqa: E402
+from services.tracing import get_tracer # noqa: E402
+from utils.constants import LLM_COALESCE_WINDOW, OUTPUT_FLUSH_INTERVAL # noqa: E402
+
+# Version of the JSON layout, bumped when a result changes meaning
+RESULTS_VERSION = 1
+# Seconds an "Ask AI" may take beyond the injected delay before the benchmark fails
+ASK_AI_TIMEOUT = 10.0
+
+
+# --- Helpers ---
+
+def summarize(samples: list[float]) -> dict:
+    """Milliseconds statistics of durations in seconds."""
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.5) * 1000, 3),
+        "p95_ms": round(percentile(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def report(line: str):
+    """Human readable progress, kept off stdout which carries the JSON."""
+    print(line, file=sys.stderr, flush=True)
+
+
+class StubPage:
+    """Stands in for ft.Page: counts the updates instead of sending them to a client."""
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+
+
+@contextlib.contextmanager
+def headless_flet():
+    """
+    Flet refuses update() and focus() on controls that were never added to
+    a live page, which the stub page isn't: they do nothing while measuring.
+    """
+    patched = {name: getattr(ft.Control, name) for name in ("update", "focus") if hasattr(ft.Control, name)}
+    for name in patched:
+        setattr(ft.Control, name, lambda self, *args, **kwargs: None)
+    try:
+        yield
+    finally:
+        for name, method in patched.items():
+            setattr(ft.Control, name, method)
+
+
+class HeadlessCell:
+    """What run_command_thread uses of a CommandCell, without any control."""
+
+    def __init__(self, session: SessionStore, command: str):
+        self.session = session
+        self.record = session.new_record(command, session.cwd)
+        self.started = time.perf_counter()
+        self.first_output: float | None = None # Seconds until the first streamed update
+        self.updates = 0
+
+    def update_output(self, text: str, is_error: bool = False, running: bool = False, terminal=None, stderr: str = ""):
+        self.updates += 1
+        if running and self.first_output is None:
+            self.first_output = time.perf_counter() - self.started
+
+    def on_command_finished(self, result):
+        self.record.exit_code = result.returncode
+        self.record.duration = result.duration
+        self.record.finished_at = time.time()
+
+    def set_buttons_enabled(self, enabled: bool):
+        pass
+
+    def prefetch_ai_fix(self):
+        pass
+
+
+def synthetic_response(blocks: int, seed: str = "") -> str:
+    """A model answer with `blocks` numbered steps, each an explanation and a command."""
+    parts = ["Here is how to set up the project, step by step.\n\n"]
+    for step in range(1, blocks + 1):
+        parts.append(
+            f"### Step {step}\n"
+            f"This step prepares part {step} of the build, checking its files first.\n"
+            f"**Command:**\n```bash\nmake -C src/module_{step % 97} target_{step}{seed} && echo done {step}\n```\n\n"
+        )
+    return "".join(parts)
+
+
+# --- Benchmarks ---
+
+def bench_command_runner(quick: bool) -> dict:
+    runs = 10 if quick else 30
+    lines = 50_000 if quick else 200_000
+    session = SessionStore()
+    shells = ShellSessionPool(session.cwd, size=1)
+    results = {}
+
+    def run(command: str, pool: ShellSessionPool | None) -> HeadlessCell:
+        cell = HeadlessCell(session, command)
+        result = run_command_thread(command, cell, pool)
+        if result is None or result.returncode != 0:
+            raise RuntimeError(f"{command!r} failed: {result and result.stderr}")
+        return cell
+
+    try:
+        for name, pool in (("fresh_shell", None), ("shell_session", shells)):
+            run("true", pool) # Starts the shell session, not what is measured
+            samples = []
+            for index in range(runs):
+                start = time.perf_counter()
+                run(f"echo small output {index}", pool)
+                samples.append(time.perf_counter() - start)
+            results[f"small_output_{name}"] = summarize(samples)
+            report(f"  small output, {name}: p50 {results[f'small_output_{name}']['p50_ms']:.1f} ms")
+
+        # About 60 bytes per line, most of it dropped from the scrollback as it streams
+        line = "compiling src/module.c: warning: unused variable 'x' [-W]"
+        for name, pool in (("fresh_shell", None), ("shell_session", shells)):
+            command = f"yes \"{line}\" | head -n {lines}"
+            start = time.perf_counter()
+            cell = run(command, pool)
+            elapsed = time.perf_counter() - start
+            size_mb = (len(line) + 1) * lines / 1e6
+            results[f"large_output_{name}"] = {
+                "lines": lines,
+                "mb": round(size_mb, 2),
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(size_mb / elapsed, 2),
+                "first_output_ms": round(cell.first_output * 1000, 3) if cell.first_output is not None else None,
+                "streamed_updates": cell.updates,
+            }
+            report(f"  large output, {name}: {size_mb / elapsed:.1f} MB/s")
+    finally:
+        shells.close()
+    results["flush_interval_s"] = OUTPUT_FLUSH_INTERVAL
+    return results
+
+
+def bench_response_parsing(quick: bool) -> dict:
+    results = {}
+    app = App()
+    for blocks in (100, 1000) if quick else (100, 1000, 10_000):
+        response = synthetic_response(blocks)
+        app.set_response(response)
+        repeat = max(1, 2000 // blocks)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            commands = app.get_commands()
+        elapsed = (time.perf_counter() - start) / repeat
+        if len(commands) != blocks:
+            raise RuntimeError(f"{blocks} blocks parsed into {len(commands)} commands")
+        size_mb = len(response.encode("utf-8")) / 1e6
+        results[f"blocks_{blocks}"] = {
+            "mb": round(size_mb, 3),
+            "ms": round(elapsed * 1000, 3),
+            "mb_per_s": round(size_mb / elapsed, 2),
+            "commands_per_s": round(blocks / elapsed),
+        }
+        report(f"  {blocks} blocks: {elapsed * 1000:.2f} ms ({size_mb / elapsed:.1f} MB/s)")
+    return results
+
+
+def bench_app_view(quick: bool) -> dict:
+    from views.app_view import AppView
+    results = {}
+    registry = LLMClientRegistry(lambda: MockClient(latency=0))
+    for cells in (10, 100) if quick else (10, 100, 1000):
+        page = StubPage()
+        view = AppView(page, registry)
+        measured = {}
+
+        def measure(name: str, action):
+            updates = page.updates
+            start = time.perf_counter()
+            action()
+            elapsed = time.perf_counter() - start
+            measured[name] = {"ms": round(elapsed * 1000, 3), "page_updates": page.updates - updates}
+
+        try:
+            measure("add", lambda: [view.add_cell_click(f"echo cell {i}", None) for i in range(cells)])
+            measured["add"]["ms_per_cell"] = round(measured["add"]["ms"] / cells, 4)
+            # Every command differs from the cells shown: all of them are replaced
+            response = synthetic_response(cells)
+            measure("update_response_replace", lambda: view.update_response(response))
+            # One command differs: only its cell is rebuilt
+            changed = response.replace(f"target_{cells // 2} ", f"target_{cells // 2}_changed ")
+            measure("update_response_one_changed", lambda: view.update_response(changed))
+            if len(view.all_cells) != cells:
+                raise RuntimeError(f"{len(view.all_cells)} cells after update_response, expected {cells}")
+            measure("delete_all", view.delete_all_cells)
+        finally:
+            view.close()
+        results[f"cells_{cells}"] = measured
+        report(f"  {cells} cells: " + ", ".join(f"{name} {value['ms']:.1f} ms" for name, value in measured.items()))
+    return results
+
+
+def bench_ask_ai(quick: bool, delay: float) -> dict:
+    from views.app_view import AppView
+    runs = 3 if quick else 10
+    burst = 8
+    mock = MockClient(latency=delay)
+    registry = LLMClientRegistry(lambda: mock)
+    view = AppView(StubPage(), registry)
+    answered = threading.Condition()
+    latencies: dict = {}
+    counter = [0]
+
+    def failed_cell():
+        counter[0] += 1
+        # A different path each time, so no request is deduplicated or answered from past fixes
+        cell = view.add_cell_click(f"ls /nonexistent/bench-{counter[0]}", None)
+        if cell.run_and_wait():
+            raise RuntimeError("the failing command succeeded")
+
+        def on_suggestion(asked):
+            view.ask_ai(asked)
+            with answered:
+                latencies[id(asked)] = time.perf_counter()
+                answered.notify_all()
+        cell.update_ai_error_callback = on_suggestion
+        return cell
+
+    def ask(cells) -> list[float]:
+        before = len(view.all_cells)
+        start = time.perf_counter()
+        for cell in cells:
+            cell.ask_ai_with_error(None)
+        with answered:
+            if not answered.wait_for(lambda: all(id(cell) in latencies for cell in cells), delay + ASK_AI_TIMEOUT):
+                raise RuntimeError(f"no suggestion after {delay + ASK_AI_TIMEOUT:g}s")
+        if len(view.all_cells) < before + len(cells):
+            raise RuntimeError("the suggested commands weren't added")
+        return [latencies[id(cell)] - start for cell in cells]
+
+    try:
+        single = []
+        for _ in range(runs):
+            single += ask([failed_cell()])
+        requests = mock.requests
+        together = ask([failed_cell() for _ in range(burst)])
+        burst_requests = mock.requests - requests
+    finally:
+        view.close()
+    results = {
+        "injected_delay_s": delay,
+        "coalesce_window_s": LLM_COALESCE_WINDOW,
+        "single": summarize(single),
+        "single_overhead_ms": round((sorted(single)[len(single) // 2] - delay) * 1000, 3),
+        f"burst_{burst}": {**summarize(together), "model_requests": burst_requests},
+    }
+    report(f"  single: p50 {results['single']['p50_ms']:.1f} ms ({results['single_overhead_ms']:.1f} ms over the delay), "
+           f"{burst} at once: max {results[f'burst_{burst}']['max_ms']:.1f} ms in {burst_requests} request(s)")
+    return results
+
+
+BENCHMARKS = {
+    "command_runner": lambda args: bench_command_runner(args.quick),
+    "response_parsing": lambda args: bench_response_parsing(args.quick),
+    "app_view": lambda args: bench_app_view(args.quick),
+    "ask_ai": lambda args: bench_ask_ai(args.quick, args.ai_delay),
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help=f"comma separated benchmarks to run, among: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="fewer runs and smaller sizes")
+    parser.add_argument("--ai-delay", type=float, default=0.2, help="seconds the mock model takes to answer")
+    parser.add_argument("--output", help="file to write the JSON to, a .jsonl file gets one line appended per run")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results, failures = {}, []
+    with headless_flet():
+        for name in names:
+            report(f"{name}:")
+            try:
+                results[name] = BENCHMARKS[name](args)
+            except Exception as e:
+                failures.append(name)
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+                report(traceback.format_exc())
+    close_all_sessions()
+
+    document = {
+        "version": RESULTS_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "quick": args.quick,
+        "results": results,
+        "stages": get_tracer().stage_stats(),
+    }
+    if args.output and args.output.endswith(".jsonl"):
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(document) + "\n")
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(document, file, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+
+    if failures:
+        report(f"\nFAIL: {', '.join(failures)}")
+        return 1
+    report("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# benchmarks/startup_benchmark.py
+"""
+Startup import benchmark.
+
+Imports `main` in a fresh interpreter with `python -X importtime` and checks
+the result against a budget, so a heavy import sneaking into the startup
+path (e.g. the LLM SDK) is caught before it slows down every launch.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--budget-ms 400] [--top 15]
+
+Exits with status 1 when over budget or when a deferred module is imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time of `main` allowed, in milliseconds
+STARTUP_BUDGET_MS = float(os.getenv("AI_TERMINAL_STARTUP_BUDGET_MS", "400"))
+
+# Only needed once an AI request is made, never at startup
+DEFERRED_MODULES = [
+    "google.generativeai",
+    "google.api_core",
+    "grpc",
+    "google.protobuf",
+    "services.llm_model_sdks.gemini.gemini_client",
+    "services.response_cache",
+    "services.error_index",
+    "services.command_history",
+    "colorama",
+]
+
+
+def measure_imports(module: str = "main") -> dict[str, tuple[int, int]]:
+    """
+    Imports `module` in a new interpreter.
+
+    Returns:
+        dict: {module name: (self µs, cumulative µs)} from -X importtime.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr}")
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        name = fields[2].strip()
+        timings[name] = (int(fields[0]), int(fields[1]))
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports measured, the fastest one counts")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports listed")
+    args = parser.parse_args()
+
+    # The first runs warm the OS file cache and write the .pyc files
+    runs = [measure_imports() for _ in range(max(args.runs, 1))]
+    best = min(runs, key=lambda timings: timings["main"][1])
+    total_ms = best["main"][1] / 1000
+
+    print(f"import main: {total_ms:.1f} ms (best of {len(runs)}, budget {args.budget_ms:g} ms)")
+    print("\nSlowest imports (self time):")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in best]
+    if loaded:
+        failed = True
+        print(f"\nFAIL: imported at startup, should be deferred: {', '.join(loaded)}")
+    if total_ms > args.budget_ms:
+        failed = True
+        print(f"\nFAIL: startup imports take {total_ms:.1f} ms, over the {args.budget_ms:g} ms budget")
+    if not failed:
+        print("\nOK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
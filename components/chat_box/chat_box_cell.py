@@ -1,14 +1,23 @@
 # components/command_cell.py
 import flet as ft
 import threading
+import time
 from typing import Callable
-from services.command_runner import run_command_thread # Import the runner function
-from services.llm_model_sdks.gemini.gemini_client import GeminiClient
+from models.response_parser import ResponseParser
+from services.llm_model_sdks.client_registry import LLMClientRegistry, get_client_registry
+from services.llm_request_pool import LLMRequest, get_request_pool
+from services.conversation_context import ConversationContext
+from services import tracing
+from utils.constants import LLM_STREAMING
 
 class ChatBoxCell:
     """Represents a single interactive ChatBox cell in the notebook."""
 
-    def __init__(self, page: ft.Page, update_response: Callable[['str'], None]):
+    def __init__(self, page: ft.Page, update_response: Callable[['str'], None], llm_clients: LLMClientRegistry | None = None,
+                 begin_streamed_response: Callable[[], None] | None = None,
+                 add_streamed_command: Callable[[str], None] | None = None,
+                 end_streamed_response: Callable[[str], None] | None = None,
+                 context: ConversationContext | None = None):
         """
         Initializes a ChatBox.
 
@@ -17,10 +26,31 @@ class ChatBoxCell:
             update_response (Callable): A function to call when this cell's
                                        delete button is clicked. It receives the
                                        ChatBox instance itself as an argument.
+            llm_clients (LLMClientRegistry): Shared LLM client registry, the
+                                             client is only built on the first
+                                             request.
+            begin_streamed_response (Callable): Called when the first chunk of a
+                                                streamed response arrives.
+            add_streamed_command (Callable): Called with each command as soon as
+                                             its ```bash block is complete.
+            end_streamed_response (Callable): Called with the full response text
+                                              once streaming is over. Without the
+                                              three stream callbacks the cell
+                                              waits for the whole response and
+                                              calls update_response.
+            context (ConversationContext): Session history sent with each
+                                           request, which then joins it.
         """
         self.page = page
         self.update_response = update_response
-        self.gemini_client = GeminiClient()
+        self.llm_clients = llm_clients or get_client_registry()
+        self._pending_request: LLMRequest | None = None
+        self.begin_streamed_response = begin_streamed_response
+        self.add_streamed_command = add_streamed_command
+        self.end_streamed_response = end_streamed_response
+        self.streaming = LLM_STREAMING and None not in (begin_streamed_response, add_streamed_command, end_streamed_response)
+        self._stream_cancelled = threading.Event()
+        self.context = context
 
         # --- Flet Controls for the Cell ---
         self.command_input = ft.TextField(
@@ -41,6 +71,14 @@ class ChatBoxCell:
             on_click=self.run_command_click,
             icon_color=ft.colors.GREEN_ACCENT_400,
         )
+
+        self.cancel_button = ft.IconButton(
+            icon=ft.icons.STOP_ROUNDED,
+            tooltip="Cancel request",
+            on_click=self.cancel_request_click,
+            icon_color=ft.colors.RED_ACCENT_400,
+            visible=False # Only shown while waiting on the model
+        )
         
         self.output_text = ft.Text(
             "[Output will appear here]",
@@ -65,6 +103,7 @@ class ChatBoxCell:
                         [
                             self.command_input,
                             self.run_button,
+                            self.cancel_button,
                         ],
                         alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                         vertical_alignment=ft.CrossAxisAlignment.CENTER
@@ -76,8 +115,45 @@ class ChatBoxCell:
             border=ft.border.only(bottom=ft.BorderSide(1, ft.colors.with_opacity(0.2, ft.colors.OUTLINE))),
         )
 
+    def _build_context(self) -> str:
+        return self.context.build() if self.context else ""
+
     def send_request(self, request):
-        return self.gemini_client.send_request(request)
+        response = self.llm_clients.get().send_request(request, context=self._build_context())
+        if self.context:
+            self.context.add_exchange(request, response)
+        return response
+
+    def stream_request(self, request, cancelled: threading.Event):
+        """
+        Streams the response, handing each command to the view as soon as its
+        block is complete. Runs on a request pool thread.
+        """
+        parser = ResponseParser()
+        parsing = 0.0 # Seconds spent in the parser, traced once the response is complete
+        response = ""
+        for chunk in self.llm_clients.get().stream_request(request, context=self._build_context()):
+            if cancelled.is_set():
+                return response
+            if not response:
+                self.begin_streamed_response()
+            response += chunk
+            start = time.perf_counter()
+            commands = parser.feed(chunk)
+            parsing += time.perf_counter() - start
+            for parsed in commands:
+                self.add_streamed_command(parsed.command)
+
+        if not cancelled.is_set():
+            start = time.perf_counter()
+            commands = parser.close()
+            tracing.get_tracer().record(tracing.LLM_PARSE, parsing + time.perf_counter() - start,
+                                        chars=len(response), streamed=True)
+            for parsed in commands:
+                self.add_streamed_command(parsed.command)
+            if self.context:
+                self.context.add_exchange(request, response)
+        return response
         
     def run_command_click(self, e: ft.ControlEvent):
         """Handles the click event for the run button or Enter key in TextField."""
@@ -88,15 +164,57 @@ class ChatBoxCell:
             self.output_container.update()
             return
 
+        if self._pending_request and not self._pending_request.done():
+            self._pending_request.cancel() # A new request replaces the one still waiting
+            self._stream_cancelled.set()
+
         # Show output area and indicate running status
         self.output_container.visible = True
         self.update_output(f"[Running]: {command}\n...", is_error=False)
         self.set_buttons_enabled(False) # Disable buttons
 
-        # Run the command execution in a separate thread
-        response = self.send_request(command)
+        # Ask the model on the request pool so the UI stays responsive
+        if self.streaming:
+            self._stream_cancelled = threading.Event()
+            self._pending_request = get_request_pool().submit(
+                self.stream_request, command, self._stream_cancelled,
+                on_result=self._on_streamed_response,
+                on_error=self._on_request_error,
+            )
+        else:
+            self._pending_request = get_request_pool().submit(
+                self.send_request, command,
+                on_result=self._on_response,
+                on_error=self._on_request_error,
+            )
+
+    def _on_response(self, response: str):
+        """Called on a pool worker thread once the model answered."""
+        self._pending_request = None
         self.update_output("Printing output")
         self.update_response(response)
+        self.set_buttons_enabled(True)
+
+    def _on_streamed_response(self, response: str):
+        """Called on a pool worker thread once the stream is over, commands are already shown."""
+        self._pending_request = None
+        self.update_output("Printing output")
+        self.end_streamed_response(response)
+        self.set_buttons_enabled(True)
+
+    def _on_request_error(self, error: BaseException):
+        self._pending_request = None
+        self._stream_cancelled.set() # A timed out stream must stop adding cells
+        self.update_output(f"[Request Error]:\n{error}", is_error=True)
+        self.set_buttons_enabled(True)
+
+    def cancel_request_click(self, e: ft.ControlEvent):
+        """Cancels the request waiting on the model, if any."""
+        if self._pending_request and self._pending_request.cancel():
+            self._pending_request = None
+            self._stream_cancelled.set()
+            self.update_output("[INFO] Request cancelled.", is_error=False)
+            self.set_buttons_enabled(True)
 
 
     def update_output(self, text: str, is_error: bool = False):
@@ -116,9 +234,11 @@ class ChatBoxCell:
         """Enables or disables the Run, Edit, and Delete buttons."""
         is_disabled = not enabled
         self.run_button.disabled = is_disabled
+        self.cancel_button.visible = is_disabled # Cancel is available while a request runs
 
         # Update the buttons
         self.run_button.update()
+        self.cancel_button.update()
 
 
     def get_view(self) -> ft.Control:
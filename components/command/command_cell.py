@@ -1,15 +1,71 @@
 # components/command_cell.py
-import os
+import re
+import time
 import flet as ft
-import threading
+from functools import lru_cache
 from typing import Callable
-from services.command_runner import run_command_thread # Import the runner function
-from services.llm_model_sdks.gemini.gemini_client import GeminiClient
+from concurrent.futures import Future
+from services.command_runner import CommandResult, RunControl, format_output, run_command_thread # Import the runner function
+from services.command_executor import INTERACTIVE, get_command_executor
+from services.shell_session import ShellSessionPool
+from services.terminal_buffer import Style, TerminalBuffer
+from services.llm_model_sdks.client_registry import LLMClientRegistry, get_client_registry
+from services.llm_request_pool import LLMRequest
+from services.ai_prefetcher import Prefetch, get_prefetcher
+from services.request_coalescer import get_error_coalescer
+from services.conversation_context import truncate_output
+from models.session import CellRecord, SessionStore
+from models.response_parser import assess_risk
+from services import command_scheduler, tracing
+from utils.constants import VIRTUAL_CELL_HEIGHT, VIRTUAL_LINE_HEIGHT, HISTORY_DISABLED, HISTORY_SUGGESTIONS
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+STATUS_COLORS = {
+    command_scheduler.QUEUED: ft.colors.GREY_400,
+    command_scheduler.RUNNING: ft.colors.BLUE_ACCENT_200,
+    command_scheduler.DONE: ft.colors.GREEN_ACCENT_400,
+    command_scheduler.FAILED: ft.colors.RED_ACCENT_200,
+    command_scheduler.SKIPPED: ft.colors.AMBER_300,
+}
+
+@lru_cache(maxsize=256)
+def _span_style(style: Style) -> ft.TextStyle:
+    """Flet style of a terminal text style (few distinct ones, so cached)."""
+    color, bgcolor = style.fg, style.bg
+    if style.inverse:
+        color, bgcolor = bgcolor or ft.colors.BLACK, color or ft.colors.WHITE
+    return ft.TextStyle(
+        color=color,
+        bgcolor=bgcolor,
+        weight=ft.FontWeight.BOLD if style.bold else None,
+        italic=style.italic,
+        decoration=ft.TextDecoration.UNDERLINE if style.underline else None,
+    )
+
+# Background of the searched text, and of the cells and terminal lines containing it
+SEARCH_HIT_COLOR = ft.colors.with_opacity(0.5, ft.colors.AMBER)
+SEARCH_MATCH_COLOR = ft.colors.with_opacity(0.08, ft.colors.AMBER)
+
+def _highlight_spans(text: str, query: str) -> list[ft.TextSpan]:
+    """`text` split into spans, the occurrences of `query` (any case) highlighted."""
+    spans = []
+    position = 0
+    for match in re.finditer(re.escape(query), text, re.IGNORECASE):
+        if match.start() > position:
+            spans.append(ft.TextSpan(text[position:match.start()]))
+        spans.append(ft.TextSpan(match.group(), ft.TextStyle(bgcolor=SEARCH_HIT_COLOR)))
+        position = match.end()
+    if position < len(text):
+        spans.append(ft.TextSpan(text[position:]))
+    return spans
 
 class CommandCell:
     """Represents a single interactive command cell in the notebook."""
 
-    def __init__(self, context: str, command_text: str, page: ft.Page, delete_callback: Callable[['CommandCell'], None], update_ai_error_callback: Callable[['CommandCell'], None]):
+    def __init__(self, context: str, command_text: str, page: ft.Page, delete_callback: Callable[['CommandCell'], None], update_ai_error_callback: Callable[['CommandCell'], None], llm_clients: LLMClientRegistry | None = None, session: SessionStore | None = None, shells: ShellSessionPool | None = None,
+                 record: CellRecord | None = None, lazy: bool = False):
         """
         Initializes a CommandCell.
 
@@ -18,18 +74,66 @@ class CommandCell:
             delete_callback (Callable): A function to call when this cell's
                                        delete button is clicked. It receives the
                                        CommandCell instance itself as an argument.
+            llm_clients (LLMClientRegistry): Shared LLM client registry, the
+                                             client is only built on the first
+                                             AI request.
+            session (SessionStore): Session the cell's record is appended to,
+                                    it also tracks the working directory.
+            shells (ShellSessionPool): Shell sessions of the notebook the
+                                       command runs in, so cd/export persist.
+                                       Without it each run gets a fresh shell.
+            record (CellRecord): Existing record to show (restored session)
+                                 instead of a new one.
+            lazy (bool): Starts as a placeholder, the controls are only built
+                         once the cell scrolls into view.
         """
-        self.path_context = context
+        self.session = session or SessionStore(context)
+        # All the cell state lives in the record, the controls only render it
+        self.record: CellRecord = record or self.session.new_record(command_text, context)
         self.page = page
         self.delete_callback = delete_callback
+        self.shells = shells
         self.update_ai_error_callback = update_ai_error_callback
-        self._run_thread: threading.Thread | None = None
-        self.gemini_client = GeminiClient()
+        self._run_future: Future | None = None # Command waiting for or running on the executor
+        self._active = False # From the click on Run until the command is over
+        self._run_control: RunControl | None = None # Stops the running command
+        self.llm_clients = llm_clients or get_client_registry()
         self.ai_command_error_suggestion = ""
+        self._pending_ai_request: LLMRequest | None = None
+        self._prefetch: Prefetch | None = None # Fix requested speculatively when the command failed
+        self._awaiting_prefetch = False # "Ask AI" clicked before that request answered
+        self._ai_error: str | None = None # Why the last AI request failed, shown apart from the output
+        # (command, output) of the failure the last AI request was about
+        self.ai_request_context: tuple[str, str] | None = None
+        # Set on cells created from an AI suggestion: the failure this command should fix
+        self.fix_for: tuple[str, str] | None = None
+        # After answering from past fixes, the next Ask AI goes to the model
+        self._skip_error_index = False
+        # Styled output of the last run, rendered line by line
+        self._terminal: TerminalBuffer | None = None
+        self._terminal_first = 0 # Absolute number of the first rendered line
+        self._search_query: str | None = None # Text of the search bar, highlighted in the output
+
+        self.materialized = False
+        # The outer container always exists, its content is either the full
+        # cell or a lightweight placeholder while the cell is off-screen
+        self.view = ft.Container(
+            key=f"cell-{self.record.cell_id}", # Lets the search bar scroll to it
+            padding=10,
+            border=ft.border.only(bottom=ft.BorderSide(1, ft.colors.with_opacity(0.2, ft.colors.OUTLINE))),
+        )
+        if lazy:
+            self._show_placeholder()
+        else:
+            self.materialize()
 
+    def materialize(self):
+        """Builds the cell's Flet controls from its record."""
+        if self.materialized:
+            return
         # --- Flet Controls for the Cell ---
         self.path_context_fix = ft.TextField(
-            value=self.path_context,
+            value=self.record.cwd,
             multiline=False,
             expand=True,
             read_only=True,
@@ -41,16 +145,24 @@ class CommandCell:
         )
 
         self.command_input = ft.TextField(
-            value=command_text,
-            multiline=False,
+            value=self.record.command,
+            # Heredocs and continued lines stay one command, Enter still runs it
+            multiline=True,
+            shift_enter=True,
             expand=True,
             border_color=ft.colors.with_opacity(0.5, ft.colors.OUTLINE),
             focused_border_color=ft.colors.PRIMARY,
             cursor_color=ft.colors.PRIMARY,
             # text_style=ft.TextStyle(font_family="monospace"), # Requires font setup
+            on_change=self._on_command_change,
             on_submit=self.run_command_click # Allow running with Enter key
         )
 
+        self._show_risk()
+
+        # Past commands completing the one being typed, filled by _show_history
+        self.history_row = ft.Row(wrap=True, spacing=4, visible=False)
+
         self.run_button = ft.IconButton(
             icon=ft.icons.PLAY_ARROW_ROUNDED,
             tooltip="Run Command",
@@ -65,6 +177,22 @@ class CommandCell:
             icon_color=ft.colors.BLUE_ACCENT_200,
         )
 
+        self.status_text = ft.Text(
+            self.record.status,
+            size=12,
+            italic=True,
+            color=STATUS_COLORS.get(self.record.status),
+            visible=bool(self.record.status) # Only shown while queued/running, and after Run all
+        )
+
+        self.stop_button = ft.IconButton(
+            icon=ft.icons.STOP_ROUNDED,
+            tooltip="Stop Command",
+            on_click=self.stop_command_click,
+            icon_color=ft.colors.RED_ACCENT_200,
+            visible=False # Only shown while the command runs
+        )
+
         self.delete_button = ft.IconButton(
             icon=ft.icons.DELETE_ROUNDED,
             tooltip="Delete Cell",
@@ -87,11 +215,24 @@ class CommandCell:
             selectable=True,
             # style=ft.TextStyle(font_family="monospace"), # Requires font setup
         )
+        self._output_shown = self.output_text.value
+
+        # Not part of the output: it would end up in the next prompt, the index and the session file
+        self.ai_error_text = ft.Text(
+            self._ai_error or "",
+            size=12,
+            italic=True,
+            color=ft.colors.RED_ACCENT_200,
+            visible=bool(self._ai_error),
+        )
+
+        # One Text per terminal line, so an update only sends the lines that changed
+        self.terminal_view = ft.Column(spacing=0, visible=False)
 
         self.output_container = ft.Container(
             content=ft.Row(
                 [
-                    self.output_text,
+                    ft.Column([self.terminal_view, self.output_text, self.ai_error_text], spacing=0, expand=True),
                     self.ask_ai_button,
                 ],
                 alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
@@ -105,26 +246,126 @@ class CommandCell:
         )
 
         # --- Main Layout for this Cell ---
-        self.view = ft.Container(
-            content=ft.Column(
-                [
-                    ft.Row(
-                        [
-                            self.path_context_fix,
-                            self.command_input,
-                            self.run_button,
-                            self.edit_button,
-                            self.delete_button,
-                        ],
-                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-                        vertical_alignment=ft.CrossAxisAlignment.CENTER
-                    ),
-                    self.output_container,
-                ]
-            ),
-            padding=10,
-            border=ft.border.only(bottom=ft.BorderSide(1, ft.colors.with_opacity(0.2, ft.colors.OUTLINE))),
+        self.view.height = None
+        self.view.content = ft.Column(
+            [
+                ft.Row(
+                    [
+                        self.path_context_fix,
+                        self.command_input,
+                        self.status_text,
+                        self.run_button,
+                        self.stop_button,
+                        self.edit_button,
+                        self.delete_button,
+                    ],
+                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    vertical_alignment=ft.CrossAxisAlignment.CENTER
+                ),
+                self.history_row,
+                self.output_container,
+            ]
+        )
+
+        if self.record.output is not None:
+            # Restore the output shown before the cell went off-screen
+            self._set_output_text(self.record.output)
+            self.output_text.color = ft.colors.RED_ACCENT_200 if self.record.is_error else None
+            self.output_container.visible = True
+            self.ask_ai_button.visible = self.record.is_error
+        self._show_search_match()
+        self.materialized = True
+
+    def dematerialize(self) -> bool:
+        """
+        Replaces the cell's controls with a placeholder, keeping only its
+        record. Busy cells (running or waiting on the AI) are left alone.
+        """
+        if not self.materialized or self.is_busy():
+            return False
+        self._show_placeholder()
+        return True
+
+    def _show_placeholder(self):
+        self.view.height = self.estimate_height()
+        self.view.content = ft.Text(
+            f"{self.record.cwd} $ {self.record.command}",
+            opacity=0.5,
+            no_wrap=True,
         )
+        self.path_context_fix = self.command_input = None
+        self.run_button = self.stop_button = self.edit_button = self.delete_button = self.ask_ai_button = None
+        self.status_text = self.history_row = None
+        self.output_text = self.output_container = self.ai_error_text = None
+        self.terminal_view = None
+        # The record keeps the plain output, styles are not worth the memory off-screen
+        self._terminal = None
+        self.materialized = False
+
+    def is_busy(self) -> bool:
+        return (self._active or self._awaiting_prefetch
+                or (self._pending_ai_request is not None and not self._pending_ai_request.done()))
+
+    def _on_command_change(self, e: ft.ControlEvent):
+        self.record.command = self.command_input.value
+        if self._show_risk():
+            self.command_input.update()
+        self._show_history(self.record.command)
+
+    def _show_history(self, text: str):
+        """Lists past commands starting with (or containing) the text typed, best first."""
+        if HISTORY_SUGGESTIONS <= 0:
+            return
+        from services.command_history import get_command_history
+        # Single-line input only: multi-line commands are being edited, not recalled
+        matches = get_command_history().suggest(text, HISTORY_SUGGESTIONS) if text and "\n" not in text else []
+        if not matches and not self.history_row.visible:
+            return
+        self.history_row.controls = [
+            ft.TextButton(
+                text=match if len(match) <= 60 else match[:57] + "...",
+                tooltip=match,
+                data=match,
+                on_click=self._use_history,
+            )
+            for match in matches
+        ]
+        self.history_row.visible = bool(matches)
+        self.history_row.update()
+
+    def _use_history(self, e: ft.ControlEvent):
+        """Puts the clicked past command in the input."""
+        self.command_input.value = self.record.command = e.control.data
+        self._show_risk()
+        self.command_input.update()
+        self._hide_history()
+        self.command_input.focus()
+
+    def _hide_history(self):
+        if self.history_row.visible:
+            self.history_row.visible = False
+            self.history_row.update()
+
+    def _show_risk(self) -> bool:
+        """Outlines commands worth a second look (rm -r, sudo, curl | sh...), returns True if that changed."""
+        risk = assess_risk(self.record.command)
+        tooltip = f"Careful: {risk}" if risk else None
+        if self.command_input.tooltip == tooltip:
+            return False
+        self.command_input.tooltip = tooltip
+        self.command_input.border_color = ft.colors.AMBER_400 if risk else ft.colors.with_opacity(0.5, ft.colors.OUTLINE)
+        return True
+
+    def get_command(self) -> str:
+        """Current command text, whether or not the cell is materialized."""
+        return self.record.command
+
+    def estimate_height(self) -> int:
+        """Approximate height in pixels, used to lay out off-screen cells."""
+        lines = self.record.output_lines
+        if not lines:
+            return VIRTUAL_CELL_HEIGHT
+        return VIRTUAL_CELL_HEIGHT + 20 + VIRTUAL_LINE_HEIGHT * lines
 
     def _handle_delete(self, e: ft.ControlEvent):
         """Internal method to call the provided delete callback."""
@@ -133,94 +374,300 @@ class CommandCell:
     def update_ai_error_response(self):
         self.update_ai_error_callback(self)
         
-    def send_error_request(self, command, error):
-        return self.gemini_client.send_error_request(command, error)
-    
     def ask_ai_with_error(self, e: ft.ControlEvent):
-        command = self.command_input.value.strip()
-        error = self.output_text.value
-        self.ai_command_error_suggestion = self.send_error_request(command, error)
+        """Sends the failed command to the model without blocking the UI."""
+        if self._awaiting_prefetch or (self._pending_ai_request and not self._pending_ai_request.done()):
+            return # Already waiting on a suggestion for this cell
+        command = self.record.command.strip()
+        error = self._error_for_ai()
+        self.ai_request_context = (command, error)
+        self._set_ai_error(None)
+
+        # Reuse fixes that worked for near-identical errors before asking the model
+        # (imported on first use, like the LLM SDK, it isn't needed to start up)
+        from services.error_index import get_error_index, format_suggestions
+        if not self._skip_error_index:
+            suggestions = get_error_index().lookup(command, error)
+            if suggestions:
+                self._skip_error_index = True
+                self.ai_command_error_suggestion = format_suggestions(suggestions)
+                self.update_ai_error_response()
+                return
+        self._skip_error_index = False
+
+        # The fix may have been asked for when the command failed
+        prefetch = self._prefetch
+        if prefetch is not None and prefetch.key == (command, error):
+            if prefetch.succeeded():
+                self._on_ai_suggestion(prefetch.result())
+                return
+            if not prefetch.done():
+                self._awaiting_prefetch = True
+                self.set_ask_ai_waiting(True)
+                prefetch.add_done_callback(self._on_prefetch_done)
+                return
+
+        self.set_ask_ai_waiting(True)
+        self._ask_model(command, error)
+
+    def _error_for_ai(self) -> str:
+        """The output sent with "Ask AI", long ones cut down to their beginning and end."""
+        return truncate_output(self.record.output or "")
+
+    def _ask_model(self, command: str, error: str):
+        # Cells failing together share one model request
+        self._pending_ai_request = get_error_coalescer(self.llm_clients).submit(
+            command, error,
+            on_result=self._on_ai_suggestion,
+            on_error=self._on_ai_error,
+        )
+
+    def prefetch_ai_fix(self):
+        """
+        Called by run_command_thread when the command failed: starts the
+        "Ask AI" request in the background if speculative fixes are enabled.
+        """
+        prefetcher = get_prefetcher()
+        if not prefetcher.enabled:
+            return
+        command = self.record.command.strip()
+        error = self._error_for_ai()
+        try:
+            from services.error_index import get_error_index
+            if get_error_index().lookup(command, error):
+                return # "Ask AI" will offer the fixes that worked before, no need for the model
+            self._drop_prefetch()
+            self._prefetch = prefetcher.start(command, error)
+        except Exception as e:
+            # Only a head start, the output is already shown
+            log.warning("AI prefetch skipped: %s", e)
+
+    def _on_prefetch_done(self, prefetch: Prefetch):
+        """Called once the speculative request is over, when Ask AI was waiting on it."""
+        if prefetch is not self._prefetch or not self._awaiting_prefetch:
+            return # Released by a re-run or delete
+        if prefetch.succeeded():
+            self._on_ai_suggestion(prefetch.result())
+        else:
+            # Failed or rate limited away: ask for real
+            self._ask_model(*prefetch.key)
+        # Only now: while waiting the cell is busy, so it keeps its controls
+        self._awaiting_prefetch = False
+
+    def _drop_prefetch(self):
+        """The output it was asked for is gone (re-run or delete)."""
+        prefetch, self._prefetch = self._prefetch, None
+        self._awaiting_prefetch = False
+        if prefetch is not None:
+            get_prefetcher().release(prefetch)
+
+    def _on_ai_suggestion(self, suggestion: str):
+        """Called on a pool worker thread once the model answered."""
+        self.ai_command_error_suggestion = suggestion
+        # The request is cleared after the controls are updated: until then the cell is busy and stays materialized
+        if self.materialized:
+            self.set_ask_ai_waiting(False)
+        self._pending_ai_request = None
         self.update_ai_error_response()
+
+    def _on_ai_error(self, error: BaseException):
+        self._set_ai_error(f"[AI Request Error]: {error}")
+        if self.materialized:
+            self.set_ask_ai_waiting(False)
+        self._pending_ai_request = None
+
+    def _set_ai_error(self, message: str | None):
+        """Shows (None hides) why the last AI request failed, under the output."""
+        self._ai_error = message
+        if self.materialized:
+            self.ai_error_text.value = message or ""
+            self.ai_error_text.visible = bool(message)
+            self.ai_error_text.update()
+
+    def stop_command_click(self, e: ft.ControlEvent):
+        self.stop_command()
+
+    def stop_command(self):
+        """Removes the command from the queue, or stops it (SIGINT, then SIGTERM, then SIGKILL)."""
+        if self._run_future is not None and self._run_future.cancel():
+            self.set_status("")
+            self.update_output("[Cancelled before it started]", is_error=False)
+            self.set_buttons_enabled(True)
+        elif self._run_control is not None:
+            self._run_control.stop()
+
+    def close(self):
+        """Called when the cell is removed: nothing it started may outlive it."""
+        self.cancel_ai_request()
+        self._drop_prefetch()
+        self.stop_command()
+
+    def cancel_ai_request(self):
+        """Drops the suggestion request still in flight, if any."""
+        if self._pending_ai_request:
+            self._pending_ai_request.cancel()
+            self._pending_ai_request = None
+
+    def set_ask_ai_waiting(self, waiting: bool):
+        """Shows that a suggestion is on its way on the Ask AI button."""
+        self.ask_ai_button.disabled = waiting
+        self.ask_ai_button.text = "Asking AI..." if waiting else "Ask AI"
+        self.ask_ai_button.update()
     
     def get_ai_command_error_suggestion(self):
         return self.ai_command_error_suggestion
-    
-    def change_directory(self, path):
-        """Changes the current working directory."""
-        global PROMPT # We need to modify the global prompt
-        try:
-            os.chdir(path)
-            # Update the prompt to reflect the new directory
-            PROMPT = f"{os.getcwd()}:~$ "
-            self.path_context_fix.value = PROMPT
-            self.path_context_fix.update()
-            return None # No error message needed for success
-        except FileNotFoundError:
-            return f"cd: no such file or directory: {path}"
-        except NotADirectoryError:
-            return f"cd: not a directory: {path}"
-        except PermissionError:
-            return f"cd: permission denied: {path}"
-        except Exception as e:
-            return f"cd: failed to change directory: {e}"
+
+    def on_command_finished(self, result: CommandResult):
+        """Called by run_command_thread once the command exited."""
+        self.record.exit_code = result.returncode
+        self.record.duration = result.duration
+        self.record.finished_at = time.time()
+        self.record.cwd_after = result.cwd
+        if result.cwd:
+            # cd ran in the notebook's shell, new cells start where it left off
+            self.session.cwd = result.cwd
+        if self.fix_for and result.returncode == 0:
+            # This AI suggestion worked, remember it for similar errors
+            from services.error_index import get_error_index
+            get_error_index().record_success(*self.fix_for, result.command)
+        if not HISTORY_DISABLED:
+            try:
+                from services.command_history import get_command_history
+                get_command_history().record(result.command, self.record.cwd, result.returncode, result.duration)
+            except Exception as e:
+                # The history is a convenience, a broken database must not break the run
+                log.warning("Error recording the command history: %s", e)
     
     def run_command_click(self, e: ft.ControlEvent):
         """Handles the click event for the run button or Enter key in TextField."""
-        command = self.command_input.value.strip()
+        command = self._prepare_run(queued=True)
+        if command is None:
+            return
+
+        # Commands share a bounded executor: when it is busy the command waits
+        # in its queue, ahead of the steps of a Run all
+        self._run_future = get_command_executor().submit(self._run_queued, command, priority=INTERACTIVE)
+
+    def _run_queued(self, command: str):
+        """Runs on an executor worker once the command's turn comes."""
+        self.set_status(command_scheduler.RUNNING)
+        self.update_output(f"[Running]: {command}\n...", is_error=False)
+        run_command_thread(command, self, self.shells, self._run_control)
+        self.set_status("") # The status only stays after a Run all
+
+    def run_and_wait(self) -> bool:
+        """
+        Runs the command on the calling thread, used by the Run all scheduler
+        (which already runs it on an executor worker).
+        Returns True if it exited with code 0.
+        """
+        command = self._prepare_run()
+        if command is None:
+            return False
+        result = run_command_thread(command, self, self.shells, self._run_control)
+        return result is not None and result.returncode == 0
+
+    def _prepare_run(self, queued: bool = False) -> str | None:
+        """
+        Checks the command and switches the cell to its running (or queued)
+        state, returns the command to run.
+        """
+        if self._active:
+            # Optionally provide feedback that a command is running
+            # self.update_output("[INFO] A command is already running...", is_error=False)
+            log.debug("Command already running in this cell.")
+            return None
+        # Busy from here on, so scrolling can't dematerialize the cell under us
+        self._active = True
+        if not self.materialized:
+            # Off-screen cells (Run all) get their controls back to show the output
+            self.materialize()
+            self.view.update()
+
+        self.record.command = self.command_input.value
+        command = self.record.command.strip()
         if not command:
+            self._active = False
             self.update_output("[INFO] No command entered.", is_error=False)
             self.output_container.visible = True
             self.output_container.update()
-            return
+            return None
 
-        if command.startswith("cd "):
-            parts = command.split(maxsplit=1)
-            if len(parts) > 1:
-                path_to_change = parts[1]
-                # Handle cd ~ manually
-                if path_to_change == '~':
-                    path_to_change = os.path.expanduser("~")
-                error_msg = self.change_directory(path_to_change)
-                if error_msg:
-                    print(f"{error_msg}")
-            else:
-                # 'cd' without arguments usually goes to home directory
-                error_msg = self.change_directory(os.path.expanduser("~"))
-                if error_msg:
-                    print(f"{error_msg}")
-
-        if self._run_thread and self._run_thread.is_alive():
-            # Optionally provide feedback that a command is running
-            # self.update_output("[INFO] A command is already running...", is_error=False)
-            print("Command already running in this cell.") # Console feedback
-            return
+        self._skip_error_index = False # New output, past fixes are worth a look again
+        self._set_ai_error(None)
+        self._drop_prefetch()
+        self._hide_history()
+        self._run_control = RunControl()
 
         # Show output area and indicate running status
         self.output_container.visible = True
-        self.update_output(f"[Running]: {command}\n...", is_error=False)
+        if queued:
+            self.set_status(command_scheduler.QUEUED)
+            self.update_output(f"[Queued]: {command}", is_error=False)
+        else:
+            self.update_output(f"[Running]: {command}\n...", is_error=False)
         self.set_buttons_enabled(False) # Disable buttons
+        return command
 
-        # Run the command execution in a separate thread
-        self._run_thread = threading.Thread(
-            target=run_command_thread, # Use the imported function
-            args=(command, self),      # Pass command and this cell instance
-            daemon=True
-        )
-        self._run_thread.start()
+    def set_status(self, status: str):
+        """Shows the Run all status of the cell (queued, running, done, failed, skipped)."""
+        self.record.status = status
+        if self.materialized:
+            self.status_text.value = status
+            self.status_text.color = STATUS_COLORS.get(status)
+            self.status_text.visible = bool(status)
+            self.status_text.update()
 
     def edit_command_click(self, e: ft.ControlEvent):
         """Focuses the input field."""
         self.command_input.focus()
         # No need to call page.update() here, focus should work directly
 
-    def update_output(self, text: str, is_error: bool = False):
-        """Updates the output text control's value and appearance."""
-        self.output_text.value = text
+    def update_output(self, text: str, is_error: bool = False, running: bool = False, terminal: TerminalBuffer | None = None,
+                      stderr: str = ""):
+        """
+        Updates the output text control's value and appearance.
+
+        Args:
+            text (str): The output to show.
+            is_error (bool): Highlights the output as an error.
+            running (bool): True for the partial output streamed while the
+                            command is still running; the Ask AI button and
+                            input focus are only handled on the final update.
+            terminal (TerminalBuffer): Styled version of the stdout; its
+                                       changed lines are rendered, and only
+                                       `text` (stderr) while running or
+                                       `stderr` and the exit code once done
+                                       are shown below them. The whole
+                                       `text` still goes to the record.
+            stderr (str): Error output of the finished command, with a `terminal`.
+        """
+        start = time.perf_counter()
+        if not running:
+            # Only the final output is kept in the record (compressed if large)
+            self.record.output = text
+            self.record.is_error = is_error
+
+        self._terminal = terminal
+        if terminal is not None:
+            self._render_terminal(terminal)
+            # Below the terminal lines only stderr and the exit code are left to show
+            if not running:
+                text = format_output("", stderr, self.record.exit_code)
+                if not text and not terminal:
+                    text = "[INFO] Command executed with no output."
+            if not running and self._run_control is not None and self._run_control.stopped:
+                text = f"{text}\n{self._run_control.describe()}".strip()
+        else:
+            self._clear_terminal()
+
+        self._set_output_text(text)
+        self.output_text.visible = bool(text)
         self.output_text.color = ft.colors.RED_ACCENT_200 if is_error else None # Use theme default
 
         # Ensure the container is visible when output is updated
         self.output_container.visible = True
-        if is_error:
+        if is_error and not running:
             self.ask_ai_button.visible = True
         else:
             self.ask_ai_button.visible = False
@@ -228,8 +675,71 @@ class CommandCell:
         # Update the specific controls that changed
         self.output_text.update()
         self.output_container.update()
-        self.command_input.focus()
+        if not running:
+            self.command_input.focus()
+        tracing.get_tracer().record(tracing.UI_UPDATE, time.perf_counter() - start, running=running)
+
+
+    def _render_terminal(self, terminal: TerminalBuffer):
+        """Re-renders the terminal lines changed since the last call."""
+        lines = self.terminal_view.controls
+        # Lines that scrolled out of the terminal's scrollback
+        dropped = terminal.first_line - self._terminal_first
+        if dropped > 0:
+            del lines[:dropped]
+        self._terminal_first = terminal.first_line
+
+        for number in terminal.take_dirty():
+            index = number - terminal.first_line
+            if index < 0:
+                continue
+            while len(lines) <= index:
+                lines.append(ft.Text(selectable=True))
+            lines[index].spans = [ft.TextSpan(text, _span_style(style)) for text, style in terminal.line_spans(number)]
+        # The terminal may have been cleared, and the empty line under the cursor isn't shown
+        del lines[terminal.line_count():]
+        if lines and not lines[-1].spans:
+            lines.pop()
+        self.terminal_view.visible = bool(lines)
+        if self._search_query:
+            self._show_search_match()
+
+    def _clear_terminal(self):
+        self.terminal_view.controls.clear()
+        self.terminal_view.visible = False
+        self._terminal_first = 0
+
+
+    def set_search(self, query: str | None):
+        """Highlights the occurrences of the searched text in the output (None clears them)."""
+        if query == self._search_query:
+            return
+        self._search_query = query or None
+        if self.materialized:
+            self._set_output_text(self._output_shown)
+            self._show_search_match()
+            self.view.update()
+        else:
+            self.view.bgcolor = SEARCH_MATCH_COLOR if query else None
+
+    def _set_output_text(self, text: str):
+        """Shows the plain output text, the searched text highlighted."""
+        self._output_shown = text
+        query = self._search_query
+        if query and query.lower() in text.lower():
+            self.output_text.value = None
+            self.output_text.spans = _highlight_spans(text, query)
+        else:
+            self.output_text.value = text
+            self.output_text.spans = None
 
+    def _show_search_match(self):
+        """Tints the cell and the terminal lines containing the searched text."""
+        query = self._search_query.lower() if self._search_query else None
+        self.view.bgcolor = SEARCH_MATCH_COLOR if query else None
+        for line in self.terminal_view.controls:
+            hit = query is not None and query in "".join(span.text for span in line.spans or []).lower()
+            line.bgcolor = SEARCH_HIT_COLOR if hit else None
 
     def set_buttons_enabled(self, enabled: bool):
         """Enables or disables the Run, Edit, and Delete buttons."""
@@ -237,14 +747,18 @@ class CommandCell:
         self.run_button.disabled = is_disabled
         self.edit_button.disabled = is_disabled
         self.delete_button.disabled = is_disabled
+        self.stop_button.visible = is_disabled # Stop replaces nothing, it shows up next to Run
 
         # Update the buttons
         self.run_button.update()
+        self.stop_button.update()
         self.edit_button.update()
         self.delete_button.update()
 
         if enabled:
-            self._run_thread = None # Clear thread reference when done/failed
+            self._active = False # Done, failed or cancelled
+            self._run_future = None
+            self._run_control = None
 
 
     def get_view(self) -> ft.Control:
@@ -1,6 +1,41 @@
 # main.py
+import atexit
+import os
 import flet as ft
 from views.app_view import AppView # Import the main view manager
+from services.llm_model_sdks.client_registry import get_client_registry
+from services.llm_request_pool import shutdown_request_pool
+from services.shell_session import close_all_sessions
+from services.command_executor import shutdown_command_executor
+from services.session_file import load_session
+from services import tracing
+from utils.constants import SESSION_PATH, SESSION_RESTORE, TRACE_FILE, TRACE_FORMAT
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+def shutdown_llm_services():
+    """Teardown hook: drops pending AI requests and the shared LLM client."""
+    shutdown_request_pool()
+    get_client_registry().close()
+
+
+def close_history():
+    """Teardown hook: closes the command history (imported here, it is deferred at startup)."""
+    from services.command_history import close_command_history
+    close_command_history()
+
+
+def export_trace():
+    """Teardown hook: writes the spans still in memory when AI_TERMINAL_TRACE_FILE is set."""
+    if not TRACE_FILE:
+        return
+    try:
+        count = tracing.get_tracer().export(TRACE_FILE, TRACE_FORMAT)
+        log.info("Exported %d spans to %s", count, TRACE_FILE)
+    except (OSError, ValueError) as e:
+        log.error("Error exporting the trace to %s: %s", TRACE_FILE, e)
 
 
 def main(page: ft.Page):
@@ -25,8 +60,15 @@ def main(page: ft.Page):
     page.window.bgcolor = ft.Colors.BLACK
     
 
-    # Create instance of the main view manager
-    notebook_manager = AppView(page)
+    # Create instance of the main view manager, cells share one lazily created LLM client
+    notebook_manager = AppView(page, get_client_registry())
+
+    def on_disconnect(e):
+        notebook_manager.save_session()
+        notebook_manager.close()
+        shutdown_command_executor()
+        shutdown_llm_services()
+    page.on_disconnect = on_disconnect
 
     # Build the initial UI elements from the view manager
     page_controls = notebook_manager.build()
@@ -34,15 +76,32 @@ def main(page: ft.Page):
     # Add the main controls returned by the view manager to the page
     page.add(*page_controls)
 
-    # Add the first initial cell using the view manager's method
-    notebook_manager.add_chat_box_cell_click(None)
-    notebook_manager.add_cell_click("ls asdf", None)
-    
-    page.update() # Ensure initial state is rendered
+    # The window closing may end the process before on_disconnect runs
+    atexit.register(notebook_manager.save_session)
+
+    # Add the first initial cell using the view manager's method,
+    # the batch renders the initial state with a single page update
+    with notebook_manager.batch_update():
+        notebook_manager.add_chat_box_cell_click(None)
+        saved = None
+        if SESSION_RESTORE and os.path.exists(SESSION_PATH):
+            try:
+                saved = load_session(SESSION_PATH)
+            except (OSError, ValueError) as e:
+                log.warning("Previous session not restored: %s", e)
+        if saved is not None and saved.records:
+            notebook_manager.restore_session(saved)
+        else:
+            notebook_manager.add_cell_click("ls asdf", None)
 
 
 # --- Application Runner ---
 if __name__ == "__main__":
+    atexit.register(shutdown_llm_services)
+    atexit.register(shutdown_command_executor) # Queued commands never start
+    atexit.register(close_all_sessions) # No command outlives the app
+    atexit.register(close_history)
+    atexit.register(export_trace)
     ft.app(target=main)
     # Or for web:
     # ft.app(target=main, view=ft.AppView.WEB_BROWSER, port=8550)
\ No newline at end of file
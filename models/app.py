@@ -1,35 +1,31 @@
 # models/app.py
 
 from assets import response
+from models.session import SessionStore
+from models.response_parser import ParsedCommand, parse_response
+from services import tracing
+
 
 class App:
     """Manages app logic."""
 
     def __init__(self):
         self.response = response.response_text
-    
+        # Cell records and cwd of the session, independent of the UI
+        self.session = SessionStore()
+
     def print_response(self):
         print(self.response)
 
+    def get_parsed_commands(self) -> list[ParsedCommand]:
+        with tracing.get_tracer().span(tracing.LLM_PARSE, chars=len(self.response)):
+            return parse_response(self.response)
+
     def get_commands(self):
-        command_list = []
-        command = False
-        for line in self.response.strip().split('\n'):
-            if '```bash' in line:
-                command = True
-                continue
-            elif '```' in line:
-                command = False
-                print("\n\n")
-                continue
-            
-            if command == True and not line.startswith('#') and not line.strip() == "":
-                print(line.lstrip())
-                command_list.append(line.lstrip())
-        return command_list
-        
+        return [parsed.command for parsed in self.get_parsed_commands()]
+
     def set_response(self, response):
         self.response = response
-        
+
     def delete_cell(self):
         a =" "
\ No newline at end of file
@@ -0,0 +1,344 @@
+# models/output_index.py
+import bisect
+import re
+import threading
+
+# Words are runs of letters and digits: paths, identifiers and messages split into their parts.
+# Longer words are cut in pieces of MAX_TOKEN_LENGTH, the same way in outputs and queries.
+MAX_TOKEN_LENGTH = 32
+_TOKEN = re.compile(r"[^\W_]{1,%d}" % MAX_TOKEN_LENGTH)
+# Escape sequences of colored output, not part of the text
+_ESCAPE = re.compile(r"\x1b(?:\[[0-9;?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+# Document ids per encoded posting block
+BLOCK_SIZE = 128
+# A partial word of the query (first or last) matching more words than this doesn't narrow the search
+MAX_PREFIX_TERMS = 256
+# Approximate bytes a term costs besides its postings (dict entry, string, object)
+TERM_OVERHEAD = 120
+
+
+def _encode(ids: list[int]) -> bytes:
+    """Varint of the first id then of the zigzag deltas: mostly one byte per id."""
+    out = bytearray()
+    previous = 0
+    for doc in ids:
+        delta = doc - previous
+        previous = doc
+        value = delta << 1 if delta >= 0 else (-delta << 1) - 1
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode(data: bytes) -> list[int]:
+    ids = []
+    previous = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (value >> 1) if not value & 1 else -((value + 1) >> 1)
+        ids.append(previous)
+        value = shift = 0
+    return ids
+
+
+class _Postings:
+    """Documents containing a term: full blocks stay encoded, only the last one is a list."""
+    __slots__ = ("blocks", "tail")
+
+    def __init__(self):
+        self.blocks: list[bytes] = []
+        self.tail: list[int] = []
+
+    def add(self, doc: int) -> int:
+        """Adds a document, returns the bytes this added."""
+        self.tail.append(doc)
+        if len(self.tail) < BLOCK_SIZE:
+            return 8
+        block = _encode(self.tail)
+        self.blocks.append(block)
+        self.tail = []
+        return len(block) - 8 * (BLOCK_SIZE - 1)
+
+    def docs(self) -> list[int]:
+        docs = []
+        for block in self.blocks:
+            docs += _decode(block)
+        return docs + self.tail
+
+    def size(self) -> int:
+        return sum(map(len, self.blocks)) + 8 * len(self.tail)
+
+
+class _OpenDocument:
+    """A document output is still being added to."""
+    __slots__ = ("doc", "seen", "carry")
+
+    def __init__(self, doc: int):
+        self.doc = doc
+        self.seen: set[str] = set() # Words already posted for it
+        self.carry: dict[str, str] = {} # Per stream, text that may continue in the next chunk
+
+
+class OutputIndex:
+    """
+    Incremental inverted index over the output of a session's commands.
+
+    Output is added chunk by chunk while commands run, so searching never
+    re-reads outputs. Each run of a cell is a document; a new run or a
+    deleted cell leaves its old document dead until the next compaction.
+    Posting lists are delta encoded in blocks, and when the index grows
+    past `max_bytes` the oldest documents are dropped from it: their cells
+    are then always returned as candidates, to be checked by scanning.
+
+    Results are candidates, a superset of the cells containing the query
+    as a substring: callers check each one against the actual text (which
+    also rules out output dropped from the scrollback since it was
+    indexed). The one miss is a query starting inside a word longer than
+    MAX_TOKEN_LENGTH and running across one of its cuts.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._postings: dict[str, _Postings] = {}
+        self._terms: list[str] = [] # Sorted, for the partial words of queries
+        self._new_terms: list[str] = [] # Not in _terms yet, merged by the next search
+        self._doc_keys: list[int | None] = [] # Key (cell id) of each document, None once dead
+        self._live: dict[int, int] = {} # Key -> its current document
+        self._open: dict[int, _OpenDocument] = {}
+        self._unindexed: set[int] = set() # Keys whose documents were dropped to save memory
+        self._dead = 0
+        self._bytes = 0
+
+    # --- Indexing ---
+
+    def start(self, key: int, text: str = ""):
+        """Starts a new document for `key` (a new run of the cell), replacing its previous one."""
+        with self._lock:
+            self._add_terms(self._start(key), text)
+
+    def add_saved(self, key: int, text: str):
+        """Indexes the whole output of a restored cell, unless it ran again since it was marked unindexed."""
+        with self._lock:
+            if key not in self._unindexed:
+                return
+            document = self._start(key)
+            self._add_terms(document, text)
+            del self._open[key]
+            self._maybe_shrink()
+
+    def _start(self, key: int) -> _OpenDocument:
+        self._kill(key)
+        self._unindexed.discard(key)
+        doc = len(self._doc_keys)
+        self._doc_keys.append(key)
+        self._live[key] = doc
+        document = self._open[key] = _OpenDocument(doc)
+        return document
+
+    def feed(self, key: int, text: str, stream: str = ""):
+        """
+        Adds a chunk of output to the open document of `key`.
+
+        Args:
+            key (int): Cell the output belongs to.
+            text (str): Decoded output, it may end in the middle of a word
+                        or of an escape sequence.
+            stream (str): Name of the stream it comes from (stdout, stderr...),
+                          chunks of different streams don't continue each other.
+        """
+        with self._lock:
+            document = self._open.get(key)
+            if document is None:
+                return
+            text = document.carry.pop(stream, "") + text
+            # Hold back what the next chunk may continue: a word or an escape sequence
+            cut = len(text)
+            while cut and text[cut - 1].isalnum() and len(text) - cut <= MAX_TOKEN_LENGTH * 4:
+                cut -= 1
+            escape = text.rfind("\x1b", max(len(text) - 256, 0))
+            if escape >= 0:
+                match = _ESCAPE.match(text, escape)
+                # Cut short, or its parameters taken for the start of the held back word
+                if match is None or match.end() > cut:
+                    cut = min(cut, escape)
+            if cut < len(text):
+                document.carry[stream] = text[cut:]
+                text = text[:cut]
+            self._add_terms(document, text)
+            self._maybe_shrink()
+
+    def finish(self, key: int):
+        """Closes the document of `key` once its command exited."""
+        with self._lock:
+            document = self._open.pop(key, None)
+            if document is not None:
+                for carry in document.carry.values():
+                    self._add_terms(document, carry)
+                self._maybe_shrink()
+
+    def remove(self, key: int):
+        """Forgets `key` (deleted cell)."""
+        with self._lock:
+            self._kill(key)
+            self._open.pop(key, None)
+            self._unindexed.discard(key)
+
+    def mark_unindexed(self, keys):
+        """Keys whose output isn't indexed (yet): always candidates, so callers scan them."""
+        with self._lock:
+            self._unindexed.update(keys)
+
+    def _kill(self, key: int):
+        doc = self._live.pop(key, None)
+        if doc is not None:
+            self._doc_keys[doc] = None
+            self._dead += 1
+
+    def _add_terms(self, document: _OpenDocument, text: str):
+        if "\x1b" in text:
+            text = _ESCAPE.sub(" ", text)
+        # Output repeats itself a lot, only words new to the document go further
+        words = set(_TOKEN.findall(text))
+        words -= document.seen
+        if not words:
+            return
+        document.seen |= words
+        for term in {word.lower() for word in words}:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+                self._new_terms.append(term)
+                self._bytes += TERM_OVERHEAD + len(term)
+            elif postings.tail and postings.tail[-1] == document.doc:
+                continue # Same term from another word (Error, ERROR, error...)
+            self._bytes += postings.add(document.doc)
+
+    # --- Memory ---
+
+    def _maybe_shrink(self):
+        if self._bytes <= self.max_bytes:
+            return
+        # Dropping the dead documents may be enough, otherwise the oldest half goes too,
+        # and as a last resort everything (a command printing endless unique words)
+        for drop in (0, 0.5, 1):
+            self._compact(drop)
+            if self._bytes <= self.max_bytes * 3 // 4:
+                break
+
+    def _compact(self, drop: float):
+        """Rebuilds the postings without the dead documents and the `drop` fraction of the oldest."""
+        keep = [doc for doc, key in enumerate(self._doc_keys) if key is not None]
+        if drop:
+            open_docs = {document.doc for document in self._open.values()}
+            # Running commands keep being indexed unless everything goes
+            droppable = keep if drop >= 1 else [doc for doc in keep if doc not in open_docs]
+            dropped = set(droppable[:int(len(droppable) * drop)])
+            for doc in dropped:
+                key = self._doc_keys[doc]
+                self._unindexed.add(key)
+                del self._live[key]
+                self._open.pop(key, None)
+            keep = [doc for doc in keep if doc not in dropped]
+        # Documents are renumbered so ids stay small (and their deltas short)
+        renumber = {doc: new for new, doc in enumerate(keep)}
+        self._doc_keys = [self._doc_keys[doc] for doc in keep]
+        self._live = {key: renumber[doc] for key, doc in self._live.items()}
+        for document in self._open.values():
+            document.doc = renumber[document.doc]
+
+        postings: dict[str, _Postings] = {}
+        size = 0
+        for term, old in self._postings.items():
+            docs = [renumber[doc] for doc in old.docs() if doc in renumber]
+            if not docs:
+                continue
+            new = postings[term] = _Postings()
+            full = len(docs) - len(docs) % BLOCK_SIZE
+            new.blocks = [_encode(docs[i:i + BLOCK_SIZE]) for i in range(0, full, BLOCK_SIZE)]
+            new.tail = docs[full:]
+            size += TERM_OVERHEAD + len(term) + new.size()
+        self._postings = postings
+        self._terms = sorted(postings)
+        self._new_terms = []
+        self._dead = 0
+        self._bytes = size
+
+    # --- Search ---
+
+    def search(self, query: str) -> set[int] | None:
+        """
+        Keys whose output may contain `query` (case-insensitive), or None
+        when the query has no word to look up and every key is a candidate.
+
+        The words inside the query must be indexed as they are. The last
+        one may be cut short and matches any word it begins, the first one
+        may start in the middle of a word and matches any word containing
+        it ("rror" finds "error").
+        """
+        terms = [word.lower() for word in _TOKEN.findall(query)]
+        if not terms:
+            return None
+        # A word is only known to start (end) where the query has something before (after) it
+        infix = terms.pop(0) if query[:1].isalnum() else None
+        if infix is not None and len(infix) == MAX_TOKEN_LENGTH:
+            return None # Inside a long word, the query's cuts don't line up with the indexed ones
+        partial = terms.pop() if terms and query[-1:].isalnum() else None
+        with self._lock:
+            docs: set[int] | None = None
+            # Rarest terms first, the intersection shrinks fastest
+            for term in sorted(set(terms), key=lambda t: self._postings[t].size() if t in self._postings else 0):
+                postings = self._postings.get(term)
+                found = set(postings.docs()) if postings is not None else set()
+                docs = found if docs is None else docs & found
+                if not docs:
+                    break
+            if partial is not None and (docs is None or docs):
+                start = bisect.bisect_left(self._sorted_terms(), partial)
+                end = bisect.bisect_left(self._terms, partial + "\U0010ffff", start)
+                docs = self._narrow(docs, self._terms[start:end])
+            if infix is not None and (docs is None or docs):
+                # The rarest words went first, this scan of the vocabulary is the last resort
+                docs = self._narrow(docs, [term for term in self._sorted_terms() if infix in term])
+            if docs is None:
+                # Only short partial words matching too many words: nothing narrows it down
+                return None
+            keys = {self._doc_keys[doc] for doc in docs}
+            keys.discard(None)
+            return keys | self._unindexed
+
+    def _sorted_terms(self) -> list[str]:
+        if self._new_terms:
+            # Both runs are sorted, so this sort is a linear merge
+            self._new_terms.sort()
+            self._terms += self._new_terms
+            self._terms.sort()
+            self._new_terms = []
+        return self._terms
+
+    def _narrow(self, docs: set[int] | None, terms: list[str]) -> set[int] | None:
+        """`docs` restricted to the documents of any of `terms`, unchanged if there are too many terms."""
+        if len(terms) > MAX_PREFIX_TERMS:
+            return docs
+        found = set()
+        for term in terms:
+            found.update(self._postings[term].docs())
+        return found if docs is None else docs & found
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the index."""
+        return self._bytes
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "terms": len(self._postings),
+                "documents": len(self._doc_keys) - self._dead,
+                "unindexed": len(self._unindexed),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,352 @@
+# models/response_parser.py
+import re
+from dataclasses import dataclass
+
+# Fence languages holding commands, "" is a fence without a language
+SHELL_LANGUAGES = {"bash", "sh", "shell", "zsh", "", "console", "shell-session", "terminal"}
+# In these the commands follow a "$ " prompt and the other lines are their output
+SESSION_LANGUAGES = {"console", "shell-session", "terminal"}
+
+_FENCE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w+-]*)")
+# "1. Install", "# 2) Build", "**Step 3:**", "### 4 -"
+_STEP = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?(?:step\s*)?(\d{1,3})(?:[.):]|\s+-|\*\*)(?:\s|\*|$)", re.IGNORECASE)
+# Prose that is only part of the response format, not an explanation
+_BOILERPLATE = re.compile(r"^\W*(command|commands|fix \d+|error \d+|start response|end response)?\W*$", re.IGNORECASE)
+_EMPHASIS = re.compile(r"\*\*|__")
+_PROMPT = re.compile(r"^\s*\$\s+")
+# Lines with nothing that can leave a statement open (quotes, brackets, heredocs, continuations...)
+_SIMPLE_LINE = re.compile(r"[^'\"`$(){}<\\|&;#]*")
+_HEREDOC = re.compile(r"(?<!<)<<(-?)\s*(['\"]?)([A-Za-z_][\w.-]*)\2")
+
+# Words opening and closing a compound command, only when in command position
+_OPENERS = {"if", "for", "while", "until", "case", "select", "{"}
+_CLOSERS = {"fi", "done", "esac", "}"}
+# Words after which a new command starts
+_COMMAND_STARTERS = {"then", "do", "else", "elif", "!", "time"} | _OPENERS
+
+# (pattern, reason) of commands worth a second look before running them
+RISK_RULES = [
+    (re.compile(r"\brm\s+(?:[^|;&]*\s)?-[a-zA-Z]*[rR]"), "deletes files recursively"),
+    (re.compile(r":\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:"), "fork bomb"),
+    (re.compile(r"\bmkfs(?:\.\w+)?\b|\bwipefs\b|\bfdisk\b|\bparted\b"), "changes disk partitions or filesystems"),
+    (re.compile(r"\bdd\b[^|;&]*\bof="), "writes raw data"),
+    (re.compile(r">\s*/dev/(?:sd|hd|nvme|xvd|disk|mmcblk)"), "overwrites a disk"),
+    (re.compile(r"(?:\bcurl|\bwget)\b[^|;&]*\|\s*(?:sudo\s+)?(?:ba|z|da)?sh\b"), "runs a downloaded script"),
+    (re.compile(r"\bchmod\b[^|;&]*\b[0-7]?777\b"), "makes files writable by everyone"),
+    (re.compile(r"\bgit\s+push\b[^|;&]*(?:--force\b|\s-f\b)"), "rewrites remote history"),
+    (re.compile(r"\bgit\s+(?:reset\s+--hard|clean\s+-[a-zA-Z]*f)"), "discards local changes"),
+    (re.compile(r"\b(?:shutdown|reboot|poweroff|halt)\b"), "stops the machine"),
+    (re.compile(r"(?:^|[^\w>])>\s*/(?:etc|boot|usr)/"), "overwrites a system file"),
+    (re.compile(r"\bkill(?:all)?\s+-(?:9|KILL)\b|\bpkill\b"), "kills processes"),
+    (re.compile(r"\bsudo\b"), "runs as root"),
+]
+
+
+# All the rules in one pattern: most commands are harmless and only need this one search
+_ANY_RISK = re.compile("|".join(f"(?:{pattern.pattern})" for pattern, _ in RISK_RULES))
+
+
+def assess_risk(command: str) -> str | None:
+    """Why a command is risky to run (the first rule matching it), None if it looks harmless."""
+    if not _ANY_RISK.search(command):
+        return None
+    for pattern, reason in RISK_RULES:
+        if pattern.search(command):
+            return reason
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedCommand:
+    """A command suggested by the model, with what the response said about it."""
+    command: str
+    language: str # Fence language, "" for a fence without one, "console" for a "$ " line in prose
+    comment: str | None = None # Closest comment in the block, or the prose line before it
+    step: int | None = None # Number of the step it belongs to ("1. Install...")
+    index: int = 0 # Position among the commands of the response
+    risk: str | None = None # See assess_risk()
+
+    @property
+    def risky(self) -> bool:
+        return self.risk is not None
+
+
+class _Statement:
+    """
+    Tracks whether the lines of a shell statement seen so far are complete.
+
+    Not a full shell parser: it follows quotes, brackets, heredocs, line
+    continuations and compound commands (if/for/while/case/{ }), which is
+    what decides where a multi-line command ends.
+    """
+
+    __slots__ = ("lines", "quote", "parens", "depth", "heredocs", "continued")
+
+    def __init__(self):
+        self.lines: list[str] = []
+        self.quote = "" # Open quote character
+        self.parens = 0
+        self.depth = 0 # Open compound commands
+        self.heredocs: list[tuple[str, bool]] = [] # (delimiter, strip tabs) still to be read
+        self.continued = False # Last line asks for the next one (\, |, &&, ||)
+
+    def add(self, line: str):
+        self.lines.append(line)
+        if self.heredocs:
+            delimiter, strip_tabs = self.heredocs[0]
+            if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+                self.heredocs.pop(0)
+            return
+        if not self.quote and _SIMPLE_LINE.fullmatch(line):
+            words = line.split()
+            if not words or (words[0] not in _OPENERS and words[0] not in _CLOSERS):
+                self.continued = False
+                return
+        self._scan(line)
+
+    def complete(self) -> bool:
+        return not (self.quote or self.parens > 0 or self.depth > 0 or self.heredocs or self.continued)
+
+    def text(self) -> str:
+        return "\n".join(self.lines).strip()
+
+    def _scan(self, line: str):
+        quote = self.quote
+        command_start = not quote
+        word = ""
+        tail = "" # Last significant characters, for the continuation check
+        position = 0
+        length = len(line)
+        while position < length:
+            char = line[position]
+            if quote:
+                if char == "\\" and quote != "'":
+                    position += 2
+                    continue
+                if char == quote:
+                    quote = ""
+                    tail = char
+                position += 1
+                continue
+
+            if char in " \t":
+                command_start = self._word(word, command_start)
+                word = ""
+            elif char == "\\":
+                if position == length - 1:
+                    self.quote = ""
+                    self.continued = True
+                    self._word(word, command_start)
+                    return
+                word += line[position:position + 2]
+                position += 2
+                continue
+            elif char in "'\"`":
+                quote = char
+                word += char
+            elif char == "#" and not word:
+                break # Comment until the end of the line
+            elif char == "<" and line.startswith("<<", position) and not line.startswith("<<<", position):
+                match = _HEREDOC.match(line, position)
+                if match:
+                    self.heredocs.append((match.group(3), match.group(1) == "-"))
+                    position = match.end()
+                    tail = "x"
+                    command_start = False
+                    word = ""
+                    continue
+                word += char
+            elif char == "(":
+                self.parens += 1
+                if word != "$":
+                    self._word(word, command_start)
+                word = ""
+                command_start = True
+            elif char == ")":
+                self.parens = max(self.parens - 1, 0)
+                self._word(word, command_start)
+                word = ""
+                command_start = True
+            elif char in ";|&":
+                self._word(word, command_start)
+                word = ""
+                command_start = True
+            else:
+                word += char
+            if char not in " \t":
+                tail = (tail + char)[-2:]
+            position += 1
+
+        self.quote = quote
+        if not quote:
+            self._word(word, command_start)
+        self.continued = not quote and (tail.endswith("|") or tail == "&&")
+
+    def _word(self, word: str, command_start: bool) -> bool:
+        """Counts compound command keywords, returns whether the next word is in command position."""
+        if not word:
+            return command_start
+        if command_start:
+            if word in _OPENERS:
+                self.depth += 1
+            elif word in _CLOSERS:
+                self.depth = max(self.depth - 1, 0)
+            return word in _COMMAND_STARTERS or word in _CLOSERS
+        return False
+
+
+class ResponseParser:
+    """
+    Single-pass parser turning a model response into ParsedCommands.
+
+    Feed it the response in chunks of any size: a command is returned as
+    soon as the line completing it arrives, so commands can be shown while
+    the rest of the response is still streaming. Multi-line commands
+    (heredocs, backslash continuations, if/for blocks, open quotes) stay
+    whole; ```bash, ```sh, ```shell, ```console and unlabeled fences are
+    read, as are "$ " command lines outside fences. Other languages
+    (```python, ```yaml...) are skipped.
+    """
+
+    def __init__(self):
+        self._partial = "" # Incomplete last line of the chunks seen so far
+        self._fence = "" # Opening fence of the block we are in
+        self._language: str | None = None # None outside blocks
+        self._statement: _Statement | None = None
+        self._comment: str | None = None
+        self._explanation: str | None = None
+        self._step: int | None = None
+        self._count = 0
+
+    def feed(self, chunk: str) -> list[ParsedCommand]:
+        """Consumes a chunk, returns the commands it completed."""
+        commands: list[ParsedCommand] = []
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line.rstrip("\r"), commands)
+        return commands
+
+    def close(self) -> list[ParsedCommand]:
+        """End of the response: flushes the last line and a statement left open."""
+        commands: list[ParsedCommand] = []
+        if self._partial:
+            self._line(self._partial.rstrip("\r"), commands)
+            self._partial = ""
+        self._flush(commands)
+        self._language = None
+        return commands
+
+    # --- Lines ---
+
+    def _line(self, line: str, commands: list[ParsedCommand]):
+        statement = self._statement
+        in_heredoc = statement is not None and bool(statement.heredocs)
+
+        fence = _FENCE.match(line)
+        if fence:
+            marker, language = fence.groups()
+            if self._language is None and not in_heredoc:
+                self._fence = marker
+                self._language = language.lower()
+                self._comment = None
+                return
+            # A heredoc missing its delimiter still ends with the block
+            closes = marker == self._fence if in_heredoc else marker[0] == self._fence[:1] and len(marker) >= len(self._fence)
+            if self._language is not None and closes and not language:
+                self._flush(commands)
+                self._language = None
+                return
+
+        language = self._language
+        if language is None:
+            self._prose(line, commands)
+        elif language in SHELL_LANGUAGES:
+            self._shell(line, language, commands)
+        # Lines of other languages are not commands
+
+    def _prose(self, line: str, commands: list[ParsedCommand]):
+        statement = self._statement
+        if statement is not None:
+            # A "$ " command outside a fence may go on over the next lines, but
+            # prose is not swallowed by an unbalanced quote
+            if line.startswith("> ") or statement.heredocs or statement.continued:
+                self._continue(line.removeprefix("> "), "console", commands)
+                return
+            self._flush(commands)
+        prompt = _PROMPT.match(line)
+        if prompt:
+            self._continue(line[prompt.end():], "console", commands)
+            return
+        stripped = line.strip()
+        if not stripped:
+            return
+        step = _STEP.match(stripped)
+        if step:
+            self._step = int(step.group(1))
+        if not _BOILERPLATE.fullmatch(stripped):
+            self._explanation = _EMPHASIS.sub("", stripped).strip("#:-> ").strip() or None
+
+    def _shell(self, line: str, language: str, commands: list[ParsedCommand]):
+        statement = self._statement
+        if statement is not None:
+            if language in SESSION_LANGUAGES:
+                line = line.removeprefix("> ")
+            self._continue(line, language, commands)
+            return
+
+        stripped = line.strip()
+        if not stripped:
+            return
+        if language in SESSION_LANGUAGES:
+            prompt = _PROMPT.match(line)
+            if not prompt:
+                return # Output of the previous command
+            line = line[prompt.end():]
+        elif stripped.startswith("#"):
+            comment = stripped.lstrip("#").strip()
+            step = _STEP.match(stripped)
+            if step:
+                self._step = int(step.group(1))
+            self._comment = comment or self._comment
+            return
+        else:
+            prompt = _PROMPT.match(line)
+            if prompt:
+                line = line[prompt.end():]
+        self._continue(line.strip(), language, commands)
+
+    def _continue(self, line: str, language: str, commands: list[ParsedCommand]):
+        statement = self._statement
+        if statement is None:
+            statement = self._statement = _Statement()
+        elif not line.strip() and not statement.heredocs and not statement.quote:
+            return # Blank lines inside a block add nothing
+        statement.add(line)
+        if statement.complete():
+            self._emit(statement, language, commands)
+
+    def _flush(self, commands: list[ParsedCommand]):
+        if self._statement is not None:
+            self._emit(self._statement, self._language or "console", commands)
+
+    def _emit(self, statement: _Statement, language: str, commands: list[ParsedCommand]):
+        self._statement = None
+        text = statement.text()
+        if not text:
+            return
+        commands.append(ParsedCommand(
+            command=text,
+            language=language,
+            comment=self._comment or self._explanation,
+            step=self._step,
+            index=self._count,
+            risk=assess_risk(text),
+        ))
+        self._count += 1
+
+
+def parse_response(text: str) -> list[ParsedCommand]:
+    """Commands of a complete response."""
+    parser = ResponseParser()
+    return parser.feed(text) + parser.close()
@@ -0,0 +1,151 @@
+# models/session.py
+import itertools
+import os
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from models.output_index import OutputIndex
+from utils.constants import SEARCH_INDEX_MAX_BYTES
+
+# Outputs longer than this are kept zlib-compressed in their record
+COMPRESS_THRESHOLD = 512
+
+
+@dataclass(slots=True)
+class CellRecord:
+    """
+    Compact state of a command cell, independent of its Flet controls.
+
+    The record is the source of truth: views bind to it and can be dropped
+    and rebuilt at any time. Large outputs are stored compressed.
+    """
+    cell_id: int
+    command: str
+    cwd: str
+    exit_code: int | None = None
+    is_error: bool = False
+    duration: float | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None # When the command last exited
+    deleted: bool = False
+    status: str = "" # Run all status, empty for commands run by hand
+    cwd_after: str | None = None # Working directory the command left the shell in (shell sessions only)
+    _output: bytes | str | None = None # None until the command ran
+    _output_lines: int = 0 # Kept apart, laying out off-screen cells doesn't decompress their output
+
+    @property
+    def output(self) -> str | None:
+        if isinstance(self._output, bytes):
+            return zlib.decompress(self._output).decode("utf-8")
+        return self._output
+
+    @output.setter
+    def output(self, text: str | None):
+        self._output_lines = text.count("\n") + 1 if text is not None else 0
+        if text is not None and len(text) > COMPRESS_THRESHOLD:
+            self._output = zlib.compress(text.encode("utf-8"))
+        else:
+            self._output = text
+
+    @property
+    def output_lines(self) -> int:
+        """Lines of the output, 0 until the command ran."""
+        return self._output_lines
+
+    def output_size(self) -> int:
+        """Bytes used by the stored output."""
+        return len(self._output) if self._output is not None else 0
+
+
+class SessionStore:
+    """
+    Append-only log of the cells of a session.
+
+    Records are never removed, deleting a cell only flags its record, so
+    search, export and replay can work on the whole session without going
+    through the UI.
+    """
+
+    def __init__(self, cwd: str | None = None, index_max_bytes: int = SEARCH_INDEX_MAX_BYTES):
+        self.records: list[CellRecord] = []
+        self.cwd = cwd or os.getcwd() # Working directory new cells start in
+        self._ids = itertools.count(1)
+        # Words of the outputs, fed by the runner while commands produce them
+        self.output_index = OutputIndex(index_max_bytes)
+
+    def new_record(self, command: str, cwd: str | None = None) -> CellRecord:
+        record = CellRecord(cell_id=next(self._ids), command=command, cwd=cwd or self.cwd)
+        self.records.append(record)
+        return record
+
+    def delete(self, record: CellRecord):
+        record.deleted = True
+        self.output_index.remove(record.cell_id)
+
+    def restore(self, records: list[CellRecord], cwd: str | None = None):
+        """
+        Replaces the session with saved records (see services.session_file).
+        Their outputs are indexed on a background thread, until then the
+        search scans them.
+        """
+        self.records = list(records)
+        if cwd:
+            self.cwd = cwd
+        self._ids = itertools.count(max((record.cell_id for record in records), default=0) + 1)
+        ran = [record for record in records if record.output is not None]
+        self.output_index.mark_unindexed(record.cell_id for record in ran)
+
+        def index_outputs():
+            for record in ran:
+                if not record.deleted:
+                    self.output_index.add_saved(record.cell_id, f"{record.command}\n{record.output}")
+        threading.Thread(target=index_outputs, name="session-index", daemon=True).start()
+
+    def active(self) -> list[CellRecord]:
+        """Records of the cells still shown."""
+        return [record for record in self.records if not record.deleted]
+
+    def search(self, text: str) -> list[CellRecord]:
+        """
+        Cells still shown whose command or output contains `text` (ignoring
+        case), in order. Only the outputs the index points to are read.
+        """
+        if not text:
+            return []
+        needle = text.lower()
+        candidates = self.output_index.search(text)
+        found = []
+        for record in self.records:
+            if record.deleted:
+                continue
+            if needle in record.command.lower():
+                found.append(record)
+            elif (record.output is not None and (candidates is None or record.cell_id in candidates)
+                  and needle in record.output.lower()):
+                found.append(record)
+        return found
+
+    def export(self) -> list[dict]:
+        """Plain data version of the session (outputs decompressed)."""
+        return [
+            {
+                "cell_id": record.cell_id,
+                "command": record.command,
+                "cwd": record.cwd,
+                "exit_code": record.exit_code,
+                "is_error": record.is_error,
+                "duration": record.duration,
+                "created_at": record.created_at,
+                "finished_at": record.finished_at,
+                "deleted": record.deleted,
+                "status": record.status,
+                "cwd_after": record.cwd_after,
+                "output": record.output,
+            }
+            for record in self.records
+        ]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the stored outputs and commands."""
+        return sum(record.output_size() + len(record.command) for record in self.records)
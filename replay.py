@@ -0,0 +1,167 @@
+# replay.py
+"""
+Headless replay of a saved session.
+
+Runs the commands of a session file again, without the UI, and reports
+for each one its exit code and duration next to the recorded ones. Exit
+code differences are regressions: the runner exits with status 1 when
+there is one (or when a command was skipped), so a saved runbook can be
+checked in CI or on a new machine.
+
+Commands run in shell sessions like in the app, so cd/export carry over.
+With --jobs, independent commands run in parallel: the steps between two
+barriers (cd, export, installs...) as for Run all. A command whose exit
+code differs from the recording skips the commands depending on it.
+
+Usage:
+    python replay.py [SESSION_FILE] [--jobs 1] [--timeout 0] [--cwd DIR] [--stop-on-diff] [--json]
+
+SESSION_FILE defaults to the session the app saved last.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from models.session import CellRecord
+from services.command_executor import CommandExecutor
+from services.command_runner import RunControl
+from services.command_scheduler import SKIPPED, CommandScheduler, build_dependencies
+from services.session_file import load_session
+from services.shell_session import ShellSessionPool, close_all_sessions
+from utils.constants import SESSION_PATH
+
+
+@dataclass
+class ReplayResult:
+    """A replayed command next to its recording."""
+    step: int # 1-based, in session order
+    command: str
+    recorded_exit_code: int
+    recorded_duration: float | None
+    exit_code: int | None = None # None if skipped or not started
+    duration: float | None = None
+    status: str = SKIPPED # Scheduler status: done (same exit code), failed (different) or skipped
+    note: str = "" # Timeout, error starting it...
+
+    @property
+    def same(self) -> bool:
+        return self.exit_code == self.recorded_exit_code
+
+
+def replay(records: list[CellRecord], cwd: str, jobs: int = 1, timeout: float = 0,
+           stop_on_diff: bool = False, on_result=None) -> list[ReplayResult]:
+    """
+    Runs the recorded commands and compares their exit codes.
+
+    Args:
+        records (list[CellRecord]): Cells of the session, the ones that never
+                                    ran are left out.
+        cwd (str): Directory the first command runs in.
+        jobs (int): Commands running at the same time.
+        timeout (float): Seconds before a command is stopped, 0 for no limit.
+        stop_on_diff (bool): Start nothing new once an exit code differed.
+        on_result (Callable): Called with each ReplayResult once its command ended.
+    """
+    ran = [record for record in records if record.exit_code is not None]
+    results = [
+        ReplayResult(step, record.command, record.exit_code, record.duration)
+        for step, record in enumerate(ran, start=1)
+    ]
+    shells = ShellSessionPool(cwd, size=jobs)
+    executor = CommandExecutor(max_workers=jobs)
+
+    def run_step(index: int) -> bool:
+        result = results[index]
+        control = RunControl(timeout)
+        start = time.monotonic()
+        try:
+            with shells.lease() as shell:
+                outcome = shell.run(result.command, control=control)
+            result.exit_code = outcome.returncode
+            result.duration = outcome.duration
+            result.note = control.describe()
+        except Exception as e:
+            result.duration = time.monotonic() - start
+            result.note = f"error: {e}"
+        if on_result:
+            on_result(result)
+        # Success for the scheduler means "as recorded", a command failing as it did is fine
+        return result.same
+
+    try:
+        statuses = CommandScheduler(executor, stop_on_failure=stop_on_diff).run(
+            len(results), build_dependencies([result.command for result in results]), run_step,
+        )
+    finally:
+        executor.shutdown()
+        shells.close()
+    for result, status in zip(results, statuses):
+        result.status = status
+    return results
+
+
+def format_result(result: ReplayResult) -> str:
+    def seconds(value: float | None) -> str:
+        return f"{value:.2f}s" if value is not None else "-"
+    exit_code = "-" if result.exit_code is None else str(result.exit_code)
+    flag = "" if result.same else ("SKIPPED" if result.status == SKIPPED else "DIFF")
+    command = result.command.strip().replace("\n", " ")
+    if len(command) > 60:
+        command = command[:57] + "..."
+    line = (f"{result.step:>4}  {exit_code:>4} {result.recorded_exit_code:>4}  "
+            f"{seconds(result.duration):>8} {seconds(result.recorded_duration):>8}  {command}")
+    note = " ".join(part for part in (flag, result.note) if part)
+    return f"{line}  {note}" if note else line
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session", nargs="?", default=SESSION_PATH, help="session file (default: %(default)s)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="commands running at the same time")
+    parser.add_argument("--timeout", type=float, default=0, help="seconds before a command is stopped (0: no limit)")
+    parser.add_argument("--cwd", help="directory to start in instead of the recorded one")
+    parser.add_argument("--stop-on-diff", action="store_true", help="start nothing new once an exit code differed")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        saved = load_session(args.session)
+    except (OSError, ValueError) as e:
+        print(f"Can't load {args.session}: {e}", file=sys.stderr)
+        return 2
+    ran = [record for record in saved.records if record.exit_code is not None]
+    # The directory the first command ran in, it may not exist on this machine
+    cwd = args.cwd or (ran[0].cwd if ran else saved.cwd)
+    if not os.path.isdir(cwd):
+        print(f"Recorded directory {cwd} doesn't exist, starting in {os.getcwd()}", file=sys.stderr)
+        cwd = os.getcwd()
+
+    if not args.json:
+        print(f"Replaying {len(ran)} commands from {args.session} in {cwd} ({args.jobs} at a time)")
+        print(f"{'step':>4}  {'exit':>4} {'was':>4}  {'time':>8} {'was':>8}  command")
+    start = time.monotonic()
+    results = replay(
+        saved.records, cwd, max(args.jobs, 1), args.timeout, args.stop_on_diff,
+        on_result=None if args.json else lambda result: print(format_result(result), flush=True),
+    )
+    elapsed = time.monotonic() - start
+    close_all_sessions()
+
+    diffs = [result for result in results if not result.same and result.status != SKIPPED]
+    skipped = [result for result in results if result.status == SKIPPED]
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        for result in skipped:
+            print(format_result(result))
+        recorded = sum(result.recorded_duration or 0 for result in results)
+        print(f"\n{len(results)} commands: {len(results) - len(diffs) - len(skipped)} same exit code, "
+              f"{len(diffs)} different, {len(skipped)} skipped; {elapsed:.2f}s (recorded {recorded:.2f}s)")
+    return 1 if diffs or skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# services/ai_prefetcher.py
+import threading
+import time
+from typing import Any, Callable
+from services.llm_request_pool import LLMRequest, get_request_pool
+from utils.constants import LLM_PREFETCH_ENABLED, LLM_PREFETCH_PER_MINUTE
+
+
+class Prefetch:
+    """A speculative error request, shared by every cell that failed the same way."""
+
+    def __init__(self, key: tuple[str, str], request: LLMRequest):
+        self.key = key
+        self.request = request
+        self.holders = 1
+
+    def done(self) -> bool:
+        return self.request.done()
+
+    def succeeded(self) -> bool:
+        future = self.request.future
+        return future.done() and not future.cancelled() and future.exception() is None
+
+    def result(self) -> Any:
+        return self.request.result()
+
+    def add_done_callback(self, callback: Callable[['Prefetch'], None]):
+        """Calls `callback(prefetch)` once the model answered (right away if it already did)."""
+        self.request.future.add_done_callback(lambda _: callback(self))
+
+
+class AIPrefetcher:
+    """
+    Asks the model for a fix as soon as a command fails, before "Ask AI".
+
+    By the time the user has read the error the suggestion is often ready.
+    Identical failures share one in-flight request, at most `per_minute`
+    requests are started (and none while the request pool is saturated, so
+    explicit requests never wait behind guesses), and a request nobody
+    holds anymore is cancelled.
+    """
+
+    def __init__(self, submit: Callable[[str, str], LLMRequest], enabled: bool = LLM_PREFETCH_ENABLED,
+                 per_minute: int = LLM_PREFETCH_PER_MINUTE):
+        self.submit = submit # Starts an error request, e.g. ErrorRequestCoalescer.submit
+        self.enabled = enabled
+        self.per_minute = per_minute
+        self._inflight: dict[tuple[str, str], Prefetch] = {}
+        self._started: list[float] = [] # Start times within the last minute
+        self._lock = threading.Lock()
+        # Metrics
+        self.started = 0
+        self.shared = 0
+        self.rate_limited = 0
+
+    def start(self, command: str, error: str) -> Prefetch | None:
+        """
+        Starts (or joins) the error request for a failed command.
+
+        Returns:
+            Prefetch: To hand back to release(), or None when prefetching is
+                      off or over its rate limit.
+        """
+        if not self.enabled:
+            return None
+        key = (command, error)
+        pool = get_request_pool()
+        with self._lock:
+            prefetch = self._inflight.get(key)
+            if prefetch is not None and not prefetch.request.cancelled():
+                prefetch.holders += 1
+                self.shared += 1
+                return prefetch
+
+            now = time.monotonic()
+            self._started = [started for started in self._started if now - started < 60]
+            if len(self._started) >= self.per_minute or pool.pending_count() >= pool.max_concurrent:
+                self.rate_limited += 1
+                return None
+            self._started.append(now)
+            self.started += 1
+
+            request = self.submit(command, error)
+            prefetch = Prefetch(key, request)
+            self._inflight[key] = prefetch
+        # Answered requests stay shareable until released, failed ones are retried next time
+        request.future.add_done_callback(lambda _: self._forget_failed(prefetch))
+        return prefetch
+
+    def release(self, prefetch: Prefetch):
+        """The cell re-ran or was deleted: cancels the request if no other cell waits on it."""
+        with self._lock:
+            prefetch.holders -= 1
+            if prefetch.holders > 0:
+                return
+            if self._inflight.get(prefetch.key) is prefetch:
+                del self._inflight[prefetch.key]
+        prefetch.request.cancel()
+
+    def _forget_failed(self, prefetch: Prefetch):
+        if prefetch.succeeded():
+            return
+        with self._lock:
+            if self._inflight.get(prefetch.key) is prefetch:
+                del self._inflight[prefetch.key]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": sum(1 for prefetch in self._inflight.values() if not prefetch.done()),
+                "started": self.started,
+                "shared": self.shared,
+                "rate_limited": self.rate_limited,
+            }
+
+
+_default_prefetcher: AIPrefetcher | None = None
+_default_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> AIPrefetcher:
+    """Returns the process-wide prefetcher, asking the shared LLM client through the coalescer."""
+    global _default_prefetcher
+    with _default_prefetcher_lock:
+        if _default_prefetcher is None:
+            from services.request_coalescer import get_error_coalescer
+            _default_prefetcher = AIPrefetcher(get_error_coalescer().submit)
+        return _default_prefetcher
@@ -0,0 +1,170 @@
+# services/command_executor.py
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable
+from utils.constants import EXECUTOR_MAX_WORKERS, EXECUTOR_WAIT_SAMPLES
+
+# Priorities, lower runs first
+INTERACTIVE = 0 # A cell run by hand
+BATCH = 1 # A step of Run all
+
+
+class _Job:
+    __slots__ = ("fn", "args", "future", "submitted_at")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple):
+        self.fn = fn
+        self.args = args
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+
+class CommandExecutor:
+    """
+    Runs every command of the app on a fixed number of workers.
+
+    Jobs beyond `max_workers` wait in a priority queue: commands run by hand
+    go before the remaining steps of a Run all, then first come first
+    served. Queue depth and the time jobs waited are tracked so the UI can
+    show the load.
+    """
+
+    def __init__(self, max_workers: int = EXECUTOR_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queue: list[tuple[int, int, _Job]] = [] # Heap of (priority, order, job)
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._workers: list[threading.Thread] = []
+        self._running = 0
+        self._idle = 0
+        self._shutdown = False
+        # Metrics
+        self._submitted = 0
+        self._completed = 0
+        self._waits: deque[float] = deque(maxlen=EXECUTOR_WAIT_SAMPLES)
+        self._listeners: list[Callable[[dict], None]] = []
+
+    def submit(self, fn: Callable[..., Any], *args, priority: int = INTERACTIVE) -> Future:
+        """
+        Queues `fn(*args)`.
+
+        Args:
+            fn (Callable): The blocking call running the command.
+            priority (int): INTERACTIVE or BATCH.
+
+        Returns:
+            Future: Resolved with the result of `fn`. Cancelling it before the
+                    job started removes it from the queue.
+        """
+        job = _Job(fn, args)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("command executor is shut down")
+            heapq.heappush(self._queue, (priority, next(self._order), job))
+            self._submitted += 1
+            # Workers are started on demand, up to max_workers
+            if len(self._queue) > self._idle and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"command-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify()
+        self._notify_listeners()
+        return job.future
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._queue and not self._shutdown:
+                    self._condition.wait()
+                self._idle -= 1
+                if self._shutdown and not self._queue:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                if not job.future.set_running_or_notify_cancel():
+                    continue # Cancelled while queued
+                self._running += 1
+                self._waits.append(time.monotonic() - job.submitted_at)
+            self._notify_listeners()
+
+            try:
+                result = job.fn(*job.args)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._completed += 1
+                self._notify_listeners()
+
+    def queue_depth(self) -> int:
+        """Jobs waiting for a worker (cancelled ones included until skipped)."""
+        with self._condition:
+            return len(self._queue)
+
+    def metrics(self) -> dict:
+        """Snapshot of the load: queue depth, running jobs and wait times in seconds."""
+        with self._condition:
+            waits = sorted(self._waits)
+            return {
+                "queued": len(self._queue),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "wait_max": waits[-1] if waits else 0.0,
+            }
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Calls `listener(metrics)` whenever a job is queued, starts or ends."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[dict], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify_listeners(self):
+        if not self._listeners:
+            return
+        metrics = self.metrics()
+        for listener in list(self._listeners):
+            listener(metrics)
+
+    def shutdown(self):
+        """Drops the queued jobs, running ones finish on their own."""
+        with self._condition:
+            self._shutdown = True
+            queued, self._queue = self._queue, []
+            self._condition.notify_all()
+        for _, _, job in queued:
+            job.future.cancel()
+
+
+_default_executor: CommandExecutor | None = None
+_default_executor_lock = threading.Lock()
+
+
+def get_command_executor() -> CommandExecutor:
+    """Returns the process-wide command executor, creating it on first use."""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = CommandExecutor()
+        return _default_executor
+
+
+def shutdown_command_executor():
+    """Teardown hook: stops the shared executor if it was ever started."""
+    global _default_executor
+    with _default_executor_lock:
+        executor, _default_executor = _default_executor, None
+    if executor is not None:
+        executor.shutdown()
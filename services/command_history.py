@@ -0,0 +1,344 @@
+# services/command_history.py
+import bisect
+import heapq
+import math
+import os
+import sqlite3
+import threading
+import time
+from utils.constants import (
+    HISTORY_PATH,
+    HISTORY_MAX_COMMANDS,
+    HISTORY_MAX_RUNS,
+    HISTORY_HALF_LIFE,
+    HISTORY_SUGGESTIONS,
+)
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# Prefixes up to this length have their best commands precomputed
+PREFIX_DEPTH = 4
+# Best commands kept per precomputed prefix
+TOP_PER_PREFIX = 10
+# Longer prefixes matching more commands than this keep their best ones once ranked
+CACHE_PREFIX_SCAN = 200
+# Max longer prefixes kept that way
+MAX_CACHED_PREFIXES = 4096
+# Failed runs count less than successful ones when ranking
+FAILURE_WEIGHT = 0.25
+# Evictions are checked once every this many recorded runs
+EVICT_EVERY = 500
+
+
+def bump_rank(rank: float | None, now: float, weight: float = 1.0, half_life: float = HISTORY_HALF_LIFE) -> float:
+    """
+    Frecency after one more run at `now`.
+
+    The score of a command halves every `half_life` seconds and each run
+    adds `weight` to it. It is stored as log2(score) + time / half_life,
+    which keeps the order of two commands the same as time goes by: ranks
+    never need to be recomputed, only the command just run changes.
+    """
+    epoch = now / half_life
+    if rank is None:
+        return math.log2(weight) + epoch
+    return math.log2(2 ** (rank - epoch) + weight) + epoch
+
+
+class CommandHistory:
+    """
+    Every command run, kept across app runs in SQLite, with as-you-type recall.
+
+    Runs are logged with their cwd, exit code, duration and time. Distinct
+    commands are ranked by frecency (frequent and recent first, failures
+    count less). Prefix recall is served from memory: a sorted list for
+    range lookups plus the best commands of each short prefix, so it stays
+    well under a millisecond with hundreds of thousands of commands.
+    Substring and out-of-order word matches fall back to an FTS5 trigram
+    index. The in-memory index is loaded on a background thread the first
+    time suggestions are needed, startup never pays for it.
+    """
+
+    def __init__(self, path: str = HISTORY_PATH, max_commands: int = HISTORY_MAX_COMMANDS,
+                 max_runs: int = HISTORY_MAX_RUNS, half_life: float = HISTORY_HALF_LIFE):
+        self.path = path
+        self.max_commands = max_commands
+        self.max_runs = max_runs
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._fts = False
+        self._recorded = 0
+        # In-memory index
+        self._loaded = False
+        self._loading = False
+        self._ranks: dict[str, float] = {}
+        self._sorted: list[str] = []
+        self._sorted_ranks: list[float] = [] # Rank of each command of _sorted, same order
+        self._top: dict[str, list[str]] = {}
+        self._cached: dict[str, list[str]] = {} # Best commands of the longer prefixes asked for
+
+    # --- Storage ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY, command TEXT NOT NULL, cwd TEXT, exit_code INTEGER,"
+            " duration REAL, ran_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS commands ("
+            " id INTEGER PRIMARY KEY, command TEXT UNIQUE NOT NULL, runs INTEGER NOT NULL,"
+            " failures INTEGER NOT NULL, last_run REAL NOT NULL, rank REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS commands_rank ON commands (rank)")
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS commands_fts USING fts5("
+                " command, content='commands', content_rowid='id', tokenize='trigram')"
+            )
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite without FTS5 or the trigram tokenizer (before 3.34): LIKE scans instead
+            log.warning("History full-text index unavailable: %s", e)
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def record(self, command: str, cwd: str | None, exit_code: int | None, duration: float | None):
+        """Logs a finished command and updates its rank."""
+        command = command.strip()
+        if not command:
+            return
+        now = time.time()
+        failed = exit_code not in (0, None)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO runs (command, cwd, exit_code, duration, ran_at) VALUES (?, ?, ?, ?, ?)",
+                (command, cwd, exit_code, duration, now),
+            )
+            row = conn.execute("SELECT id, rank FROM commands WHERE command = ?", (command,)).fetchone()
+            rank = bump_rank(row[1] if row else None, now, FAILURE_WEIGHT if failed else 1.0, self.half_life)
+            if row is None:
+                command_id = conn.execute(
+                    "INSERT INTO commands (command, runs, failures, last_run, rank) VALUES (?, 1, ?, ?, ?)",
+                    (command, int(failed), now, rank),
+                ).lastrowid
+                if self._fts:
+                    conn.execute("INSERT INTO commands_fts (rowid, command) VALUES (?, ?)", (command_id, command))
+            else:
+                conn.execute(
+                    "UPDATE commands SET runs = runs + 1, failures = failures + ?, last_run = ?, rank = ? WHERE id = ?",
+                    (int(failed), now, rank, row[0]),
+                )
+            self._recorded += 1
+            if self._recorded % EVICT_EVERY == 0:
+                self._evict(conn)
+            conn.commit()
+            if self._loaded:
+                self._index(command, rank)
+
+    def _evict(self, conn: sqlite3.Connection):
+        conn.execute(
+            "DELETE FROM runs WHERE id IN (SELECT id FROM runs ORDER BY id DESC LIMIT -1 OFFSET ?)", (self.max_runs,)
+        )
+        stale = conn.execute(
+            "SELECT id, command FROM commands ORDER BY rank DESC LIMIT -1 OFFSET ?", (self.max_commands,)
+        ).fetchall()
+        for command_id, command in stale:
+            if self._fts:
+                conn.execute(
+                    "INSERT INTO commands_fts (commands_fts, rowid, command) VALUES ('delete', ?, ?)",
+                    (command_id, command),
+                )
+            conn.execute("DELETE FROM commands WHERE id = ?", (command_id,))
+            if self._loaded:
+                self._unindex(command)
+
+    # --- In-memory prefix index ---
+
+    def load(self):
+        """Builds the in-memory index (blocking), suggest() starts it on a thread otherwise."""
+        with self._lock:
+            if self._loaded:
+                return
+            conn = self._connect()
+            rows = conn.execute("SELECT command, rank FROM commands ORDER BY rank DESC").fetchall()
+            self._ranks = dict(rows)
+            self._sorted = sorted(self._ranks)
+            self._sorted_ranks = [self._ranks[command] for command in self._sorted]
+            top: dict[str, list[str]] = {}
+            for command, _ in rows: # Best first, so each list fills with the best commands
+                for length in range(1, min(len(command), PREFIX_DEPTH) + 1):
+                    best = top.setdefault(command[:length], [])
+                    if len(best) < TOP_PER_PREFIX:
+                        best.append(command)
+            self._top = top
+            self._loaded = True
+            self._loading = False
+
+    def _load_in_background(self):
+        with self._lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self.load, name="history-load", daemon=True).start()
+
+    def _index(self, command: str, rank: float):
+        self._cached.clear()
+        index = bisect.bisect_left(self._sorted, command)
+        if command in self._ranks:
+            self._sorted_ranks[index] = rank
+        else:
+            self._sorted.insert(index, command)
+            self._sorted_ranks.insert(index, rank)
+        self._ranks[command] = rank
+        for length in range(1, min(len(command), PREFIX_DEPTH) + 1):
+            best = self._top.setdefault(command[:length], [])
+            if command in best:
+                best.remove(command)
+            ranks = [-self._ranks[other] for other in best]
+            best.insert(bisect.bisect_right(ranks, -rank), command)
+            del best[TOP_PER_PREFIX:]
+
+    def _unindex(self, command: str):
+        if self._ranks.pop(command, None) is None:
+            return
+        self._cached.clear()
+        index = bisect.bisect_left(self._sorted, command)
+        if index < len(self._sorted) and self._sorted[index] == command:
+            del self._sorted[index]
+            del self._sorted_ranks[index]
+        for length in range(1, min(len(command), PREFIX_DEPTH) + 1):
+            best = self._top.get(command[:length])
+            if best and command in best:
+                best.remove(command)
+
+    # --- Recall ---
+
+    def suggest(self, text: str, limit: int = HISTORY_SUGGESTIONS) -> list[str]:
+        """
+        Past commands completing `text`, best first.
+
+        Commands starting with it come first; when there are fewer than
+        `limit`, commands containing it (or all its words) follow. Returns
+        nothing until the index is loaded, which this starts.
+        """
+        text = text.lstrip()
+        if not text:
+            return []
+        if not self._loaded:
+            self._load_in_background()
+            return []
+        with self._lock:
+            results = [command for command in self._prefix_matches(text, limit + 1) if command != text][:limit]
+        if len(results) < limit and len(text) >= 3:
+            for command in self.search(text, limit + len(results) + 1):
+                if command not in results and command != text:
+                    results.append(command)
+                    if len(results) == limit:
+                        break
+        return results
+
+    def _prefix_matches(self, text: str, limit: int) -> list[str]:
+        if len(text) <= PREFIX_DEPTH:
+            return self._top.get(text, [])[:limit]
+        best = self._cached.get(text)
+        if best is not None:
+            return best[:limit]
+        start = bisect.bisect_left(self._sorted, text)
+        end = bisect.bisect_left(self._sorted, text + "\U0010ffff", start)
+        if end - start <= CACHE_PREFIX_SCAN:
+            return self._best_in_range(start, end, limit)
+        # Common prefix (git s...): ranked once, then served like the short ones while typing
+        best = self._best_in_range(start, end, TOP_PER_PREFIX)
+        if len(self._cached) >= MAX_CACHED_PREFIXES:
+            self._cached.clear()
+        self._cached[text] = best
+        return best[:limit]
+
+    def _best_in_range(self, start: int, end: int, count: int) -> list[str]:
+        """Best ranked commands of _sorted[start:end], comparing plain floats to stay fast on big ranges."""
+        ranks = self._sorted_ranks[start:end]
+        best = []
+        taken = set()
+        for rank in heapq.nlargest(count, ranks):
+            index = ranks.index(rank)
+            while index in taken: # Same rank as a command already taken
+                index = ranks.index(rank, index + 1)
+            taken.add(index)
+            best.append(self._sorted[start + index])
+        return best
+
+    def search(self, text: str, limit: int = HISTORY_SUGGESTIONS) -> list[str]:
+        """Past commands containing `text`, or each of its words in any order, best first."""
+        words = text.split()
+        if not any(len(word) >= 3 for word in words):
+            return [] # Too short to narrow down anything, prefixes cover it
+        with self._lock:
+            conn = self._connect()
+            # Trigrams need 3 characters, shorter words (and everything without FTS5) use LIKE
+            indexed = [word for word in words if len(word) >= 3] if self._fts else []
+            scanned = [word for word in words if word not in indexed]
+            where = " AND ".join(["c.command LIKE ? ESCAPE '\\'"] * len(scanned)) or "1"
+            patterns = ["%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for word in scanned]
+            if indexed:
+                query = " AND ".join('"' + word.replace('"', '""') + '"' for word in indexed)
+                rows = conn.execute(
+                    "SELECT c.command FROM commands_fts f JOIN commands c ON c.id = f.rowid"
+                    f" WHERE commands_fts MATCH ? AND {where} ORDER BY c.rank DESC LIMIT ?",
+                    (query, *patterns, limit),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT c.command FROM commands c WHERE {where} ORDER BY c.rank DESC LIMIT ?", (*patterns, limit)
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def runs(self, command: str, limit: int = 20) -> list[dict]:
+        """Latest runs of a command: cwd, exit code, duration and time."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT cwd, exit_code, duration, ran_at FROM runs WHERE command = ? ORDER BY id DESC LIMIT ?",
+                (command.strip(), limit),
+            ).fetchall()
+        return [{"cwd": cwd, "exit_code": code, "duration": duration, "ran_at": ran_at} for cwd, code, duration, ran_at in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._loaded = False
+            self._ranks, self._sorted, self._sorted_ranks, self._top, self._cached = {}, [], [], {}, {}
+
+
+_default_history: CommandHistory | None = None
+_default_history_lock = threading.Lock()
+
+
+def get_command_history() -> CommandHistory:
+    """Returns the history shared by the whole app (the database opens on first use)."""
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = CommandHistory()
+        return _default_history
+
+
+def close_command_history():
+    """Teardown hook: closes the history database if it was opened."""
+    global _default_history
+    with _default_history_lock:
+        history, _default_history = _default_history, None
+    if history is not None:
+        history.close()
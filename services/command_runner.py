@@ -1,61 +1,402 @@
 # services/command_runner.py
+import codecs
+import signal
 import subprocess
 import threading
 import os
-import flet as ft # Needed for ft.Control type hint potentially
-from typing import TYPE_CHECKING
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, IO
+from services.terminal_buffer import TerminalBuffer
+from services import tracing
+from utils.constants import (
+    OUTPUT_SCROLLBACK_LINES,
+    OUTPUT_MAX_LINE_LENGTH,
+    OUTPUT_FLUSH_INTERVAL,
+    OUTPUT_READ_SIZE,
+    COMMAND_TIMEOUT,
+    COMMAND_STOP_GRACE_PERIOD,
+    COMMAND_CPU_LIMIT,
+    COMMAND_MEMORY_LIMIT_MB,
+)
 
 # Avoid circular import issues at runtime, only import CommandCell for type checking
 if TYPE_CHECKING:
-    from components.command_cell import CommandCell
+    from components.command.command_cell import CommandCell
+    from services.shell_session import ShellSessionPool
 
-def run_command_thread(command_str: str, cell_instance: 'CommandCell'):
+
+class OutputBuffer:
+    """Ring buffer keeping only the last `max_lines` lines of a stream."""
+
+    def __init__(self, max_lines: int = OUTPUT_SCROLLBACK_LINES, max_line_length: int = OUTPUT_MAX_LINE_LENGTH):
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self.max_line_length = max_line_length
+        self.partial = "" # Last line, not terminated by a newline yet
+        self.dropped_lines = 0 # Lines pushed out of the ring buffer
+
+    def write(self, text: str):
+        """Appends decoded text, splitting it into lines."""
+        parts = (self.partial + text).split("\n")
+        self.partial = parts.pop()
+        # Split a never-ending line so it still fits in the buffer
+        while len(self.partial) > self.max_line_length:
+            parts.append(self.partial[:self.max_line_length])
+            self.partial = self.partial[self.max_line_length:]
+
+        for line in parts:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped_lines += 1
+            self.lines.append(line)
+
+    def get_text(self) -> str:
+        """Returns the buffered text (with a note if older lines were dropped)."""
+        lines = list(self.lines)
+        if self.partial:
+            lines.append(self.partial)
+        text = "\n".join(lines)
+        if self.dropped_lines:
+            text = f"[... {self.dropped_lines} earlier lines dropped ...]\n{text}"
+        return text
+
+    def __bool__(self) -> bool:
+        return bool(self.lines or self.partial)
+
+
+@dataclass
+class CommandResult:
+    """Final state of an executed command."""
+    command: str
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    cwd: str | None = None # Working directory after the command (shell sessions only)
+
+    @property
+    def is_error(self) -> bool:
+        # Treat any stderr output as potentially an error condition
+        return self.returncode != 0 or bool(self.stderr.strip())
+
+
+def format_output(stdout: str, stderr: str, returncode: int | None = None) -> str:
+    """Builds the text shown in a cell from the captured streams."""
+    output = ""
+    error = ""
+
+    if stdout.strip():
+        output += f"[STDOUT]:\n{stdout.strip()}\n"
+    if stderr.strip():
+        error += f"[STDERR]:\n{stderr.strip()}\n"
+
+    if returncode is not None and returncode != 0:
+        error += f"\n[Exit Code: {returncode}]"
+
+    return (output + error).strip()
+
+
+# --- Process supervision ---
+
+def limits_prefix() -> str:
+    """
+    ulimit commands capping the CPU seconds and memory of each process a
+    command starts (COMMAND_CPU_LIMIT / COMMAND_MEMORY_LIMIT_MB), or "".
+    """
+    limits = []
+    if COMMAND_CPU_LIMIT:
+        limits.append(f"ulimit -t {COMMAND_CPU_LIMIT}")
+    if COMMAND_MEMORY_LIMIT_MB:
+        limits.append(f"ulimit -v {COMMAND_MEMORY_LIMIT_MB * 1024}")
+    return "".join(f"{limit}; " for limit in limits)
+
+
+def child_processes(pid: int) -> list[int]:
+    """Every descendant of a process, parents before their children."""
+    try:
+        table = subprocess.run(["ps", "-A", "-o", "pid=,ppid="], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    children: dict[int, list[int]] = defaultdict(list)
+    for line in table.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit():
+            children[int(fields[1])].append(int(fields[0]))
+
+    descendants = []
+    pending = list(children[pid])
+    while pending:
+        child = pending.pop(0)
+        descendants.append(child)
+        pending.extend(children[child])
+    return descendants
+
+
+def signal_processes(pids: list[int], sig: int):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass # Already gone
+
+
+def escalate(send_signal: Callable[[int], None], finished: Callable[[], bool],
+             grace_period: float = COMMAND_STOP_GRACE_PERIOD) -> bool:
+    """
+    Stops a command politely first: SIGINT (like Ctrl+C), then SIGTERM,
+    then SIGKILL, waiting up to `grace_period` seconds after each one.
+    Returns True once `finished()` says the command is gone.
+    """
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGKILL):
+        if finished():
+            return True
+        send_signal(sig)
+        deadline = time.monotonic() + grace_period
+        while time.monotonic() < deadline:
+            if finished():
+                return True
+            time.sleep(0.05)
+    return finished()
+
+
+class RunControl:
+    """
+    Handle on a running command: lets the UI stop it and enforces its
+    wall-clock timeout. The runner attaches the function actually stopping
+    the processes once they exist.
+    """
+
+    def __init__(self, timeout: float = COMMAND_TIMEOUT):
+        self.timeout = timeout
+        self.stopped = False # Stop was requested (button, timeout, deleted cell...)
+        self.timed_out = False
+        self._stopper: Callable[[], None] | None = None
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    def start(self, stopper: Callable[[], None]):
+        """Called by the runner once the command runs."""
+        with self._lock:
+            self._stopper = stopper
+            stop_now = self.stopped
+            if self.timeout and not stop_now:
+                self._timer = threading.Timer(self.timeout, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+        if stop_now:
+            # Stop was requested before the process was even started
+            self._run_stopper()
+
+    def finish(self):
+        """Called by the runner once the command exited."""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._stopper = None
+
+    def stop(self):
+        """Stops the command without blocking the caller (escalation takes a few seconds)."""
+        with self._lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        self._run_stopper()
+
+    def _expire(self):
+        self.timed_out = True
+        self.stop()
+
+    def _run_stopper(self):
+        stopper = self._stopper
+        if stopper is not None:
+            threading.Thread(target=stopper, daemon=True).start()
+
+    def describe(self) -> str:
+        """Note appended to the output of a stopped command."""
+        if self.timed_out:
+            return f"[Timed out after {self.timeout:g}s]"
+        return "[Stopped]" if self.stopped else ""
+
+
+def _read_stream(stream: IO[bytes], buffer: OutputBuffer, lock: threading.Lock, changed: threading.Event,
+                 on_chunk: Callable[[str, str], None] | None = None, name: str = ""):
+    """Reads a pipe chunk by chunk until EOF, feeding the ring buffer (and `on_chunk`)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = stream.read1(OUTPUT_READ_SIZE) if hasattr(stream, "read1") else stream.read(OUTPUT_READ_SIZE)
+        if not chunk:
+            break
+        text = decoder.decode(chunk)
+        with lock:
+            buffer.write(text)
+        if on_chunk:
+            on_chunk(text, name)
+        changed.set()
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        with lock:
+            buffer.write(tail)
+        if on_chunk:
+            on_chunk(tail, name)
+        changed.set()
+    stream.close()
+
+
+def execute_command(
+    command_str: str,
+    on_output: Callable[[str, bool], None] | None = None,
+    cwd: str | None = None,
+    flush_interval: float = OUTPUT_FLUSH_INTERVAL,
+    scrollback_lines: int = OUTPUT_SCROLLBACK_LINES,
+    control: RunControl | None = None,
+    on_chunk: Callable[[str, str], None] | None = None,
+) -> CommandResult:
+    """
+    Runs a command, streaming its output while it is produced.
+
+    Args:
+        command_str (str): The command to execute.
+        on_output (Callable): Called with (text, has_stderr) at most once every
+                              `flush_interval` seconds while output keeps coming.
+        cwd (str): Working directory, defaults to the app's current directory.
+        flush_interval (float): Minimum seconds between two `on_output` calls.
+        scrollback_lines (int): Lines kept in memory per stream.
+        control (RunControl): Stop handle and timeout of the command.
+        on_chunk (Callable): Called from the reader threads with (text, stream
+                             name) for every chunk read, e.g. to index it.
+    """
+    start = time.monotonic()
+    # SECURITY WARNING: shell=True is convenient but risky with untrusted input.
+    # Consider alternatives like shlex.split() and shell=False if possible.
+    with tracing.get_tracer().span(tracing.COMMAND_SPAWN, shell_session=False):
+        process = subprocess.Popen(
+            limits_prefix() + command_str,
+            shell=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd or os.getcwd(), # Run in the app's current directory
+            start_new_session=True, # Own process group, stopped as a whole
+        )
+    if control is not None:
+        control.start(lambda: escalate(
+            lambda sig: os.killpg(process.pid, sig),
+            lambda: process.poll() is not None,
+        ))
+
+    stdout_buffer = OutputBuffer(scrollback_lines)
+    stderr_buffer = OutputBuffer(scrollback_lines)
+    lock = threading.Lock()
+    changed = threading.Event()
+
+    readers = [
+        threading.Thread(target=_read_stream, args=(process.stdout, stdout_buffer, lock, changed, on_chunk, "stdout"), daemon=True),
+        threading.Thread(target=_read_stream, args=(process.stderr, stderr_buffer, lock, changed, on_chunk, "stderr"), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    # join() returns early once a reader is done, so this loop pushes at most
+    # one batched update per flush interval while the command is running.
+    for reader in readers:
+        while reader.is_alive():
+            reader.join(flush_interval)
+            if on_output and changed.is_set():
+                changed.clear()
+                with lock:
+                    text = format_output(stdout_buffer.get_text(), stderr_buffer.get_text())
+                    has_stderr = bool(stderr_buffer)
+                on_output(text, has_stderr)
+
+    returncode = process.wait()
+    if control is not None:
+        control.finish()
+    return CommandResult(
+        command=command_str,
+        returncode=returncode,
+        stdout=stdout_buffer.get_text(),
+        stderr=stderr_buffer.get_text(),
+        duration=time.monotonic() - start,
+    )
+
+
+def run_command_thread(command_str: str, cell_instance: 'CommandCell', shells: 'ShellSessionPool | None' = None,
+                       control: RunControl | None = None) -> CommandResult | None:
     """
     Runs the command in a separate thread and updates the cell's output.
 
+    Output is streamed into the cell in batches while the command runs, and
+    only the last `OUTPUT_SCROLLBACK_LINES` lines per stream are kept.
+
     Args:
         command_str (str): The command to execute.
         cell_instance (CommandCell): The instance of the cell to update.
                                       We use a forward reference string hint
                                       or TYPE_CHECKING to avoid circular imports.
-    """
-    try:
-        # SECURITY WARNING: shell=True is convenient but risky with untrusted input.
-        # Consider alternatives like shlex.split() and shell=False if possible.
-        process = subprocess.run(
-            command_str,
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False, # Don't raise exception on non-zero exit code
-            cwd=os.getcwd() # Run in the app's current directory
-        )
+        shells (ShellSessionPool): Runs the command in one of the notebook's
+                                   shell sessions instead of a new shell.
+        control (RunControl): Lets the cell's Stop button (and the timeout)
+                              stop the command.
 
-        output = ""
-        error = ""
-        is_error = False
+    Returns:
+        CommandResult: The result, or None if the command couldn't be started.
+    """
+    result = None
+    tracer = tracing.get_tracer()
+    start = time.perf_counter()
+    # Output is indexed as it arrives, for the search bar
+    index = cell_instance.session.output_index
+    cell_id = cell_instance.record.cell_id
+    index.start(cell_id, command_str)
+    awaiting_output = [True] # Emptied by the first chunk, pop() is atomic across the reader threads
 
-        if process.stdout:
-            output += f"[STDOUT]:\n{process.stdout.strip()}\n"
-        if process.stderr:
-            error += f"[STDERR]:\n{process.stderr.strip()}\n"
-            is_error = True # Treat any stderr output as potentially an error condition
+    def on_chunk(text: str, stream: str):
+        if awaiting_output:
+            try:
+                awaiting_output.pop()
+                tracer.record(tracing.COMMAND_FIRST_BYTE, time.perf_counter() - start, stream=stream)
+            except IndexError:
+                pass
+        index.feed(cell_id, text, stream)
 
-        if process.returncode != 0:
-            error += f"\n[Exit Code: {process.returncode}]"
-            is_error = True
+    try:
+        # Output of shell sessions goes through a terminal emulator, the cell
+        # renders its styled lines and only re-renders the ones that changed
+        terminal = TerminalBuffer() if shells is not None else None
+        on_output = lambda text, has_stderr: cell_instance.update_output(text, has_stderr, running=True, terminal=terminal)
+        if shells is not None:
+            leasing = time.perf_counter()
+            with shells.lease() as shell:
+                # Waiting for a free shell (started on first use) stands for the spawn
+                tracer.record(tracing.COMMAND_SPAWN, time.perf_counter() - leasing, shell_session=True)
+                result = shell.run(command_str, on_output=on_output, terminal=terminal, control=control, on_chunk=on_chunk)
+        else:
+            result = execute_command(command_str, on_output=on_output, cwd=cell_instance.record.cwd, control=control,
+                                     on_chunk=on_chunk)
+        cell_instance.on_command_finished(result)
 
-        full_output = output + error
-        if not full_output.strip():
+        full_output = format_output(result.stdout, result.stderr, result.returncode)
+        if not full_output:
             full_output = "[INFO] Command executed with no output."
+        if control is not None and control.stopped:
+            full_output += f"\n{control.describe()}"
 
         # Update the cell's UI via its methods
         # Flet handles making control updates thread-safe when called from background threads.
-        cell_instance.update_output(full_output.strip(), is_error)
+        cell_instance.update_output(full_output, result.is_error, terminal=terminal, stderr=result.stderr)
+        if result.is_error and not (control is not None and control.stopped):
+            # The fix can be on its way before "Ask AI" is clicked
+            cell_instance.prefetch_ai_fix()
 
     except Exception as e:
         # Update UI with execution error
+        index.feed(cell_id, f"\n{e}")
         cell_instance.update_output(f"[Execution Error]:\n{str(e)}", is_error=True)
     finally:
+        index.finish(cell_id)
+        tracer.record(tracing.COMMAND_TOTAL, time.perf_counter() - start, shell_session=shells is not None,
+                      exit_code=result.returncode if result is not None else -1)
         # Re-enable buttons on the main thread via the cell instance method
-        cell_instance.set_buttons_enabled(True)
\ No newline at end of file
+        cell_instance.set_buttons_enabled(True)
+    return result
@@ -0,0 +1,172 @@
+# services/command_scheduler.py
+import re
+import threading
+from typing import Callable
+from services.command_executor import BATCH, CommandExecutor, get_command_executor
+
+# Per-command status reported while a batch runs
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Commands changing the shell state or preparing something later commands
+# need: everything after them waits until they succeeded.
+_BARRIER = re.compile(
+    r"^\s*(sudo\s+)?("
+    r"cd|pushd|popd|export|unset|source|\.|alias|set|"
+    r"conda\s+(activate|deactivate|create|install)|activate|deactivate|nvm\s+use|pyenv|"
+    r"mkdir|git\s+(clone|checkout|switch|pull)|"
+    r"(apt|apt-get|yum|dnf|brew|pip|pip3|npm|yarn|pnpm|gem|cargo|go)\s+(update|install|add|get)"
+    r")\b"
+)
+# Inline annotations, e.g. "make test  # after: 2" or "rm -rf build  # sequential"
+_AFTER = re.compile(r"#\s*(?:after|depends):\s*([\d,\s]+)")
+_SEQUENTIAL = re.compile(r"#\s*sequential\b")
+
+
+def is_barrier(command: str) -> bool:
+    return bool(_BARRIER.match(command)) or bool(_SEQUENTIAL.search(command))
+
+
+def build_dependencies(commands: list[str]) -> list[set[int]]:
+    """
+    Derives a DAG from the order of the commands.
+
+    Each command depends on the last barrier before it (cd, export, source,
+    installs...); a barrier also waits for every command before it. Commands
+    between two barriers are independent of each other. `# after: 1,3`
+    (1-based step numbers) adds explicit edges to earlier steps.
+    """
+    dependencies: list[set[int]] = []
+    last_barrier: int | None = None
+    for index, command in enumerate(commands):
+        deps: set[int] = set()
+        if is_barrier(command):
+            deps.update(range(index))
+            last_barrier = index
+        elif last_barrier is not None:
+            deps.add(last_barrier)
+
+        match = _AFTER.search(command)
+        if match:
+            for step in re.split(r"[,\s]+", match.group(1).strip()):
+                if step.isdigit() and 0 < int(step) <= index:
+                    deps.add(int(step) - 1)
+        dependencies.append(deps)
+    return dependencies
+
+
+class CommandScheduler:
+    """
+    Runs a batch of commands on the command executor, honoring the
+    dependencies between them.
+
+    Ready steps are submitted with BATCH priority, so commands run by hand
+    meanwhile don't wait behind the whole batch. A failed command skips
+    everything depending on it; with `stop_on_failure` nothing new is
+    started once a command failed.
+    """
+
+    def __init__(self, executor: CommandExecutor | None = None, stop_on_failure: bool = True):
+        self.executor = executor or get_command_executor()
+        self.stop_on_failure = stop_on_failure
+
+    def run(self, count: int, dependencies: list[set[int]], run_step: Callable[[int], bool],
+            on_status: Callable[[int, str], None] | None = None) -> list[str]:
+        """
+        Runs steps 0..count-1 and blocks until they are all settled.
+
+        Args:
+            count (int): Number of steps.
+            dependencies (list[set[int]]): Steps each step waits for.
+            run_step (Callable): Runs one step on an executor worker, returns True on success.
+            on_status (Callable): Called with (step, status) on every transition.
+
+        Returns:
+            list[str]: Final status of each step.
+        """
+        notify = on_status or (lambda index, status: None)
+        status = [QUEUED] * count
+        remaining = [set(deps) for deps in dependencies]
+        dependents: list[set[int]] = [set() for _ in range(count)]
+        for index, deps in enumerate(dependencies):
+            for dep in deps:
+                dependents[dep].add(index)
+
+        lock = threading.RLock() # A cancelled future calls back right away
+        all_settled = threading.Event()
+        stopped = False
+
+        for index in range(count):
+            notify(index, QUEUED)
+
+        def settle(index: int, final: str):
+            status[index] = final
+            notify(index, final)
+
+        def skip_unstarted():
+            for index in range(count):
+                if status[index] == QUEUED:
+                    settle(index, SKIPPED)
+
+        def skip_dependents(index: int):
+            for dependent in dependents[index]:
+                if status[dependent] == QUEUED:
+                    settle(dependent, SKIPPED)
+                    skip_dependents(dependent)
+
+        def check_settled():
+            if all(s not in (QUEUED, RUNNING) for s in status):
+                all_settled.set()
+
+        def start(index: int):
+            # Stays queued until a worker picks it up
+            try:
+                future = self.executor.submit(execute, index, priority=BATCH)
+            except RuntimeError: # The app is shutting down
+                cancelled(index)
+                return
+            future.add_done_callback(lambda f: f.cancelled() and cancelled(index))
+
+        def execute(index: int):
+            nonlocal stopped
+            with lock:
+                if status[index] != QUEUED:
+                    return # Skipped while waiting for a worker
+                status[index] = RUNNING
+                notify(index, RUNNING)
+            try:
+                success = run_step(index)
+            except Exception:
+                success = False
+            with lock:
+                settle(index, DONE if success else FAILED)
+                if success and not stopped:
+                    for dependent in sorted(dependents[index]):
+                        remaining[dependent].discard(index)
+                        if not remaining[dependent] and status[dependent] == QUEUED:
+                            start(dependent)
+                elif not success:
+                    skip_dependents(index)
+                    if self.stop_on_failure:
+                        stopped = True
+                        skip_unstarted()
+                check_settled()
+
+        def cancelled(index: int):
+            # The executor dropped the step before it could run
+            with lock:
+                if status[index] == QUEUED:
+                    settle(index, SKIPPED)
+                    skip_dependents(index)
+                check_settled()
+
+        with lock:
+            for index in range(count):
+                if not remaining[index]:
+                    start(index)
+            check_settled()
+        all_settled.wait()
+        return status
@@ -0,0 +1,181 @@
+# services/conversation_context.py
+import threading
+import time
+from dataclasses import dataclass, field
+from models.response_parser import parse_response
+from models.session import CellRecord, SessionStore
+from utils.constants import (
+    LLM_CONTEXT_BUDGET_TOKENS,
+    LLM_CONTEXT_OUTPUT_TOKENS,
+    LLM_ERROR_BUDGET_TOKENS,
+    LLM_CONTEXT_MAX_LINE_LENGTH,
+)
+
+# Share of a truncated output kept from its beginning, the rest comes from its end
+HEAD_SHARE = 0.3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def dedup_lines(lines: list[str]) -> list[str]:
+    """Collapses runs of identical lines, e.g. a warning printed for every file."""
+    result = []
+    previous, repeats = None, 0
+    for line in lines:
+        if line == previous:
+            repeats += 1
+            continue
+        if repeats:
+            result.append(f"[previous line repeated {repeats} more times]")
+        result.append(line)
+        previous, repeats = line, 0
+    if repeats:
+        result.append(f"[previous line repeated {repeats} more times]")
+    return result
+
+
+def truncate_output(text: str, max_tokens: int = LLM_ERROR_BUDGET_TOKENS) -> str:
+    """
+    Shrinks a command output to about `max_tokens` for a prompt.
+
+    Repeated lines are collapsed and very long lines cut first; if that is
+    not enough, the beginning (where the command usually says what it is
+    doing) and the end (where the error usually is) are kept and the middle
+    is dropped.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    lines = [
+        line if len(line) <= LLM_CONTEXT_MAX_LINE_LENGTH else line[:LLM_CONTEXT_MAX_LINE_LENGTH] + " [...]"
+        for line in dedup_lines(text.splitlines())
+    ]
+    text = "\n".join(lines)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens * 4 # In characters
+    head, head_size = [], 0
+    for line in lines:
+        if head_size + len(line) + 1 > budget * HEAD_SHARE:
+            break
+        head.append(line)
+        head_size += len(line) + 1
+    tail, tail_size = [], 0
+    for line in reversed(lines[len(head):]):
+        if head_size + tail_size + len(line) + 1 > budget:
+            break
+        tail.append(line)
+        tail_size += len(line) + 1
+    tail.reverse()
+    omitted = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"[... {omitted} lines omitted ...]"] + tail)
+
+
+@dataclass(slots=True)
+class Exchange:
+    """A request made from a chat box and the commands the model suggested."""
+    request: str
+    commands: list[str]
+    created_at: float = field(default_factory=time.time)
+    response: str = "" # Full answer, kept for session files
+
+
+class ConversationContext:
+    """
+    What the model should know about the session, within a token budget.
+
+    Built from the session records (commands, exit codes, outputs) and the
+    previous chat requests, newest first: recent entries go in with their
+    (truncated) output, older ones as one-line summaries, and whatever no
+    longer fits is only counted. Follow-up requests can then refer to
+    earlier commands without the user pasting their output again, while
+    the prompt stays small.
+    """
+
+    def __init__(self, session: SessionStore, budget_tokens: int = LLM_CONTEXT_BUDGET_TOKENS,
+                 output_tokens: int = LLM_CONTEXT_OUTPUT_TOKENS):
+        self.session = session
+        self.budget_tokens = budget_tokens
+        self.output_tokens = output_tokens # Per command output
+        self.exchanges: list[Exchange] = []
+        self._lock = threading.Lock()
+
+    def add_exchange(self, request: str, response: str):
+        """Remembers a chat request and the commands of its answer."""
+        commands = [parsed.command for parsed in parse_response(response)]
+        with self._lock:
+            self.exchanges.append(Exchange(request, commands, response=response))
+
+    def clear(self):
+        with self._lock:
+            self.exchanges.clear()
+
+    def restore(self, exchanges: list[Exchange]):
+        """Replaces the chat history with the one of a saved session."""
+        with self._lock:
+            self.exchanges = list(exchanges)
+
+    def _entries(self) -> list[CellRecord | Exchange]:
+        records = [record for record in self.session.records if record.exit_code is not None and not record.deleted]
+        with self._lock:
+            exchanges = list(self.exchanges)
+        # In the order things happened: a cell run again counts from its last run
+        return sorted(records + exchanges, key=lambda entry: getattr(entry, "finished_at", None) or entry.created_at)
+
+    def _full(self, entry: CellRecord | Exchange) -> str:
+        if isinstance(entry, Exchange):
+            suggested = "\n".join(f"  {command}" for command in entry.commands) or "  (none)"
+            return f"Asked: {entry.request}\nSuggested:\n{suggested}"
+        text = f"$ {entry.command.strip()}  (exit {entry.exit_code}, in {entry.cwd})"
+        output = truncate_output((entry.output or "").strip(), self.output_tokens)
+        return f"{text}\n{output}" if output else text
+
+    def _summary(self, entry: CellRecord | Exchange) -> str:
+        if isinstance(entry, Exchange):
+            return f"- asked: {entry.request[:LLM_CONTEXT_MAX_LINE_LENGTH]}"
+        return f"- $ {entry.command.strip()[:LLM_CONTEXT_MAX_LINE_LENGTH]}  (exit {entry.exit_code})"
+
+    def build(self) -> str:
+        """
+        The context block for the next prompt, empty when there is no
+        history or the budget is 0.
+        """
+        if self.budget_tokens <= 0:
+            return ""
+        header = f"Working directory: {self.session.cwd}"
+        used = estimate_tokens(header)
+        full, summaries = [], []
+        omitted = 0
+        # Newest first: full entries while they fit in two thirds of the budget, then one-liners
+        for entry in reversed(self._entries()):
+            if omitted:
+                omitted += 1
+                continue
+            if not summaries:
+                text = self._full(entry)
+                cost = estimate_tokens(text)
+                if used + cost <= self.budget_tokens * 2 // 3:
+                    full.append(text)
+                    used += cost
+                    continue
+            text = self._summary(entry)
+            cost = estimate_tokens(text)
+            if used + cost <= self.budget_tokens:
+                summaries.append(text)
+                used += cost
+            else:
+                omitted += 1
+
+        if not full and not summaries:
+            return ""
+        parts = [header]
+        if omitted:
+            parts.append(f"[{omitted} earlier commands and requests not shown]")
+        if summaries:
+            parts.append("Earlier:\n" + "\n".join(reversed(summaries)))
+        if full:
+            parts.append("Most recent:\n" + "\n\n".join(reversed(full)))
+        return "\n".join(parts)
@@ -0,0 +1,278 @@
+# services/error_index.py
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from utils.constants import (
+    ERROR_INDEX_PATH,
+    ERROR_MATCH_THRESHOLD,
+    ERROR_MATCH_MAX_SUGGESTIONS,
+    ERROR_INDEX_MAX_ENTRIES,
+)
+
+# Volatile parts of an error message, replaced by placeholders (order matters)
+_MASKS = [
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<UUID>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?\b"), "<TIME>"),
+    (re.compile(r"\b\d{1,2}:\d{2}:\d{2}(\.\d+)?\b"), "<TIME>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.I), "<HEX>"),
+    (re.compile(r"\b[0-9a-f]{12,}\b", re.I), "<HEX>"),
+    (re.compile(r"(~|\.{1,2})?(/[\w.@+-]+)+/?"), "<PATH>"),
+    (re.compile(r"\b\d+\b"), "<NUM>"),
+]
+_TOKEN = re.compile(r"<\w+>|\w+|[^\w\s]")
+_STDERR_BLOCK = re.compile(r"\[STDERR\]:\n(.*?)(?:\n\[Exit Code: -?\d+\]|\Z)", re.S)
+
+_SHINGLE_SIZE = 3
+_NUM_PERMUTATIONS = 64
+_BANDS = 16 # LSH bands of _NUM_PERMUTATIONS // _BANDS rows each
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1337) # Fixed seed, signatures must be stable between runs
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_NUM_PERMUTATIONS)]
+# Signatures are stored with their fingerprint, computing them all again made the first lookup take seconds
+_SIGNATURE = struct.Struct(f"<{_NUM_PERMUTATIONS}Q")
+
+
+def mask_volatile(text: str) -> str:
+    """Replaces paths, numbers, timestamps, ids... so only the error's shape remains."""
+    for pattern, placeholder in _MASKS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def extract_error(output: str) -> str:
+    """Returns the [STDERR] block built by run_command_thread, or the whole output."""
+    match = _STDERR_BLOCK.search(output)
+    return match.group(1) if match else output
+
+
+def fingerprint(command: str, output: str) -> str:
+    """Normalized form of a failure: the program name plus the masked stderr."""
+    program = command.split()[0] if command.split() else ""
+    masked = mask_volatile(extract_error(output)).lower()
+    return f"{program} " + " ".join(_TOKEN.findall(masked))
+
+
+def _shingles(text: str) -> set[str]:
+    tokens = text.split()
+    if len(tokens) <= _SHINGLE_SIZE:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + _SHINGLE_SIZE]) for i in range(len(tokens) - _SHINGLE_SIZE + 1)}
+
+
+def _minhash(shingles: set[str]) -> list[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _band_keys(signature: list[int]) -> list[tuple]:
+    rows = _NUM_PERMUTATIONS // _BANDS
+    return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(_BANDS)]
+
+
+@dataclass
+class FixSuggestion:
+    """A command that fixed a similar error before."""
+    command: str
+    similarity: float
+    successes: int
+
+
+class ErrorFingerprintIndex:
+    """
+    Remembers which suggested commands fixed which errors.
+
+    Errors are masked into fingerprints and indexed with MinHash/LSH, so a
+    failure that only differs in paths, PIDs, timestamps or line numbers
+    finds the fixes that worked last time without asking the model.
+    """
+
+    def __init__(self, path: str = ERROR_INDEX_PATH, threshold: float = ERROR_MATCH_THRESHOLD,
+                 max_entries: int = ERROR_INDEX_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._loaded = False
+        self._loading = False
+        # In-memory LSH index, loaded from disk on first use
+        self._fingerprints: dict[int, str] = {}
+        self._entry_bands: dict[int, list[tuple]] = {}
+        self._buckets: dict[tuple, set[int]] = {}
+
+    def load(self):
+        """Opens the database and builds the index (blocking), lookup() starts it on a thread otherwise."""
+        try:
+            with self._lock:
+                self._ensure_loaded()
+        finally:
+            self._loading = False
+
+    def _load_in_background(self):
+        with self._lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self.load, name="error-index-load", daemon=True).start()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE NOT NULL, last_seen REAL NOT NULL, signature BLOB)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(fingerprints)")]
+        if "signature" not in columns: # Index written by an older version
+            self._conn.execute("ALTER TABLE fingerprints ADD COLUMN signature BLOB")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fixes ("
+            " fingerprint_id INTEGER NOT NULL, suggestion TEXT NOT NULL,"
+            " successes INTEGER NOT NULL DEFAULT 0, last_success REAL NOT NULL,"
+            " PRIMARY KEY (fingerprint_id, suggestion))"
+        )
+        missing = []
+        for entry_id, text, blob in self._conn.execute("SELECT id, fingerprint, signature FROM fingerprints"):
+            if blob is not None and len(blob) == _SIGNATURE.size:
+                self._add_to_index(entry_id, text, list(_SIGNATURE.unpack(blob)))
+            else:
+                missing.append((entry_id, text))
+        for entry_id, text in missing:
+            signature = _minhash(_shingles(text))
+            self._conn.execute("UPDATE fingerprints SET signature = ? WHERE id = ?", (_SIGNATURE.pack(*signature), entry_id))
+            self._add_to_index(entry_id, text, signature)
+        self._conn.commit()
+        self._loaded = True
+
+    def _add_to_index(self, entry_id: int, text: str, signature: list[int]):
+        self._fingerprints[entry_id] = text
+        self._entry_bands[entry_id] = _band_keys(signature)
+        for key in self._entry_bands[entry_id]:
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _remove_from_index(self, entry_id: int):
+        self._fingerprints.pop(entry_id, None)
+        for key in self._entry_bands.pop(entry_id, []):
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, command: str, output: str) -> list[FixSuggestion]:
+        """
+        Returns past fixes of similar errors, best first (empty if none is
+        close enough). Returns nothing until the index is loaded, which this
+        starts: it is called from the UI, which shouldn't wait on the database.
+        """
+        if not self._loaded:
+            self._load_in_background()
+            return []
+        shingles = _shingles(fingerprint(command, output))
+        with self._lock:
+            if not self._loaded:
+                return [] # Closed meanwhile
+            candidates = set()
+            for key in _band_keys(_minhash(shingles)):
+                candidates |= self._buckets.get(key, set())
+
+            scored = []
+            for entry_id in candidates:
+                other = _shingles(self._fingerprints[entry_id])
+                similarity = len(shingles & other) / len(shingles | other)
+                if similarity >= self.threshold:
+                    scored.append((entry_id, similarity))
+            if not scored:
+                return []
+
+            best: dict[str, FixSuggestion] = {}
+            for entry_id, similarity in scored:
+                rows = self._conn.execute(
+                    "SELECT suggestion, successes FROM fixes WHERE fingerprint_id = ?", (entry_id,)
+                )
+                for suggestion, successes in rows:
+                    current = best.get(suggestion)
+                    if current is None or similarity > current.similarity:
+                        best[suggestion] = FixSuggestion(suggestion, similarity, successes)
+
+        ranked = sorted(best.values(), key=lambda s: (s.similarity, s.successes), reverse=True)
+        return ranked[:ERROR_MATCH_MAX_SUGGESTIONS]
+
+    def record_success(self, command: str, output: str, fix_command: str):
+        """Remembers that `fix_command` worked for the error `command` produced."""
+        text = fingerprint(command, output)
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            row = self._conn.execute("SELECT id FROM fingerprints WHERE fingerprint = ?", (text,)).fetchone()
+            if row is None:
+                signature = _minhash(_shingles(text))
+                entry_id = self._conn.execute(
+                    "INSERT INTO fingerprints (fingerprint, last_seen, signature) VALUES (?, ?, ?)",
+                    (text, now, _SIGNATURE.pack(*signature)),
+                ).lastrowid
+                self._add_to_index(entry_id, text, signature)
+            else:
+                entry_id = row[0]
+                self._conn.execute("UPDATE fingerprints SET last_seen = ? WHERE id = ?", (now, entry_id))
+            self._conn.execute(
+                "INSERT INTO fixes (fingerprint_id, suggestion, successes, last_success) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT (fingerprint_id, suggestion) DO UPDATE SET"
+                " successes = successes + 1, last_success = excluded.last_success",
+                (entry_id, fix_command, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        stale = self._conn.execute(
+            "SELECT id FROM fingerprints ORDER BY last_seen DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+        ).fetchall()
+        for (entry_id,) in stale:
+            self._conn.execute("DELETE FROM fixes WHERE fingerprint_id = ?", (entry_id,))
+            self._conn.execute("DELETE FROM fingerprints WHERE id = ?", (entry_id,))
+            self._remove_from_index(entry_id)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._loaded = False
+                self._fingerprints.clear()
+                self._entry_bands.clear()
+                self._buckets.clear()
+
+
+def format_suggestions(suggestions: list[FixSuggestion]) -> str:
+    """Renders past fixes in the same markdown format the model answers with."""
+    blocks = []
+    for suggestion in suggestions:
+        blocks.append(
+            f"```bash\n# Fixed a similar error before ({suggestion.similarity:.0%} match, "
+            f"worked {suggestion.successes}x)\n{suggestion.command}\n```"
+        )
+    return "**Command:**\n" + "\n\n".join(blocks) + "\n"
+
+
+_default_index: ErrorFingerprintIndex | None = None
+_default_index_lock = threading.Lock()
+
+
+def get_error_index() -> ErrorFingerprintIndex:
+    """Returns the index shared by the whole app (the database opens on first lookup)."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = ErrorFingerprintIndex()
+        return _default_index
@@ -0,0 +1,80 @@
+# services/llm_model_sdks/client_registry.py
+import importlib
+import threading
+from typing import Any, Callable
+from utils.constants import LLM_PROVIDER
+
+# Provider name -> "module:class", imported only when the provider is built
+# so building cells never loads an SDK
+PROVIDERS: dict[str, str] = {
+    "gemini": "services.llm_model_sdks.gemini.gemini_client:GeminiClient",
+    "local": "services.llm_model_sdks.local.local_client:LocalClient",
+    "mock": "services.llm_model_sdks.mock.mock_client:MockClient",
+}
+
+
+def register_provider(name: str, target: str):
+    """
+    Makes a provider selectable with AI_TERMINAL_LLM_PROVIDER.
+
+    Args:
+        name (str): Name used in the setting.
+        target (str): "package.module:ClassName" of an LLMClient subclass.
+    """
+    PROVIDERS[name] = target
+
+
+def create_client(provider: str = LLM_PROVIDER):
+    """Builds the client of a registered provider."""
+    target = PROVIDERS.get(provider)
+    if target is None:
+        raise ValueError(f"Unknown LLM provider {provider!r}, expected one of: {', '.join(PROVIDERS)}")
+    module_name, class_name = target.split(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def _default_factory():
+    return create_client(LLM_PROVIDER)
+
+
+class LLMClientRegistry:
+    """
+    Process-wide holder of the LLM client.
+
+    Cells receive the registry instead of a client: the client is configured
+    and built once, the first time a request actually needs it, and is then
+    shared (with its connection) by every cell.
+    """
+
+    def __init__(self, factory: Callable[[], Any] = _default_factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the shared client, creating it on first use."""
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def is_loaded(self) -> bool:
+        return self._client is not None
+
+    def close(self):
+        """Teardown hook: releases the client, the next get() builds a new one."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+
+_default_registry = LLMClientRegistry()
+
+
+def get_client_registry() -> LLMClientRegistry:
+    """Returns the registry shared by the whole app."""
+    return _default_registry
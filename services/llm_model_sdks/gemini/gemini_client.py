@@ -1,86 +1,61 @@
-import google.generativeai as genai
 import os
-import sys
 
 
 from dotenv import load_dotenv
+from services.llm_model_sdks.llm_client import LLMClient
+from utils.logger import get_logger
 
-class GeminiClient:
+log = get_logger(__name__)
+
+class GeminiClient(LLMClient):
     """Manages Gemini client."""
 
+    MODEL_NAME = 'gemini-2.0-flash'
+    # Cache entries written before providers existed are keyed by model name only
+    PROVIDER = ""
+
     def __init__(self):
-        print("Ussing GeminiClient")
-        if not self._configure_gemini():
-            sys.exit(1) 
-        
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        role = "**Role:** You are an expert command-line assistant. Your goal is to provide accurate and concise terminal commands according to the user's request and specified format."
-        self.chat = self.model.start_chat(history=[role]) # Start with empty history
+        # Built once per process through LLMClientRegistry, cells share this instance
+        log.info("Using GeminiClient")
+        self._configure_gemini()
+
+        self.model = self.genai.GenerativeModel(self.MODEL_NAME)
+        super().__init__()
 
     def _configure_gemini(self):
-        """Loads API key and configures the Gemini library."""
+        """
+        Loads API key and configures the Gemini library.
+
+        Raises RuntimeError when it can't: the registry doesn't keep a client
+        that failed to build, and the error is shown by the cell that asked.
+        """
+        # The SDK pulls in grpc, protobuf and google-api-core: it is only
+        # imported here, when the first AI request builds the client
+        import google.generativeai as genai
+        self.genai = genai
+
         load_dotenv()  # Load environment variables from .env file
         api_key = os.getenv("GOOGLE_API_KEY")
 
         if not api_key:
-            print("Error: GOOGLE_API_KEY environment variable not set.")
-            print("Please create a .env file with GOOGLE_API_KEY=YOUR_API_KEY")
-            sys.exit(1) # Exit if key is missing
+            raise RuntimeError("GOOGLE_API_KEY environment variable not set. "
+                               "Please create a .env file with GOOGLE_API_KEY=YOUR_API_KEY")
 
         try:
             genai.configure(api_key=api_key)
-            print("Gemini API configured successfully.")
-            return True
         except Exception as e:
-            print(f"Error configuring Gemini API: {e}")
-            sys.exit(1)
-    
-    def decorate_request(self, request):
-        command = (
-            "**Task:** I need a terminal commands avoiding recipes to achieve the following:\n" +
-            request + "\n" +
-            "**Environment:**\n" +
-            "*   Operating System: Linux (Ubuntu 22.04)\n" +
-            "*   Shell: bash\n" +
-            "\n" +
-            "**Output Format Requirements:**\n" +
-            "Please provide the response *strictly* in the following Markdown format. Do not include any introductions, explanations, apologies, greetings, or sign-offs outside of this defined structure.\n" +
-            "\n" +
-            "--- START RESPONSE ---\n" +
-
-            "**Command:**\n" +
-            "```bash\n" +
-            "command \n" +
-            "```\n"
-        )
-        return command
-    
-    def decorate_error_request(self, command, error):
-        command = (
-            "**Task:** I received an error when running a terminal command and need you to return a new *comman* suggestion fixing the command:\n" +
-            command + "\n" +
-            "**Error:**\n" +
-            error + "\n"
-            "**Output Format Requirements:**\n" +
-            "Please provide the response *strictly* in the following Markdown format. Do not include any introductions, explanations, apologies, greetings, or sign-offs outside of this defined structure.\n" +
-            "\n" +
-            "--- START RESPONSE ---\n" +
+            log.error("Error configuring Gemini API: %s", e)
+            raise RuntimeError(f"Error configuring Gemini API: {e}") from e
+        log.info("Gemini API configured successfully.")
 
-            "**Command:**\n" +
-            "```bash\n" +
-            "command \n" +
-            "```\n"
-        )
-        return command
+    def _complete(self, prompt):
+        return self.model.generate_content(prompt).text
 
-    def send_request(self, request):
-        print("Received request: " + self.decorate_request(request))
-        response = self.model.generate_content(self.decorate_request(request))
-        print("Return response: " + response.text)
-        return response.text
+    def _complete_stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
 
-    def send_error_request(self, command, error):
-        print("Received error request: " + self.decorate_error_request(command, error))
-        response = self.model.generate_content(self.decorate_error_request(command, error))
-        print("Return error response: " + response.text)
-        return response.text                
+    def close(self):
+        """Drops the model handle, called by LLMClientRegistry.close()."""
+        self.model = None
+        super().close()
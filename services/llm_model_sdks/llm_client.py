@@ -0,0 +1,270 @@
+# services/llm_model_sdks/llm_client.py
+import asyncio
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterator
+from services import tracing
+from utils.constants import LLM_CACHE_DISABLED
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# "### Fix 2" header of the answer to a batched error request
+_FIX_HEADER = re.compile(r"^[^\w\n]*Fix\s+(\d+)[^\w\n]*$", re.MULTILINE | re.IGNORECASE)
+
+
+class LLMClient(ABC):
+    """
+    Base class of the model providers.
+
+    Owns everything that does not depend on the backend: the prompts, the
+    response cache, logging and the async wrappers. A provider only
+    implements `_complete` (and `_complete_stream` when it can stream);
+    cells only call the public methods, so any provider can be swapped in.
+    """
+
+    MODEL_NAME = ""
+    # Cached responses of a provider are only reused by that provider
+    PROVIDER = ""
+    CACHEABLE = True
+    ROLE = "**Role:** You are an expert command-line assistant. Your goal is to provide accurate and concise terminal commands according to the user's request and specified format."
+
+    def __init__(self):
+        self.cache = self._open_cache() if self.CACHEABLE and not LLM_CACHE_DISABLED else None
+
+    def _open_cache(self):
+        """Opens the on-disk response cache, running without it if that fails."""
+        try:
+            from services.response_cache import ResponseCache
+            return ResponseCache()
+        except Exception as e:
+            log.warning("Response cache disabled: %s", e)
+            return None
+
+    @property
+    def cache_name(self) -> str:
+        return f"{self.PROVIDER}:{self.MODEL_NAME}" if self.PROVIDER else self.MODEL_NAME
+
+    # --- Backend ---
+
+    @abstractmethod
+    def _complete(self, prompt: str) -> str:
+        """Sends a decorated prompt to the model and returns the full response."""
+
+    def _complete_stream(self, prompt: str) -> Iterator[str]:
+        """Yields the response chunk by chunk, providers that can't stream answer in one chunk."""
+        yield self._complete(prompt)
+
+    # --- Prompts ---
+
+    def decorate_request(self, request, context=""):
+        command = (
+            "**Task:** I need a terminal commands avoiding recipes to achieve the following:\n" +
+            request + "\n" +
+            "**Environment:**\n" +
+            "*   Operating System: Linux (Ubuntu 22.04)\n" +
+            "*   Shell: bash\n" +
+            "\n" +
+            ("**Session so far:**\n" + context + "\n\n" if context else "") +
+            "**Output Format Requirements:**\n" +
+            "Please provide the response *strictly* in the following Markdown format. Do not include any introductions, explanations, apologies, greetings, or sign-offs outside of this defined structure.\n" +
+            "\n" +
+            "--- START RESPONSE ---\n" +
+
+            "**Command:**\n" +
+            "```bash\n" +
+            "command \n" +
+            "```\n"
+        )
+        return command
+
+    def decorate_error_request(self, command, error):
+        command = (
+            "**Task:** I received an error when running a terminal command and need you to return a new *comman* suggestion fixing the command:\n" +
+            command + "\n" +
+            "**Error:**\n" +
+            error + "\n"
+            "**Output Format Requirements:**\n" +
+            "Please provide the response *strictly* in the following Markdown format. Do not include any introductions, explanations, apologies, greetings, or sign-offs outside of this defined structure.\n" +
+            "\n" +
+            "--- START RESPONSE ---\n" +
+
+            "**Command:**\n" +
+            "```bash\n" +
+            "command \n" +
+            "```\n"
+        )
+        return command
+
+    def decorate_batch_error_request(self, errors):
+        sections = "".join(
+            f"### Error {number}\n**Command:**\n{command}\n**Error:**\n{error}\n"
+            for number, (command, error) in enumerate(errors, 1)
+        )
+        command = (
+            "**Task:** I received errors when running several terminal commands and need you to return a new *command* suggestion fixing each of them:\n" +
+            sections +
+            "**Output Format Requirements:**\n" +
+            "Please provide the response *strictly* in the following Markdown format, with one section per error, numbered like the errors. Do not include any introductions, explanations, apologies, greetings, or sign-offs outside of this defined structure.\n" +
+            "\n" +
+            "--- START RESPONSE ---\n" +
+
+            "### Fix 1\n" +
+            "**Command:**\n" +
+            "```bash\n" +
+            "command \n" +
+            "```\n"
+        )
+        return command
+
+    @staticmethod
+    def split_batch_response(response: str, count: int) -> list[str | None]:
+        """Answer of a batched error request, per error (None where its section is missing)."""
+        parts: list[str | None] = [None] * count
+        headers = list(_FIX_HEADER.finditer(response))
+        for header, following in zip(headers, headers[1:] + [None]):
+            number = int(header.group(1))
+            text = response[header.end():following.start() if following else len(response)].strip()
+            if 1 <= number <= count and text:
+                parts[number - 1] = text + "\n"
+        return parts
+
+    # --- Cached generation ---
+
+    def _cached(self, prompt) -> str | None:
+        """Looks the prompt up in the response cache, timed as a hit or a miss."""
+        start = time.perf_counter()
+        cached = self.cache.get(prompt, self.cache_name)
+        tracing.get_tracer().record(
+            tracing.LLM_CACHE_HIT if cached is not None else tracing.LLM_CACHE_MISS,
+            time.perf_counter() - start, provider=self.cache_name,
+        )
+        return cached
+
+    def generate(self, prompt, use_cache=True):
+        """Returns the model response for a decorated prompt, from the cache when possible."""
+        if use_cache and self.cache:
+            cached = self._cached(prompt)
+            if cached is not None:
+                log.debug("Cache hit, skipping model request")
+                return cached
+
+        with tracing.get_tracer().span(tracing.LLM_NETWORK, provider=self.cache_name, streamed=False):
+            response = self._complete(prompt)
+        if self.cache:
+            self.cache.put(prompt, self.cache_name, response)
+        return response
+
+    def generate_stream(self, prompt, use_cache=True):
+        """Yields the model response chunk by chunk as it is generated."""
+        if use_cache and self.cache:
+            cached = self._cached(prompt)
+            if cached is not None:
+                log.debug("Cache hit, skipping model request")
+                yield cached
+                return
+
+        # Only the time spent waiting on the model: the consumer handles each chunk in between
+        waited = 0.0
+        text = ""
+        chunks = self._complete_stream(prompt)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            waited += time.perf_counter() - start
+            if chunk is None:
+                break
+            text += chunk
+            yield chunk
+        tracing.get_tracer().record(tracing.LLM_NETWORK, waited, provider=self.cache_name, streamed=True)
+        if self.cache:
+            self.cache.put(prompt, self.cache_name, text)
+
+    # --- Requests used by the cells ---
+
+    # Chat answers are cached under the whole prompt, session context included:
+    # "fix that" means something else once other commands ran, so a cached
+    # answer is only reused while the context it was given is the same.
+
+    def stream_request(self, request, use_cache=True, context=""):
+        prompt = self.decorate_request(request, context)
+        log.debug("Received streamed request: %s", prompt)
+        yield from self.generate_stream(prompt, use_cache)
+
+    def send_request(self, request, use_cache=True, context=""):
+        prompt = self.decorate_request(request, context)
+        log.debug("Received request: %s", prompt)
+        response = self.generate(prompt, use_cache)
+        log.debug("Return response: %s", response)
+        return response
+
+    def send_error_request(self, command, error, use_cache=True):
+        prompt = self.decorate_error_request(command, error)
+        log.debug("Received error request: %s", prompt)
+        response = self.generate(prompt, use_cache)
+        log.debug("Return error response: %s", response)
+        return response
+
+    def send_error_requests(self, errors, use_cache=True):
+        """
+        Fixes for several failed commands, with one model request.
+
+        Cached answers are reused, the other errors go in a single prompt
+        whose answer is split back per error (and cached as if each had been
+        asked alone). Errors missing from the answer are asked on their own.
+
+        Args:
+            errors (list): (command, error) pairs.
+
+        Returns:
+            list: One response per pair, in order.
+        """
+        responses: list[str | None] = [None] * len(errors)
+        if use_cache and self.cache:
+            for index, (command, error) in enumerate(errors):
+                responses[index] = self._cached(self.decorate_error_request(command, error))
+
+        missing = [index for index, response in enumerate(responses) if response is None]
+        if len(missing) > 1:
+            prompt = self.decorate_batch_error_request([errors[index] for index in missing])
+            log.debug("Received batched error request (%d errors): %s", len(missing), prompt)
+            with tracing.get_tracer().span(tracing.LLM_NETWORK, provider=self.cache_name, streamed=False, batch=len(missing)):
+                response = self._complete(prompt)
+            with tracing.get_tracer().span(tracing.LLM_PARSE, batch=len(missing)):
+                parts = self.split_batch_response(response, len(missing))
+            log.debug("Return batched error response: %d/%d fixes", sum(part is not None for part in parts), len(missing))
+            for index, part in zip(missing, parts):
+                if part is not None:
+                    responses[index] = part
+                    if self.cache:
+                        self.cache.put(self.decorate_error_request(*errors[index]), self.cache_name, part)
+
+        for index, response in enumerate(responses):
+            if response is None:
+                responses[index] = self.send_error_request(*errors[index], use_cache=False)
+        return responses
+
+    # --- Async variants, the blocking calls run on a worker thread ---
+
+    async def send_request_async(self, request, use_cache=True, context=""):
+        return await asyncio.to_thread(self.send_request, request, use_cache, context)
+
+    async def send_error_request_async(self, command, error, use_cache=True):
+        return await asyncio.to_thread(self.send_error_request, command, error, use_cache)
+
+    async def stream_request_async(self, request, use_cache=True, context="") -> AsyncIterator[str]:
+        """Async iterator over the streamed response, each chunk is fetched off the event loop."""
+        chunks = self.stream_request(request, use_cache, context)
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+    def close(self):
+        """Releases the connection and the cache, called by LLMClientRegistry.close()."""
+        if self.cache:
+            self.cache.close()
+            self.cache = None
@@ -0,0 +1,62 @@
+# services/llm_model_sdks/local/local_client.py
+import json
+import urllib.request
+from services.llm_model_sdks.llm_client import LLMClient
+from utils.constants import LLM_LOCAL_URL, LLM_LOCAL_MODEL, LLM_LOCAL_API_KEY, LLM_REQUEST_TIMEOUT
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class LocalClient(LLMClient):
+    """
+    Talks to an OpenAI-compatible chat completions endpoint.
+
+    That is the API served by llama.cpp's `llama-server`, Ollama, vLLM or
+    LM Studio, so a model running on the same machine can answer without
+    a round trip to a cloud API. Only the standard library is used.
+    """
+
+    PROVIDER = "local"
+
+    def __init__(self, base_url: str = LLM_LOCAL_URL, model: str = LLM_LOCAL_MODEL, api_key: str = LLM_LOCAL_API_KEY):
+        log.info("Using LocalClient (%s, %s)", base_url, model)
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.MODEL_NAME = model
+        self.api_key = api_key
+        super().__init__()
+
+    def _post(self, prompt: str, stream: bool):
+        body = {
+            "model": self.MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": self.ROLE},
+                {"role": "user", "content": prompt},
+            ],
+            "stream": stream,
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(body).encode("utf-8"), headers=headers)
+        return urllib.request.urlopen(request, timeout=LLM_REQUEST_TIMEOUT)
+
+    def _complete(self, prompt):
+        with self._post(prompt, stream=False) as response:
+            data = json.load(response)
+        return data["choices"][0]["message"]["content"] or ""
+
+    def _complete_stream(self, prompt):
+        # Server-sent events: one "data: {json}" line per chunk, then "data: [DONE]"
+        with self._post(prompt, stream=True) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    return
+                choices = json.loads(payload).get("choices") or [{}]
+                text = choices[0].get("delta", {}).get("content")
+                if text:
+                    yield text
@@ -0,0 +1,75 @@
+# services/llm_model_sdks/mock/mock_client.py
+import hashlib
+import re
+import time
+from services.llm_model_sdks.llm_client import LLMClient
+from utils.constants import LLM_MOCK_LATENCY
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# Canned answers, picked from the prompt so the same request always gets the same one
+_COMMANDS = [
+    "ls -la",
+    "df -h",
+    "du -sh * | sort -h",
+    "ps aux --sort=-%mem | head",
+    "find . -name '*.py' | wc -l",
+    "git status",
+]
+
+
+class MockClient(LLMClient):
+    """
+    Offline provider answering in the format of the real models.
+
+    Responses are deterministic and nothing leaves the machine, so the UI
+    and performance tests run without an API key or network. `latency`
+    seconds are spent before answering, split across the streamed chunks.
+    """
+
+    MODEL_NAME = "mock"
+    PROVIDER = "mock"
+    CACHEABLE = False # Answers are instant, caching would only hide the configured latency
+
+    def __init__(self, latency: float = LLM_MOCK_LATENCY, chunks: int = 4):
+        log.info("Using MockClient (latency %gs)", latency)
+        self.latency = latency
+        self.chunks = max(chunks, 1)
+        self.requests = 0
+        super().__init__()
+
+    def respond(self, prompt: str) -> str:
+        """The answer to a decorated prompt, without any delay."""
+        if "### Error 1\n" in prompt:
+            # Batched error request: one numbered fix per error
+            sections = re.findall(r"^### Error (\d+)\n\*\*Command:\*\*\n(.*)$", prompt, re.MULTILINE)
+            return "".join(f"### Fix {number}\n" + self._fix(command) for number, command in sections)
+        task = prompt.split("\n", 2)[1] if prompt.count("\n") >= 2 else prompt
+        if "**Error:**" in prompt:
+            return self._fix(task)
+        digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        commands = [_COMMANDS[digest % len(_COMMANDS)], _COMMANDS[(digest // 7) % len(_COMMANDS)]]
+        return "".join(f"**Command:**\n```bash\n{command}\n```\n" for command in dict.fromkeys(commands))
+
+    @staticmethod
+    def _fix(command: str) -> str:
+        # Error requests get the failed command back, with its first word checked
+        command = command.strip() or "true"
+        program = re.split(r"\s+", command, maxsplit=1)[0]
+        return f"**Command:**\n```bash\ntype {program} && {command}\n```\n"
+
+    def _complete(self, prompt):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(prompt)
+
+    def _complete_stream(self, prompt):
+        self.requests += 1
+        text = self.respond(prompt)
+        size = -(-len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            if self.latency:
+                time.sleep(self.latency / self.chunks)
+            yield text[start:start + size]
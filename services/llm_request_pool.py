@@ -0,0 +1,170 @@
+# services/llm_request_pool.py
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+from services import tracing
+from utils.constants import LLM_MAX_CONCURRENT_REQUESTS, LLM_REQUEST_TIMEOUT
+
+
+class LLMRequest:
+    """Handle for a model request submitted to the LLMRequestPool."""
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, on_result: Callable[[Any], None] | None,
+                 on_error: Callable[[BaseException], None] | None, timeout: float | None):
+        self.fn = fn
+        self.args = args
+        self.on_result = on_result
+        self.on_error = on_error
+        self.timeout = timeout
+        # Resolved exactly once: with the response, an exception, or cancelled
+        self.future: Future = Future()
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self.submitted = time.perf_counter()
+
+    def cancel(self) -> bool:
+        """
+        Cancels the request.
+
+        A queued request never runs. A request already waiting on the model
+        can't be interrupted, but its response is dropped and no callback fires.
+        """
+        with self._lock:
+            if self.future.done():
+                return False
+            self.future.cancel()
+            self.future.set_running_or_notify_cancel()
+        self._stop_timer()
+        return True
+
+    def cancelled(self) -> bool:
+        return self.future.cancelled()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: float | None = None) -> Any:
+        """Blocks until the response is available (mostly useful outside the UI)."""
+        return self.future.result(timeout)
+
+    def _run(self):
+        """Executed on a pool worker thread."""
+        with self._lock:
+            if self.future.cancelled():
+                return
+            tracing.get_tracer().record(tracing.LLM_QUEUE, time.perf_counter() - self.submitted)
+            if self.timeout:
+                self._timer = threading.Timer(self.timeout, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+        try:
+            response = self.fn(*self.args)
+        except BaseException as e:
+            self._finish(error=e)
+        else:
+            self._finish(result=response)
+
+    def _expire(self):
+        self._finish(error=TimeoutError(f"LLM request timed out after {self.timeout:g}s"))
+
+    def _stop_timer(self):
+        if self._timer:
+            self._timer.cancel()
+
+    def _finish(self, result: Any = None, error: BaseException | None = None):
+        """Resolves the future and fires the callback, first caller wins."""
+        with self._lock:
+            if self.future.done():
+                return # Cancelled or timed out, drop the late response
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+        self._stop_timer()
+
+        if error is not None:
+            if self.on_error:
+                self.on_error(error)
+        elif self.on_result:
+            self.on_result(result)
+
+
+class LLMRequestPool:
+    """
+    Runs model requests on a bounded worker pool so the UI never waits on them.
+
+    Requests beyond `max_concurrent` wait in the executor queue. Results are
+    delivered through callbacks (called on a worker thread) or the returned
+    request handle's future.
+    """
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT_REQUESTS, timeout: float | None = LLM_REQUEST_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="llm-request")
+        self._pending: set[LLMRequest] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args,
+               on_result: Callable[[Any], None] | None = None,
+               on_error: Callable[[BaseException], None] | None = None,
+               timeout: float | None = None) -> LLMRequest:
+        """
+        Queues `fn(*args)` and returns a handle to it.
+
+        Args:
+            fn (Callable): The blocking call, e.g. GeminiClient.send_request.
+            on_result (Callable): Called with the response when it succeeds.
+            on_error (Callable): Called with the exception on failure or timeout.
+            timeout (float): Seconds allowed once running, defaults to the pool's.
+        """
+        request = LLMRequest(fn, args, on_result, on_error, timeout if timeout is not None else self.timeout)
+        with self._lock:
+            self._pending.add(request)
+        request.future.add_done_callback(lambda _: self._forget(request))
+        self._executor.submit(request._run)
+        return request
+
+    def pending_count(self) -> int:
+        """Number of requests queued or waiting on the model."""
+        with self._lock:
+            return len(self._pending)
+
+    def cancel_all(self):
+        with self._lock:
+            pending = list(self._pending)
+        for request in pending:
+            request.cancel()
+
+    def shutdown(self):
+        """Cancels everything still pending and stops the workers."""
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget(self, request: LLMRequest):
+        with self._lock:
+            self._pending.discard(request)
+
+
+_default_pool: LLMRequestPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def get_request_pool() -> LLMRequestPool:
+    """Returns the process-wide request pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = LLMRequestPool()
+        return _default_pool
+
+
+
+def shutdown_request_pool():
+    """Teardown hook: stops the shared pool if it was ever started."""
+    global _default_pool
+    with _default_pool_lock:
+        pool, _default_pool = _default_pool, None
+    if pool is not None:
+        pool.shutdown()
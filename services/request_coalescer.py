@@ -0,0 +1,165 @@
+# services/request_coalescer.py
+import threading
+import weakref
+from typing import Callable
+from services.llm_model_sdks.client_registry import LLMClientRegistry, get_client_registry
+from services.llm_request_pool import LLMRequest, get_request_pool
+from utils.constants import LLM_COALESCE_WINDOW, LLM_COALESCE_MAX_BATCH
+
+
+class _Batch:
+    """Error requests sent to the model as one prompt, in arrival order."""
+
+    def __init__(self):
+        # Identical requests share their entry, each caller keeps its own handle
+        self.requests: dict[tuple[str, str], list[LLMRequest]] = {}
+        self.timer: threading.Timer | None = None
+        self.resolved = False
+
+
+class ErrorRequestCoalescer:
+    """
+    Merges the "Ask AI" error requests made at about the same time.
+
+    A request made while no other one is gathered or being answered goes
+    to the model right away. Requests made meanwhile are gathered for up
+    to `window` seconds (less once `max_batch` of them joined), then sent
+    as one multi-error prompt whose answer is split back per error.
+    Identical requests, gathered or already in flight, share one answer
+    (single flight).
+
+    Requests wait here, not on the LLM request pool: only a batch ready to
+    go takes a pool worker, so batches aren't capped by the pool size.
+    """
+
+    def __init__(self, registry: LLMClientRegistry, window: float = LLM_COALESCE_WINDOW,
+                 max_batch: int = LLM_COALESCE_MAX_BATCH):
+        self.registry = registry
+        self.window = window
+        self.max_batch = max(max_batch, 1)
+        self._batch: _Batch | None = None # Still gathering requests
+        self._inflight: dict[tuple[str, str], _Batch] = {} # Gathered or being answered
+        self._sending = 0 # Batches handed to the pool and not answered yet
+        self._lock = threading.Lock()
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.deduplicated = 0
+
+    def submit(self, command: str, error: str,
+               on_result: Callable[[str], None] | None = None,
+               on_error: Callable[[BaseException], None] | None = None) -> LLMRequest:
+        """
+        Asks for a fix of `command` failing with `error`, without blocking.
+
+        Returns:
+            LLMRequest: Handle resolved with the suggestion, the callbacks
+                        fire like for LLMRequestPool.submit(). Cancelling it
+                        drops the answer, and the error from the batch if it
+                        isn't sent yet.
+        """
+        key = (command, error)
+        # Not run by the pool: the batch it joins resolves it
+        request = LLMRequest(None, key, on_result, on_error, None)
+        send = None
+        with self._lock:
+            self.requests += 1
+            batch = self._inflight.get(key)
+            if batch is not None:
+                self.deduplicated += 1
+                batch.requests[key].append(request)
+                return request
+            if self._batch is None:
+                self._batch = _Batch()
+                if not self._sending or self.window <= 0:
+                    send = self._batch # Nothing to wait for
+            batch = self._batch
+            batch.requests[key] = [request]
+            self._inflight[key] = batch
+            if len(batch.requests) >= self.max_batch:
+                send = batch
+            if send is not None:
+                self._batch = None # Closed, the next request opens a new one
+                self._sending += 1
+            elif batch.timer is None:
+                batch.timer = threading.Timer(self.window, self._flush, (batch,))
+                batch.timer.daemon = True
+                batch.timer.start()
+        if send is not None:
+            self._submit(send)
+        return request
+
+    def send_error_request(self, command: str, error: str) -> str:
+        """Same as the client's send_error_request, coalesced with the concurrent ones."""
+        return self.submit(command, error).result()
+
+    def _flush(self, batch: _Batch):
+        """The window of `batch` is over."""
+        with self._lock:
+            if self._batch is not batch:
+                return # Sent when it got full
+            self._batch = None
+            self._sending += 1
+        self._submit(batch)
+
+    def _submit(self, batch: _Batch):
+        if batch.timer is not None:
+            batch.timer.cancel()
+        try:
+            get_request_pool().submit(self._send, batch, on_error=lambda e: self._resolve(batch, error=e))
+        except RuntimeError as e: # The pool is shut down
+            self._resolve(batch, error=e)
+
+    def _send(self, batch: _Batch):
+        """Executed on a pool worker thread."""
+        with self._lock:
+            # Errors every caller gave up on aren't worth asking about, the next identical request starts afresh
+            for key, requests in list(batch.requests.items()):
+                if all(request.cancelled() for request in requests):
+                    del batch.requests[key]
+                    if self._inflight.get(key) is batch:
+                        del self._inflight[key]
+            errors = list(batch.requests)
+            if errors:
+                self.batches += 1
+        responses = None
+        if len(errors) == 1:
+            responses = [self.registry.get().send_error_request(*errors[0])]
+        elif errors:
+            responses = self.registry.get().send_error_requests(errors)
+        self._resolve(batch, dict(zip(errors, responses or [])))
+
+    def _resolve(self, batch: _Batch, responses: dict | None = None, error: BaseException | None = None):
+        with self._lock:
+            if batch.resolved:
+                return # Timed out, then answered
+            batch.resolved = True
+            self._sending -= 1
+            for key in batch.requests:
+                if self._inflight.get(key) is batch:
+                    del self._inflight[key]
+            requests = [(key, list(requests)) for key, requests in batch.requests.items()]
+        for key, waiting in requests:
+            for request in waiting:
+                if error is not None:
+                    request._finish(error=error)
+                else:
+                    request._finish(result=responses[key])
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "batches": self.batches, "deduplicated": self.deduplicated}
+
+
+_coalescers: "weakref.WeakKeyDictionary[LLMClientRegistry, ErrorRequestCoalescer]" = weakref.WeakKeyDictionary()
+_coalescers_lock = threading.Lock()
+
+
+def get_error_coalescer(registry: LLMClientRegistry | None = None) -> ErrorRequestCoalescer:
+    """Returns the coalescer of a client registry (the app's by default), creating it on first use."""
+    registry = registry or get_client_registry()
+    with _coalescers_lock:
+        coalescer = _coalescers.get(registry)
+        if coalescer is None:
+            coalescer = _coalescers[registry] = ErrorRequestCoalescer(registry)
+        return coalescer
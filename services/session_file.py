@@ -0,0 +1,85 @@
+# services/session_file.py
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from models.session import CellRecord, SessionStore
+from services.conversation_context import Exchange
+
+# Bumped when the layout changes, older files are then refused
+FORMAT_VERSION = 1
+
+
+@dataclass
+class SavedSession:
+    """Contents of a session file."""
+    cwd: str
+    records: list[CellRecord]
+    exchanges: list[Exchange] = field(default_factory=list)
+    response: str | None = None # Last AI response, the one the cells came from
+    saved_at: float = field(default_factory=time.time)
+
+
+def save_session(path: str, session: SessionStore, exchanges: list[Exchange] = (), response: str | None = None):
+    """
+    Writes the session to a gzipped JSON file.
+
+    Cells still shown are saved with their command, working directory
+    before and after, exit code, duration and output, along with the chat
+    requests and the responses they got. The file is replaced atomically,
+    a crash while saving keeps the previous one.
+
+    Args:
+        path (str): File to write, its directory is created if needed.
+        session (SessionStore): Cells of the session.
+        exchanges (list[Exchange]): Chat requests and their responses.
+        response (str): Response the current cells were built from.
+    """
+    data = {
+        "version": FORMAT_VERSION,
+        "saved_at": time.time(),
+        "cwd": session.cwd,
+        "response": response,
+        "cells": [record for record in session.export() if not record.pop("deleted")],
+        "exchanges": [
+            {"request": e.request, "response": e.response, "commands": e.commands, "created_at": e.created_at}
+            for e in exchanges
+        ],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    # Outputs are mostly text repeating itself, gzip keeps the file small
+    with gzip.open(temporary, "wt", encoding="utf-8", compresslevel=6) as file:
+        json.dump(data, file, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def load_session(path: str) -> SavedSession:
+    """
+    Reads a file written by save_session().
+
+    Raises:
+        OSError: The file can't be read.
+        ValueError: It is not a session file, is malformed, or of another format version.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+    except (gzip.BadGzipFile, EOFError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"{path} is not a session file: {e}") from e
+    if not isinstance(data, dict) or data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported session file version {data.get('version') if isinstance(data, dict) else None}")
+
+    try:
+        records = []
+        for cell in data["cells"]:
+            output = cell.pop("output")
+            record = CellRecord(**cell)
+            record.output = output # Compressed again if large
+            records.append(record)
+        exchanges = [Exchange(**exchange) for exchange in data.get("exchanges", [])]
+        return SavedSession(data["cwd"], records, exchanges, data.get("response"), data.get("saved_at", 0))
+    except (KeyError, TypeError, AttributeError) as e:
+        # Missing or unknown fields, or values of the wrong type (edited by hand, truncated...)
+        raise ValueError(f"{path}: malformed session file: {e!r}") from e
@@ -0,0 +1,537 @@
+# services/shell_session.py
+import codecs
+import os
+import re
+import shlex
+import struct
+import subprocess
+import signal
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable
+from services.command_runner import (
+    CommandResult,
+    OutputBuffer,
+    RunControl,
+    child_processes,
+    escalate,
+    format_output,
+    limits_prefix,
+    signal_processes,
+)
+from services.terminal_buffer import TerminalBuffer
+from utils.constants import (
+    OUTPUT_SCROLLBACK_LINES,
+    OUTPUT_FLUSH_INTERVAL,
+    OUTPUT_READ_SIZE,
+    OUTPUT_PTY,
+    TERMINAL_COLUMNS,
+    TERMINAL_ROWS,
+    SHELL_PATH,
+    SHELL_POOL_SIZE,
+    COMMAND_STOP_GRACE_PERIOD,
+)
+
+try:
+    import fcntl
+    import termios
+except ImportError: # Not available on Windows, commands then only get pipes
+    fcntl = termios = None
+
+
+# Every shell still running, so they can all be ended when the app exits
+_live_sessions: "weakref.WeakSet[ShellSession]" = weakref.WeakSet()
+
+# Builtins and tools that can change the exported variables or functions of
+# the shell itself, anywhere in a command, and function definitions. Broad on
+# purpose: a false positive only costs one snapshot of the state.
+_STATE_CHANGE = re.compile(
+    r"(?:^|[\s;&|(){}`])(?:export|unset|source|\.|alias|unalias|declare|typeset|readonly|local|eval|set|"
+    r"shopt|function|activate|deactivate|conda|nvm|pyenv|rbenv|module)(?=[\s;&|)]|$)"
+    r"|\w\s*\(\s*\)"
+)
+
+
+class ShellSessionClosed(Exception):
+    """The shell process exited (e.g. the command ran `exit`)."""
+
+
+class _StreamState:
+    """Output of one pipe for the command currently running."""
+
+    def __init__(self, marker: str, buffer: OutputBuffer | TerminalBuffer, on_text: Callable[[str], None] | None = None):
+        self.marker = marker
+        self.buffer = buffer
+        self.on_text = on_text # Also gets the command's output, the sentinel excluded
+        self.pending = "" # Text held back in case it is the start of the marker
+        self.trailer = None # Text after the marker, once seen
+        self.done = threading.Event()
+
+    def feed(self, text: str):
+        if self.trailer is not None:
+            self.trailer += text
+            return
+        self.pending += text
+        index = self.pending.find(self.marker)
+        if index >= 0:
+            self._write(self.pending[:index])
+            self.trailer = self.pending[index + len(self.marker):]
+            self.pending = ""
+            return
+        # Only hold back a tail that could be the beginning of a marker split
+        # across chunks, so the end of a progress line still shows right away
+        keep = 0
+        start = max(len(self.pending) - len(self.marker) + 1, 0)
+        index = self.pending.find(self.marker[0], start)
+        while index >= 0:
+            if self.marker.startswith(self.pending[index:]):
+                keep = len(self.pending) - index
+                break
+            index = self.pending.find(self.marker[0], index + 1)
+        if len(self.pending) > keep:
+            self._write(self.pending[:len(self.pending) - keep])
+            self.pending = self.pending[len(self.pending) - keep:]
+
+    def _write(self, text: str):
+        self.buffer.write(text)
+        if self.on_text:
+            self.on_text(text)
+
+
+class ShellSession:
+    """
+    A long-lived bash process commands are sent to one at a time.
+
+    State changes (cd, export, source venv/bin/activate, conda activate...)
+    persist between commands and there is no fork+exec+startup cost per
+    command. After each command a sentinel carrying the exit status and the
+    working directory is printed on stdout, and another one on stderr, so the
+    end of its output is known without closing the pipes.
+
+    With `use_pty`, the stdout of commands is a pseudo-terminal instead of a
+    pipe, so programs checking isatty() keep their colors and progress bars.
+    stderr stays on its pipe: it is what marks a command as failed, and
+    error messages are told apart from the regular output.
+    """
+
+    def __init__(self, cwd: str | None = None, env: dict[str, str] | None = None, shell: str = SHELL_PATH,
+                 use_pty: bool = OUTPUT_PTY):
+        self.cwd = cwd or os.getcwd()
+        self.last_exit_code: int | None = None
+        # Set by commands that may have changed the environment or functions, until the next snapshot()
+        self.state_changed = False
+        self._marker = f"__AI_TERMINAL_{os.urandom(8).hex()}__"
+        self._lock = threading.Lock() # One command at a time
+        self._state_lock = threading.Lock()
+        self._streams: dict[str, _StreamState] | None = None
+        self._changed = threading.Event()
+        self._finished = threading.Event()
+
+        env = dict(os.environ if env is None else env)
+        self._pty_master = self._pty_slave = None
+        self._pty_path = None
+        if use_pty and termios is not None:
+            self._pty_master, self._pty_slave = os.openpty()
+            fcntl.ioctl(self._pty_slave, termios.TIOCSWINSZ, struct.pack("HHHH", TERMINAL_ROWS, TERMINAL_COLUMNS, 0, 0))
+            self._pty_path = os.ttyname(self._pty_slave)
+            env.setdefault("TERM", "xterm-256color")
+            # Nobody can answer a pager
+            env["PAGER"] = env["GIT_PAGER"] = "cat"
+
+        self.process = subprocess.Popen(
+            [shell, "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=env,
+            start_new_session=True, # Own process group, signals don't reach the app
+        )
+        self._readers = [
+            threading.Thread(target=self._read, args=(self.process.stdout.read1, "stdout"), daemon=True),
+            threading.Thread(target=self._read, args=(self.process.stderr.read1, "stderr"), daemon=True),
+        ]
+        if self._pty_master is not None:
+            # The slave stays open on our side so reads don't fail between commands
+            self._readers.append(
+                threading.Thread(target=self._read, args=(self._read_pty, "pty"), daemon=True)
+            )
+        for reader in self._readers:
+            reader.start()
+        _live_sessions.add(self)
+
+        # Commands run inside a function so a SIGINT trap can `return` out of
+        # them (aborting the rest of a list or a shell loop, like Ctrl+C);
+        # resource caps are inherited by everything the shell starts
+        self._send(f'__ai_terminal_run() {{ eval "$__ai_terminal_cmd"; }}\n{limits_prefix()}\n')
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    def _read_pty(self, size: int) -> bytes:
+        try:
+            return os.read(self._pty_master, size)
+        except OSError: # EIO once the terminal is closed
+            return b""
+
+    def _read(self, read: Callable[[int], bytes], name: str):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = read(OUTPUT_READ_SIZE)
+            if not chunk:
+                break
+            text = decoder.decode(chunk)
+            with self._state_lock:
+                if self._streams is not None and name in self._streams:
+                    state = self._streams[name]
+                    state.feed(text)
+                    # The stdout sentinel is complete once its line is
+                    if state.trailer is not None and (name != "stdout" or "\n" in state.trailer):
+                        self._mark_done(state)
+            self._changed.set()
+        # The shell exited: release a command waiting for its sentinels
+        with self._state_lock:
+            if self._streams is not None and name in self._streams:
+                self._mark_done(self._streams[name])
+        self._changed.set()
+
+    def _mark_done(self, state: _StreamState):
+        state.done.set()
+        if all(stream.done.is_set() for stream in self._streams.values()):
+            self._finished.set()
+
+    def _send(self, script: str):
+        try:
+            self.process.stdin.write(script.encode("utf-8"))
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise ShellSessionClosed("shell session is closed") from e
+
+    def run(self, command: str,
+            on_output: Callable[[str, bool], None] | None = None,
+            flush_interval: float = OUTPUT_FLUSH_INTERVAL,
+            scrollback_lines: int = OUTPUT_SCROLLBACK_LINES,
+            terminal: TerminalBuffer | None = None,
+            control: RunControl | None = None,
+            on_chunk: Callable[[str, str], None] | None = None) -> CommandResult:
+        """
+        Runs a command in the session, streaming its output like execute_command().
+
+        Args:
+            command (str): The command, it may span several lines.
+            on_output (Callable): Called with (text, has_stderr) while output keeps coming;
+                                  with a `terminal`, text only holds stderr.
+            flush_interval (float): Minimum seconds between two `on_output` calls.
+            scrollback_lines (int): Lines kept in memory per stream.
+            terminal (TerminalBuffer): Emulator the command's stdout goes to,
+                                       through the session's pseudo-terminal
+                                       when it has one.
+            control (RunControl): Stop handle and timeout of the command.
+            on_chunk (Callable): Called with (text, stream name) for every chunk
+                                 of the command's output, e.g. to index it.
+        """
+        with self._lock:
+            if not self.is_alive():
+                raise ShellSessionClosed("shell session is closed")
+            if _STATE_CHANGE.search(command):
+                self.state_changed = True
+            start = time.monotonic()
+            tee = (lambda name: (lambda text: on_chunk(text, name))) if on_chunk else (lambda name: None)
+            streams = {
+                "stdout": _StreamState(self._marker, OutputBuffer(scrollback_lines), tee("stdout")),
+                "stderr": _StreamState(self._marker, OutputBuffer(scrollback_lines), tee("stderr")),
+            }
+            redirect = "</dev/null"
+            output = streams["stdout"]
+            if terminal is not None and self._pty_path:
+                output = streams["pty"] = _StreamState(self._marker, terminal, tee("pty"))
+                redirect = f"</dev/null >{self._pty_path}"
+            elif terminal is not None:
+                streams["stdout"].buffer = terminal # Still strips the escape sequences
+            with self._state_lock:
+                self._streams = streams
+            self._changed.clear()
+            self._finished.clear()
+
+            # eval keeps a syntax error in the command from breaking the protocol,
+            # stdin is /dev/null so the command can't swallow the next ones.
+            # The trap is armed again each time, bash won't run it twice otherwise.
+            script = (
+                f"trap 'return 130 2>/dev/null' INT\n"
+                f"__ai_terminal_cmd={shlex.quote(command)}\n"
+                f"__ai_terminal_run {redirect}\n"
+                f"__ai_terminal_rc=$?\n"
+                f"printf '{self._marker}%s %s\\n' \"$__ai_terminal_rc\" \"$PWD\"\n"
+                f"printf '{self._marker}' >&2\n"
+            )
+            if "pty" in streams:
+                script += f"printf '{self._marker}' >{self._pty_path}\n"
+            self._send(script)
+            if control is not None:
+                control.start(self.interrupt)
+
+            # At most one batched update per flush interval, like execute_command()
+            while not self._finished.wait(flush_interval):
+                if on_output and self._changed.is_set():
+                    self._changed.clear()
+                    with self._state_lock:
+                        # A terminal is rendered by itself, no need to turn it into text every time
+                        stdout = "" if terminal is not None else output.buffer.get_text()
+                        text = format_output(stdout, streams["stderr"].buffer.get_text())
+                        has_stderr = bool(streams["stderr"].buffer)
+                    on_output(text, has_stderr)
+                if not self.is_alive():
+                    # `exit` or a killed shell: the pty never reaches EOF, stop waiting
+                    self._finished.wait(flush_interval)
+                    break
+            if control is not None:
+                control.finish()
+
+            with self._state_lock:
+                self._streams = None
+                trailer = streams["stdout"].trailer
+
+            if trailer is None:
+                # No sentinel: the shell exited while running the command
+                returncode = self.process.wait()
+            else:
+                status, _, cwd = trailer.split("\n", 1)[0].partition(" ")
+                returncode = int(status)
+                self.cwd = cwd or self.cwd
+            self.last_exit_code = returncode
+
+            return CommandResult(
+                command=command,
+                returncode=returncode,
+                stdout=output.buffer.get_text(),
+                stderr=streams["stderr"].buffer.get_text(),
+                duration=time.monotonic() - start,
+                cwd=self.cwd,
+            )
+
+    def interrupt(self, grace_period: float = COMMAND_STOP_GRACE_PERIOD):
+        """
+        Stops the running command: its processes get SIGINT, SIGTERM, then
+        SIGKILL. The shell itself survives with its state, it is only killed
+        if the command still doesn't end.
+        """
+        def send_signal(sig: int):
+            processes = child_processes(self.process.pid)
+            if sig == signal.SIGINT:
+                processes.append(self.process.pid) # Runs the trap aborting the command
+            signal_processes(processes, sig)
+
+        if not escalate(send_signal, self._finished.is_set, grace_period):
+            self.kill()
+
+    def kill(self):
+        """Kills the shell and every process of its group."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+
+    def snapshot(self) -> tuple[dict[str, str], str]:
+        """
+        Exported variables and function definitions of the session: what a
+        new shell needs to behave like this one after `export`, `source` or
+        a virtualenv activation.
+
+        They are written to files rather than read from the output of run(),
+        whose buffers split long lines.
+        """
+        paths = []
+        try:
+            for _ in range(2):
+                fd, path = tempfile.mkstemp(prefix="ai-terminal-state-")
+                os.close(fd)
+                paths.append(path)
+            env_path, functions_path = map(shlex.quote, paths)
+            self.run(f"command env -0 >{env_path}\n"
+                     f"for __ai_terminal_fn in $(compgen -A function); do\n"
+                     f"  [[ $__ai_terminal_fn == __ai_terminal_* ]] || declare -f -- \"$__ai_terminal_fn\"\n"
+                     f"done >{functions_path}\n"
+                     f"unset __ai_terminal_fn")
+            self.state_changed = False
+            with open(paths[0], "rb") as file:
+                data = file.read()
+            with open(paths[1], "rb") as file:
+                functions = os.fsdecode(file.read())
+        finally:
+            for path in paths:
+                os.unlink(path)
+        env = {}
+        for entry in data.split(b"\0"):
+            name, sep, value = entry.partition(b"=")
+            if sep and name:
+                # fsdecode keeps undecodable bytes, they get back to the next shell as they were
+                env[os.fsdecode(name)] = os.fsdecode(value)
+        return env, functions
+
+    def environment(self) -> dict[str, str]:
+        """Exported variables of the session (runs `env -0` in it)."""
+        return self.snapshot()[0]
+
+    def close(self):
+        """Ends the shell and everything it started, so no orphan keeps running."""
+        if self.process.poll() is None:
+            try:
+                # Whatever still runs gets a chance to clean up first
+                signal_processes(child_processes(self.process.pid), signal.SIGTERM)
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+        _live_sessions.discard(self)
+        for fd in (self._pty_slave, self._pty_master):
+            if fd is not None:
+                os.close(fd)
+        self._pty_master = self._pty_slave = None
+
+
+class ShellSessionPool:
+    """
+    Shell sessions of one notebook.
+
+    The primary session owns the notebook state (cwd, environment) and runs
+    commands whenever it is free. While it is busy, commands run in helper
+    sessions started in the primary's directory with its last known
+    environment and functions; a `cd` done in a helper is applied back to
+    the primary. That state is read back after the primary ran a command
+    that may have changed it (export, source, activate, a function
+    definition...), and an idle helper started before it last changed is
+    replaced by a new one before it runs anything.
+    """
+
+    def __init__(self, cwd: str | None = None, size: int = SHELL_POOL_SIZE):
+        self.size = size
+        self._initial_cwd = cwd
+        self._primary: ShellSession | None = None
+        self._helpers: list[ShellSession] = []
+        self._env_snapshot: dict[str, str] | None = None
+        self._functions = "" # Function definitions of the primary, defined again in new shells
+        self._state_version = 0 # Bumped whenever the two above change
+        self._helper_versions: dict[int, int] = {} # Helper id -> state version it started with
+        self._pending_cd: str | None = None
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._leased: set[int] = set()
+
+    def _ensure_primary(self) -> ShellSession:
+        if self._primary is None or not self._primary.is_alive():
+            # Started lazily, and restarted in the last known directory after `exit`
+            cwd = self._primary.cwd if self._primary else self._initial_cwd
+            self._primary = self._start_session(cwd)
+        return self._primary
+
+    def _start_session(self, cwd: str) -> ShellSession:
+        """A shell with the primary's last known environment and functions."""
+        session = ShellSession(cwd, self._env_snapshot)
+        if self._functions:
+            session.run(self._functions)
+        return session
+
+    @property
+    def cwd(self) -> str:
+        with self._lock:
+            return self._ensure_primary().cwd
+
+    @contextmanager
+    def lease(self):
+        """Borrows a free session for one command."""
+        session, is_primary = self._acquire()
+        start_cwd = session.cwd
+        try:
+            if is_primary and self._pending_cd:
+                pending, self._pending_cd = self._pending_cd, None
+                session.run(f"cd -- {shlex.quote(pending)}")
+            yield session
+        finally:
+            self._release(session, is_primary, start_cwd)
+
+    def _acquire(self) -> tuple[ShellSession, bool]:
+        with self._available:
+            while True:
+                primary = self._ensure_primary()
+                if id(primary) not in self._leased:
+                    self._leased.add(id(primary))
+                    return primary, True
+                for index, helper in enumerate(self._helpers):
+                    if id(helper) not in self._leased and helper.is_alive():
+                        helper = self._helpers[index] = self._sync_helper(helper, primary.cwd)
+                        self._leased.add(id(helper))
+                        return helper, False
+                if len(self._helpers) + 1 < self.size:
+                    helper = self._start_helper(primary.cwd)
+                    self._helpers.append(helper)
+                    self._leased.add(id(helper))
+                    return helper, False
+                self._available.wait()
+
+    def _start_helper(self, cwd: str) -> ShellSession:
+        helper = self._start_session(cwd)
+        self._helper_versions[id(helper)] = self._state_version
+        return helper
+
+    def _sync_helper(self, helper: ShellSession, cwd: str) -> ShellSession:
+        """Brings an idle helper to the primary's state, returns the session to use."""
+        if self._helper_versions.get(id(helper)) != self._state_version:
+            # Variables may have been unset and functions removed too: only a new shell is exact
+            self._helper_versions.pop(id(helper), None)
+            helper.close()
+            return self._start_helper(cwd)
+        if helper.cwd != cwd:
+            helper.run(f"cd -- {shlex.quote(cwd)}")
+        return helper
+
+    def _release(self, session: ShellSession, is_primary: bool, start_cwd: str):
+        if is_primary and session.state_changed and session.is_alive():
+            # Keep the state helpers start with up to date. Only after commands
+            # that may have changed it: a snapshot costs more than a small command.
+            try:
+                env, functions = session.snapshot()
+            except (ShellSessionClosed, OSError):
+                env = None
+            if env is not None:
+                with self._available:
+                    if functions != self._functions or _stable(env) != _stable(self._env_snapshot or {}):
+                        self._state_version += 1
+                    self._env_snapshot = env
+                    self._functions = functions
+        elif not is_primary and session.cwd != start_cwd:
+            self._pending_cd = session.cwd
+        with self._available:
+            self._leased.discard(id(session))
+            self._helpers = [helper for helper in self._helpers if helper.is_alive()]
+            live = {id(helper) for helper in self._helpers}
+            self._helper_versions = {key: version for key, version in self._helper_versions.items() if key in live}
+            self._available.notify()
+
+    def close(self):
+        """Teardown hook: ends every shell of the pool."""
+        with self._lock:
+            sessions = ([self._primary] if self._primary else []) + self._helpers
+            self._primary = None
+            self._helpers = []
+            self._helper_versions = {}
+        for session in sessions:
+            session.close()
+
+
+def _stable(env: dict[str, str]) -> dict[str, str]:
+    """The variables of `env` that bash doesn't change by itself with every command."""
+    return {name: value for name, value in env.items() if name not in ("_", "OLDPWD", "PWD", "SHLVL")}
+
+
+def close_all_sessions():
+    """Teardown hook: ends every shell session of the app."""
+    for session in list(_live_sessions):
+        session.close()
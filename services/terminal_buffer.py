@@ -0,0 +1,346 @@
+# services/terminal_buffer.py
+import re
+import threading
+from dataclasses import dataclass, replace
+from utils.constants import OUTPUT_SCROLLBACK_LINES, OUTPUT_MAX_LINE_LENGTH, TERMINAL_ROWS
+
+# Standard and bright ANSI colors (xterm palette)
+ANSI_COLORS = [
+    "#000000", "#cd3131", "#0dbc79", "#e5e510", "#2472c8", "#bc3fbc", "#11a8cd", "#e5e5e5",
+    "#666666", "#f14c4c", "#23d18b", "#f5f543", "#3b8eea", "#d670d6", "#29b8db", "#ffffff",
+]
+
+# Printable text between control characters and escape sequences
+_TEXT_RUN = re.compile(r"[^\x00-\x1f\x7f]+")
+
+
+def color_256(index: int) -> str:
+    """Hex value of an xterm 256-color palette entry."""
+    if index < 16:
+        return ANSI_COLORS[index]
+    if index < 232:
+        index -= 16
+        levels = [0, 95, 135, 175, 215, 255]
+        r, g, b = levels[index // 36], levels[(index // 6) % 6], levels[index % 6]
+        return f"#{r:02x}{g:02x}{b:02x}"
+    gray = 8 + (index - 232) * 10
+    return f"#{gray:02x}{gray:02x}{gray:02x}"
+
+
+@dataclass(frozen=True, slots=True)
+class Style:
+    """Text attributes set by SGR sequences, shared by every character drawn with them."""
+    fg: str | None = None
+    bg: str | None = None
+    bold: bool = False
+    italic: bool = False
+    underline: bool = False
+    inverse: bool = False
+
+
+DEFAULT_STYLE = Style()
+
+
+class TerminalBuffer:
+    """
+    Incremental VT100/ANSI terminal emulator for command output.
+
+    Text is parsed as it arrives (escape sequences may be split across
+    chunks) into lines of styled characters. Carriage returns, cursor
+    movement and line erasing update lines in place, so progress bars
+    redraw one line instead of printing hundreds. The numbers of the lines
+    changed since the last `take_dirty()` are tracked, letting the UI only
+    re-render those.
+
+    Same `write` / `get_text` interface as OutputBuffer, so it can be used
+    in its place.
+    """
+
+    def __init__(self, max_lines: int = OUTPUT_SCROLLBACK_LINES, rows: int = TERMINAL_ROWS,
+                 max_line_length: int = OUTPUT_MAX_LINE_LENGTH):
+        self.max_lines = max_lines
+        self.rows = rows # Screen height, for absolute cursor positions
+        self.max_line_length = max(max_line_length, 1)
+        self.chars: list[list[str]] = [[]]
+        self.styles: list[list[Style]] = [[]]
+        self.first_line = 0 # Absolute number of chars[0], grows as old lines are dropped
+        self.row = 0 # Cursor, relative to chars[0]
+        self.col = 0
+        self.style = DEFAULT_STYLE
+        self._saved_cursor = (0, 0)
+        self._dirty: set[int] = {0} # Absolute line numbers
+        # Parser state kept between chunks
+        self._state = "text"
+        self._sequence = ""
+        self._lock = threading.Lock()
+
+    @property
+    def dropped_lines(self) -> int:
+        return self.first_line
+
+    def write(self, text: str):
+        """Feeds decoded output to the emulator."""
+        with self._lock:
+            position = 0
+            length = len(text)
+            while position < length:
+                if self._state == "text":
+                    match = _TEXT_RUN.match(text, position)
+                    if match:
+                        self._put(match.group())
+                        position = match.end()
+                        continue
+                    self._control(text[position])
+                else:
+                    self._escape(text[position])
+                position += 1
+            self._trim()
+
+    # --- Parser ---
+
+    def _control(self, char: str):
+        if char == "\x1b":
+            self._state = "escape"
+        elif char == "\n":
+            self._move_to(self.row + 1, 0)
+        elif char == "\r":
+            self.col = 0
+        elif char == "\b":
+            self.col = max(self.col - 1, 0)
+        elif char == "\t":
+            self.col = min((self.col // 8 + 1) * 8, self.max_line_length)
+        # Bell and other control characters are ignored
+
+    def _escape(self, char: str):
+        state = self._state
+        if state == "escape":
+            if char == "[":
+                self._state, self._sequence = "csi", ""
+            elif char == "]":
+                self._state, self._sequence = "osc", ""
+            elif char in "()*+":
+                self._state = "charset" # Character set selection, next char is ignored
+            else:
+                if char == "7":
+                    self._saved_cursor = (self.row + self.first_line, self.col)
+                elif char == "8":
+                    self._restore_cursor()
+                self._state = "text"
+        elif state == "csi":
+            if "\x40" <= char <= "\x7e":
+                self._state = "text"
+                self._csi(self._sequence, char)
+            else:
+                self._sequence += char
+        elif state == "osc":
+            # Window title and the like, ends with BEL or ESC \
+            if char == "\x07" or (char == "\\" and self._sequence.endswith("\x1b")):
+                self._state = "text"
+            else:
+                self._sequence += char
+        else: # charset
+            self._state = "text"
+
+    def _csi(self, sequence: str, final: str):
+        if sequence.startswith(("?", ">", "=")):
+            return # Private modes (cursor visibility, bracketed paste...)
+        params = [int(p) if p.isdigit() else 0 for p in sequence.split(";")] if sequence else []
+        first = params[0] if params else 0
+        count = first or 1
+
+        if final == "m":
+            self._sgr(params or [0])
+        elif final == "K":
+            self._erase_line(first)
+        elif final == "J":
+            self._erase_display(first)
+        elif final == "A":
+            self._move_to(max(self.row - count, 0), self.col)
+        elif final == "B":
+            self._move_to(self.row + count, self.col)
+        elif final == "C":
+            self.col = min(self.col + count, self.max_line_length)
+        elif final == "D":
+            self.col = max(self.col - count, 0)
+        elif final == "E":
+            self._move_to(self.row + count, 0)
+        elif final == "F":
+            self._move_to(max(self.row - count, 0), 0)
+        elif final == "G":
+            self.col = min(count - 1, self.max_line_length)
+        elif final in "Hf":
+            # Rows are relative to the screen, the last `rows` lines
+            top = max(len(self.chars) - self.rows, 0)
+            column = params[1] if len(params) > 1 else 1
+            self._move_to(top + count - 1, max(column - 1, 0))
+        elif final == "s":
+            self._saved_cursor = (self.row + self.first_line, self.col)
+        elif final == "u":
+            self._restore_cursor()
+
+    def _sgr(self, params: list[int]):
+        style = self.style
+        index = 0
+        while index < len(params):
+            code = params[index]
+            if code == 0:
+                style = DEFAULT_STYLE
+            elif code == 1:
+                style = replace(style, bold=True)
+            elif code == 3:
+                style = replace(style, italic=True)
+            elif code == 4:
+                style = replace(style, underline=True)
+            elif code == 7:
+                style = replace(style, inverse=True)
+            elif code == 22:
+                style = replace(style, bold=False)
+            elif code == 23:
+                style = replace(style, italic=False)
+            elif code == 24:
+                style = replace(style, underline=False)
+            elif code == 27:
+                style = replace(style, inverse=False)
+            elif 30 <= code <= 37:
+                style = replace(style, fg=ANSI_COLORS[code - 30])
+            elif 90 <= code <= 97:
+                style = replace(style, fg=ANSI_COLORS[code - 90 + 8])
+            elif code == 39:
+                style = replace(style, fg=None)
+            elif 40 <= code <= 47:
+                style = replace(style, bg=ANSI_COLORS[code - 40])
+            elif 100 <= code <= 107:
+                style = replace(style, bg=ANSI_COLORS[code - 100 + 8])
+            elif code == 49:
+                style = replace(style, bg=None)
+            elif code in (38, 48):
+                # 38;5;n (256 colors) or 38;2;r;g;b (true color)
+                color = None
+                if index + 2 < len(params) and params[index + 1] == 5:
+                    color = color_256(min(params[index + 2], 255))
+                    index += 2
+                elif index + 4 < len(params) and params[index + 1] == 2:
+                    r, g, b = (min(value, 255) for value in params[index + 2:index + 5])
+                    color = f"#{r:02x}{g:02x}{b:02x}"
+                    index += 4
+                style = replace(style, fg=color) if code == 38 else replace(style, bg=color)
+            index += 1
+        self.style = style
+
+    # --- Screen operations ---
+
+    def _move_to(self, row: int, col: int):
+        # Positions come from the output: a huge one must not allocate lines or columns
+        # (a real terminal stops the cursor at the bottom right corner of its screen)
+        row = min(row, len(self.chars) - 1 + self.rows)
+        col = min(col, self.max_line_length)
+        while row >= len(self.chars):
+            self.chars.append([])
+            self.styles.append([])
+            self._dirty.add(self.first_line + len(self.chars) - 1)
+        self.row = row
+        self.col = col
+
+    def _restore_cursor(self):
+        row, col = self._saved_cursor
+        self._move_to(max(row - self.first_line, 0), col)
+
+    def _put(self, text: str):
+        while text:
+            if self.col >= self.max_line_length:
+                # A never-ending line wraps onto the next one, like OutputBuffer splits it
+                self._move_to(self.row + 1, 0)
+            line = self.chars[self.row]
+            styles = self.styles[self.row]
+            col = self.col
+            part, text = text[:self.max_line_length - col], text[self.max_line_length - col:]
+            end = col + len(part)
+            if col > len(line):
+                line.extend(" " * (col - len(line)))
+                styles.extend([DEFAULT_STYLE] * (col - len(styles)))
+            line[col:end] = part
+            styles[col:end] = [self.style] * len(part)
+            self.col = end
+            self._dirty.add(self.first_line + self.row)
+
+    def _erase_line(self, mode: int):
+        line = self.chars[self.row]
+        styles = self.styles[self.row]
+        if mode == 0:
+            del line[self.col:]
+            del styles[self.col:]
+        elif mode == 1:
+            end = min(self.col + 1, len(line))
+            line[:end] = " " * end
+            styles[:end] = [DEFAULT_STYLE] * end
+        else:
+            line.clear()
+            styles.clear()
+        self._dirty.add(self.first_line + self.row)
+
+    def _erase_display(self, mode: int):
+        if mode == 0:
+            self._erase_line(0)
+            removed = range(self.row + 1, len(self.chars))
+            del self.chars[self.row + 1:]
+            del self.styles[self.row + 1:]
+        elif mode == 1:
+            for row in range(self.row):
+                self.chars[row].clear()
+                self.styles[row].clear()
+            removed = range(self.row)
+        else:
+            # A log has no fixed screen, clearing it starts over from an empty one
+            removed = range(1, len(self.chars))
+            self.chars = [[]]
+            self.styles = [[]]
+            self.row = 0
+        self._dirty.update(self.first_line + row for row in removed)
+        self._dirty.add(self.first_line + self.row)
+
+    def _trim(self):
+        extra = len(self.chars) - self.max_lines
+        if extra > 0:
+            del self.chars[:extra]
+            del self.styles[:extra]
+            self.first_line += extra
+            self.row = max(self.row - extra, 0)
+
+    # --- Reading ---
+
+    def line_count(self) -> int:
+        with self._lock:
+            return len(self.chars)
+
+    def line_spans(self, number: int) -> list[tuple[str, Style]]:
+        """Runs of same-style text of a line, by absolute line number."""
+        with self._lock:
+            index = number - self.first_line
+            if not 0 <= index < len(self.chars):
+                return []
+            chars, styles = self.chars[index], self.styles[index]
+            spans = []
+            start = 0
+            for position in range(1, len(chars) + 1):
+                if position == len(chars) or styles[position] != styles[start]:
+                    spans.append(("".join(chars[start:position]), styles[start]))
+                    start = position
+            return spans
+
+    def take_dirty(self) -> list[int]:
+        """Absolute numbers of the lines changed since the last call, in order."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return sorted(dirty)
+
+    def get_text(self) -> str:
+        """Plain text, escape sequences and styles removed."""
+        with self._lock:
+            text = "\n".join("".join(line).rstrip() for line in self.chars).rstrip("\n")
+            if self.first_line:
+                text = f"[... {self.first_line} earlier lines dropped ...]\n{text}"
+            return text
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return any(self.chars)
@@ -0,0 +1,241 @@
+# services/tracing.py
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from utils.constants import TRACE_ENABLED, TRACE_BUFFER_SPANS
+
+# Stage names, the performance panel lists them in this order
+COMMAND_SPAWN = "command.spawn" # Starting the process, or waiting for a shell session
+COMMAND_FIRST_BYTE = "command.first_byte" # From the start of the run to its first output
+COMMAND_TOTAL = "command.total"
+LLM_QUEUE = "llm.queue" # Waiting for a request pool worker
+LLM_NETWORK = "llm.network" # The model answering, until its last chunk
+LLM_PARSE = "llm.parse" # Turning a response into commands
+LLM_CACHE_HIT = "llm.cache_hit"
+LLM_CACHE_MISS = "llm.cache_miss"
+UI_UPDATE = "ui.update" # Rendering the output of a cell
+UI_FLUSH = "ui.flush" # page.update() of the view
+STAGES = [COMMAND_SPAWN, COMMAND_FIRST_BYTE, COMMAND_TOTAL, LLM_QUEUE, LLM_NETWORK, LLM_PARSE,
+          LLM_CACHE_HIT, LLM_CACHE_MISS, UI_UPDATE, UI_FLUSH]
+
+
+class Span:
+    """A timed operation: what it was, when it started and how long it took."""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "duration_ns", "attributes")
+
+    def __init__(self, name: str, trace_id: int, span_id: int, parent_id: int | None, start_ns: int,
+                 attributes: dict | None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns # Wall clock, for the exported files
+        self.duration_ns = 0
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """Adds attributes known once the operation is under way (exit code, bytes...)."""
+        if self.attributes is None:
+            self.attributes = attributes
+        else:
+            self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": f"{self.parent_id:016x}" if self.parent_id is not None else None,
+            "start_unix_ns": self.start_ns,
+            "duration_ms": self.duration_ns / 1e6,
+            "attributes": self.attributes or {},
+        }
+
+
+class _ActiveSpan:
+    """Context manager timing a span, nested ones become its children."""
+    __slots__ = ("tracer", "span", "start")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.tracer._stack().append(self.span)
+        self.start = time.perf_counter_ns()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration_ns = time.perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.span.set(error=exc_type.__name__)
+        self.tracer._stack().pop()
+        self.tracer._spans.append(self.span)
+        return False
+
+
+class _NoSpan:
+    """Stands in for spans while tracing is off: nothing is timed or kept."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Records timing spans in a ring buffer.
+
+    Recording a span is a couple of clock reads and a deque append (atomic,
+    so no lock): cheap enough for every command, chunk flush and request.
+    Only the last `capacity` spans are kept; they are summarized per stage
+    by stage_stats() and can be exported as JSON or OTLP-style JSON.
+    """
+
+    def __init__(self, capacity: int = TRACE_BUFFER_SPANS, enabled: bool = TRACE_ENABLED):
+        self.enabled = enabled and capacity > 0
+        self._spans: deque[Span] = deque(maxlen=max(capacity, 1))
+        self._ids = itertools.count(1)
+        # Trace ids are unique across runs of the app, span ids within one
+        self._trace_base = int.from_bytes(os.urandom(8), "big") << 64
+        self._local = threading.local()
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _new_span(self, name: str, attributes: dict | None, start_ns: int) -> Span:
+        stack = self._stack()
+        span_id = next(self._ids)
+        if stack:
+            parent = stack[-1]
+            return Span(name, parent.trace_id, span_id, parent.span_id, start_ns, attributes)
+        return Span(name, self._trace_base | span_id, span_id, None, start_ns, attributes)
+
+    def span(self, name: str, **attributes):
+        """
+        Times the `with` block it is used in:
+
+            with tracer.span(COMMAND_SPAWN, shell=False) as span:
+                ...
+                span.set(pid=process.pid)
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _ActiveSpan(self, self._new_span(name, attributes or None, time.time_ns()))
+
+    def record(self, name: str, seconds: float, **attributes):
+        """Adds a span measured by the caller (e.g. across threads), ending now."""
+        if not self.enabled:
+            return
+        duration_ns = int(seconds * 1e9)
+        span = self._new_span(name, attributes or None, time.time_ns() - duration_ns)
+        span.duration_ns = duration_ns
+        self._spans.append(span)
+
+    def spans(self) -> list[Span]:
+        """The spans still in the buffer, oldest first."""
+        while True:
+            try:
+                return list(self._spans)
+            except RuntimeError:
+                continue # Appended to while copying, try again
+
+    def clear(self):
+        self._spans.clear()
+
+    def stage_stats(self) -> dict[str, dict]:
+        """Count, p50, p95 and max duration (ms) of each stage in the buffer."""
+        durations: dict[str, list[int]] = {}
+        for span in self.spans():
+            durations.setdefault(span.name, []).append(span.duration_ns)
+        order = {name: index for index, name in enumerate(STAGES)}
+        stats = {}
+        for name in sorted(durations, key=lambda name: (order.get(name, len(order)), name)):
+            values = sorted(durations[name])
+            last = len(values) - 1
+            stats[name] = {
+                "count": len(values),
+                "p50_ms": values[round(0.5 * last)] / 1e6,
+                "p95_ms": values[round(0.95 * last)] / 1e6,
+                "max_ms": values[-1] / 1e6,
+            }
+        return stats
+
+    # --- Export ---
+
+    def export(self, path: str, format: str = "json") -> int:
+        """
+        Writes the buffered spans to `path`, returns how many.
+
+        Args:
+            path (str): File to write, its directory is created if needed.
+            format (str): "json" for a list of spans with the per stage
+                          statistics, "otlp" for the OpenTelemetry JSON
+                          layout (resourceSpans), readable by its tools.
+        """
+        spans = self.spans()
+        if format == "otlp":
+            data = self._otlp(spans)
+        elif format == "json":
+            data = {"stats": self.stage_stats(), "spans": [span.to_dict() for span in spans]}
+        else:
+            raise ValueError(f"Unknown trace format {format!r}, expected json or otlp")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+        return len(spans)
+
+    @staticmethod
+    def _otlp(spans: list[Span]) -> dict:
+        def value(item):
+            if isinstance(item, bool):
+                return {"boolValue": item}
+            if isinstance(item, int):
+                return {"intValue": str(item)}
+            if isinstance(item, float):
+                return {"doubleValue": item}
+            return {"stringValue": str(item)}
+
+        def otlp_span(span: Span) -> dict:
+            data = {
+                "traceId": f"{span.trace_id:032x}",
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1, # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.start_ns + span.duration_ns),
+                "attributes": [{"key": key, "value": value(item)} for key, item in (span.attributes or {}).items()],
+            }
+            if span.parent_id is not None:
+                data["parentSpanId"] = f"{span.parent_id:016x}"
+            return data
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "ai-terminal"}}]},
+            "scopeSpans": [{"scope": {"name": "ai-terminal"}, "spans": [otlp_span(span) for span in spans]}],
+        }]}
+
+
+# Built at import: it is only a deque, and the hot paths skip the lock of a lazy getter
+_default_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Returns the tracer shared by the whole app."""
+    return _default_tracer
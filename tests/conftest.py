@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Modules are imported from the repository root, like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Caches, history and session files of the tests never touch the user's ones
+os.environ["AI_TERMINAL_CACHE_DIR"] = tempfile.mkdtemp(prefix="ai-terminal-tests-")
+os.environ.pop("AI_TERMINAL_NO_CACHE", None)
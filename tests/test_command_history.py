@@ -0,0 +1,86 @@
+# tests/test_command_history.py
+import math
+import pytest
+from services import command_history
+from services.command_history import CommandHistory, bump_rank
+
+HALF_LIFE = 100.0
+
+
+def score(rank, now):
+    return 2 ** (rank - now / HALF_LIFE)
+
+
+def test_bump_rank_adds_decayed_runs():
+    rank = bump_rank(None, 0, half_life=HALF_LIFE)
+    assert score(rank, 0) == pytest.approx(1)
+    # One half-life later the first run counts half
+    rank = bump_rank(rank, HALF_LIFE, half_life=HALF_LIFE)
+    assert score(rank, HALF_LIFE) == pytest.approx(1.5)
+    rank = bump_rank(rank, HALF_LIFE, weight=0.25, half_life=HALF_LIFE)
+    assert score(rank, HALF_LIFE) == pytest.approx(1.75)
+
+
+def test_ranks_keep_their_order_over_time():
+    frequent = None
+    for now in range(5):
+        frequent = bump_rank(frequent, now, half_life=HALF_LIFE)
+    recent = bump_rank(None, 4, half_life=HALF_LIFE)
+    assert frequent > recent
+    # A run much later outranks many old ones
+    assert bump_rank(None, 10 * HALF_LIFE, half_life=HALF_LIFE) > frequent
+    assert math.isfinite(bump_rank(frequent, 1e9, half_life=HALF_LIFE))
+
+
+@pytest.fixture
+def history():
+    history = CommandHistory(":memory:", half_life=HALF_LIFE)
+    yield history
+    history.close()
+
+
+def test_suggest_by_frecency(history):
+    for _ in range(3):
+        history.record("git status", "/tmp", 0, 0.1)
+    history.record("git stash", "/tmp", 0, 0.1)
+    history.record("git log", "/tmp", 1, 0.1)
+    history.record("git log", "/tmp", 1, 0.1)
+    history.load()
+    assert history.suggest("git s") == ["git status", "git stash"]
+    # Failures count less: two failed runs are behind one successful run
+    assert history.suggest("gi") == ["git status", "git stash", "git log"]
+    # The command typed in full isn't suggested back
+    assert history.suggest("git stash") == []
+
+
+def test_index_follows_new_runs(history):
+    history.record("make test", "/tmp", 0, 1.0)
+    history.load()
+    for _ in range(2):
+        history.record("make build", "/tmp", 0, 1.0)
+    assert history.suggest("make") == ["make build", "make test"]
+    assert history.runs("make build")[0]["exit_code"] == 0
+
+
+def test_substring_search(history):
+    history.record("docker compose up -d", "/tmp", 0, 1.0)
+    history.record("ls", "/tmp", 0, 1.0)
+    history.load()
+    assert history.suggest("compose") == ["docker compose up -d"]
+    assert history.search("up docker") == ["docker compose up -d"]
+
+
+def test_eviction_keeps_the_best_commands(history, monkeypatch):
+    monkeypatch.setattr(command_history, "EVICT_EVERY", 10)
+    history.max_commands = 3
+    history.max_runs = 5
+    history.load()
+    for _ in range(3):
+        history.record("kept", "/tmp", 0, 0.1)
+    for number in range(7):
+        history.record(f"once {number}", "/tmp", 0, 0.1)
+    conn = history._connect()
+    commands = [row[0] for row in conn.execute("SELECT command FROM commands ORDER BY rank DESC")]
+    assert len(commands) == 3 and commands[0] == "kept"
+    assert conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 5
+    assert history.suggest("once") == [command for command in commands if command.startswith("once")]
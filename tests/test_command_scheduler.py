@@ -0,0 +1,73 @@
+# tests/test_command_scheduler.py
+import threading
+import pytest
+from services.command_executor import CommandExecutor
+from services.command_scheduler import DONE, FAILED, SKIPPED, CommandScheduler, build_dependencies, is_barrier
+
+
+@pytest.mark.parametrize("command", ["cd build", "export A=1", "sudo apt-get install -y jq", "pip install rich",
+                                     "git clone repo", "rm -rf out  # sequential", "source .venv/bin/activate"])
+def test_barriers(command):
+    assert is_barrier(command)
+
+
+@pytest.mark.parametrize("command", ["ls -la", "make test", "git status", "echo cd", "pip list"])
+def test_not_barriers(command):
+    assert not is_barrier(command)
+
+
+def test_dependencies_between_barriers():
+    commands = ["ls", "pwd", "cd src", "make", "make test", "export X=1", "echo $X"]
+    assert build_dependencies(commands) == [set(), set(), {0, 1}, {2}, {2}, {0, 1, 2, 3, 4}, {5}]
+
+
+def test_after_annotation():
+    commands = ["make", "make docs", "make test  # after: 1, 2", "ls  # after: 9"]
+    assert build_dependencies(commands) == [set(), set(), {0, 1}, set()]
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(max_workers=4)
+    yield executor
+    executor.shutdown()
+
+
+def test_steps_wait_for_their_barrier(executor):
+    started = []
+    lock = threading.Lock()
+
+    def run_step(index):
+        with lock:
+            started.append(index)
+        return True
+
+    commands = ["ls", "pwd", "cd src", "make", "make test"]
+    status = CommandScheduler(executor).run(len(commands), build_dependencies(commands), run_step)
+    assert status == [DONE] * 5
+    assert started.index(2) > max(started.index(0), started.index(1))
+    assert started.index(2) < min(started.index(3), started.index(4))
+
+
+def test_failure_skips_dependents(executor):
+    deps = [set(), {0}, set()]
+    status = CommandScheduler(executor, stop_on_failure=False).run(3, deps, lambda index: index != 0)
+    assert status == [FAILED, SKIPPED, DONE]
+
+
+def test_stop_on_failure(executor):
+    deps = [set(), {0}, {1}]
+    status = CommandScheduler(executor).run(3, deps, lambda index: index != 0)
+    assert status == [FAILED, SKIPPED, SKIPPED]
+
+
+def test_exception_counts_as_failure(executor):
+    def run_step(index):
+        raise RuntimeError("boom")
+    assert CommandScheduler(executor).run(1, [set()], run_step) == [FAILED]
+
+
+def test_status_notifications(executor):
+    seen = []
+    CommandScheduler(executor).run(1, [set()], lambda index: True, lambda index, status: seen.append(status))
+    assert seen == ["queued", "running", "done"]
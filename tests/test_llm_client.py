@@ -0,0 +1,77 @@
+# tests/test_llm_client.py
+import pytest
+from services.llm_model_sdks.llm_client import LLMClient
+from services.llm_model_sdks.mock.mock_client import MockClient
+from services.response_cache import ResponseCache, make_key
+
+
+class CachedMockClient(MockClient):
+    CACHEABLE = True
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = CachedMockClient(latency=0)
+    client.cache.close()
+    client.cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    yield client
+    client.close()
+
+
+def test_split_batch_response():
+    response = "### Fix 1\n**Command:**\n```bash\nls\n```\n\n**Fix 3:**\n```bash\npwd\n```\n"
+    assert LLMClient.split_batch_response(response, 3) == ["**Command:**\n```bash\nls\n```\n", None, "```bash\npwd\n```\n"]
+
+
+def test_split_batch_response_ignores_out_of_range_and_empty_sections():
+    response = "### Fix 2\n\n### Fix 7\nstray\nFix 1\nfirst"
+    assert LLMClient.split_batch_response(response, 2) == ["first\n", None]
+    assert LLMClient.split_batch_response("no headers at all", 2) == [None, None]
+
+
+def test_split_batch_response_of_the_mock_answer():
+    client = MockClient(latency=0)
+    prompt = client.decorate_batch_error_request([("gti status", "not found"), ("pyhton x.py", "not found")])
+    parts = LLMClient.split_batch_response(client.respond(prompt), 2)
+    assert [part.splitlines()[2] for part in parts] == ["type gti && gti status", "type pyhton && pyhton x.py"]
+
+
+def test_same_context_is_a_cache_hit(client):
+    first = client.send_request("undo that", context="$ git commit -m wip")
+    assert client.send_request("undo that", context="$ git commit -m wip") == first
+    assert client.requests == 1
+    assert client.cache.hits == 1
+
+
+def test_other_context_is_a_cache_miss(client):
+    client.send_request("undo that", context="$ git commit -m wip")
+    client.send_request("undo that", context="$ tar xzf archive.tgz")
+    client.send_request("undo that")
+    assert client.requests == 3
+    assert client.cache.hits == 0
+
+
+def test_streamed_answers_use_the_same_key(client):
+    streamed = "".join(client.stream_request("list files", context="$ cd /tmp"))
+    assert client.send_request("list files", context="$ cd /tmp") == streamed
+    assert "".join(client.stream_request("list files", context="$ cd /var")) != ""
+    assert client.requests == 2
+
+
+def test_use_cache_false_skips_the_lookup(client):
+    client.send_request("list files")
+    client.send_request("list files", use_cache=False)
+    assert client.requests == 2
+
+
+def test_keys_ignore_formatting_but_not_the_model():
+    assert make_key("list  files\n", "mock") == make_key("list files", "mock")
+    assert make_key("list files", "mock") != make_key("list files", "other")
+
+
+def test_batched_fixes_are_cached_per_error(client):
+    errors = [("gti status", "not found"), ("pyhton x.py", "not found")]
+    batched = client.send_error_requests(errors)
+    assert client.requests == 1
+    assert [client.send_error_request(*error) for error in errors] == batched
+    assert client.requests == 1
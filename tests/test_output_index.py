@@ -0,0 +1,88 @@
+# tests/test_output_index.py
+import random
+import pytest
+from models.output_index import MAX_TOKEN_LENGTH, OutputIndex, _decode, _encode
+
+
+@pytest.mark.parametrize("ids", [[], [0], [1, 2, 3], [5, 3, 300, 299, 1 << 40], list(range(0, 100000, 997))])
+def test_varint_round_trip(ids):
+    assert _decode(_encode(ids)) == ids
+
+
+def test_varint_small_deltas_take_one_byte():
+    assert len(_encode(list(range(1000)))) == 1000
+
+
+OUTPUTS = {
+    1: "Traceback (most recent call last):\nModuleNotFoundError: No module named 'requests'",
+    2: "\x1b[31merror\x1b[0m: could not compile `demo`",
+    3: "Compiling demo v0.1.0\nFinished dev [unoptimized] target(s)",
+    4: "x" * (MAX_TOKEN_LENGTH * 3) + " tail",
+}
+
+
+def build_index(chunk_size=None):
+    index = OutputIndex()
+    for key, text in OUTPUTS.items():
+        index.start(key)
+        step = chunk_size or len(text)
+        for start in range(0, len(text), step):
+            index.feed(key, text[start:start + step], "stdout")
+        index.finish(key)
+    return index
+
+
+def expected(query):
+    return {key for key, text in OUTPUTS.items() if query.lower() in text.lower()}
+
+
+QUERIES = ["error", "rror", "ERR", "module named", "odule nam", "compil", "demo", "v0.1", "nothing here", "tail", "xxxx"]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 7])
+@pytest.mark.parametrize("query", QUERIES)
+def test_candidates_are_a_superset_of_the_matches(query, chunk_size):
+    candidates = build_index(chunk_size).search(query)
+    assert candidates is None or expected(query) <= candidates
+
+
+def test_search_narrows_down():
+    index = build_index()
+    assert index.search("module named") == {1}
+    assert index.search("rror") == {1, 2}
+    assert index.search("nothing here") == set()
+
+
+def test_removed_and_rerun_documents():
+    index = build_index()
+    index.remove(2)
+    assert 2 not in index.search("compile")
+    index.start(3, "fresh output")
+    index.finish(3)
+    assert index.search("finished") == set()
+    assert index.search("fresh") == {3}
+
+
+def test_unindexed_keys_are_always_candidates():
+    index = build_index()
+    index.mark_unindexed([9])
+    assert 9 in index.search("anything")
+    index.add_saved(9, "restored output")
+    assert index.search("anything") == set()
+    assert index.search("restored") == {9}
+
+
+def test_random_superset():
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "error", "warning", "42", "path/to/file"]
+    outputs = {key: " ".join(rng.choice(words) for _ in range(20)) for key in range(50)}
+    index = OutputIndex()
+    for key, text in outputs.items():
+        index.start(key, text)
+        index.finish(key)
+    for _ in range(200):
+        text = rng.choice(list(outputs.values()))
+        start = rng.randrange(len(text))
+        query = text[start:start + rng.randint(1, 12)]
+        candidates = index.search(query)
+        assert candidates is None or {k for k, t in outputs.items() if query.lower() in t.lower()} <= candidates
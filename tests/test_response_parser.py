@@ -0,0 +1,87 @@
+# tests/test_response_parser.py
+import json
+import os
+import pytest
+from assets.response import response_text
+from models.response_parser import ResponseParser, assess_risk, parse_response
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "response_corpus")
+with open(os.path.join(CORPUS, "expected.json"), encoding="utf-8") as file:
+    EXPECTED = json.load(file)
+
+
+def read(name):
+    if name == "assets/response.py":
+        return response_text
+    with open(os.path.join(CORPUS, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def summary(commands):
+    return [
+        {"command": parsed.command, "language": parsed.language, "step": parsed.step, "risky": parsed.risky}
+        for parsed in commands
+    ]
+
+
+def parse_streamed(text, size):
+    parser = ResponseParser()
+    commands = []
+    for start in range(0, len(text), size):
+        commands += parser.feed(text[start:start + size])
+    return commands + parser.close()
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_corpus(name):
+    assert summary(parse_response(read(name))) == EXPECTED[name]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_streamed_in_chunks_matches_whole(name, size):
+    text = read(name)
+    assert parse_streamed(text, size) == parse_response(text)
+
+
+def test_command_returned_once_its_line_completes():
+    parser = ResponseParser()
+    assert parser.feed("**Command:**\n```bash\nls -l") == []
+    commands = parser.feed("a\nec")
+    assert [parsed.command for parsed in commands] == ["ls -la"]
+    assert [parsed.command for parsed in parser.feed("ho done\n```\n") + parser.close()] == ["echo done"]
+
+
+def test_multi_line_statements_stay_whole():
+    text = "```bash\ncat <<EOF > out\nline\nEOF\necho 'a\nb'\nmake \\\n  all\n```\n"
+    assert [parsed.command for parsed in parse_response(text)] == ["cat <<EOF > out\nline\nEOF", "echo 'a\nb'", "make \\\n  all"]
+
+
+def test_other_languages_are_skipped():
+    text = "```python\nprint(1)\n```\n```sh\nls\n```\n"
+    assert [parsed.command for parsed in parse_response(text)] == ["ls"]
+
+
+def test_console_blocks_keep_only_prompt_lines():
+    text = "```console\n$ uname -r\n6.1.0\n```\n"
+    assert [parsed.command for parsed in parse_response(text)] == ["uname -r"]
+
+
+def test_unterminated_block_is_flushed_on_close():
+    assert [parsed.command for parsed in parse_response("```bash\nls\nif true; then\n  echo x")] == [
+        "ls", "if true; then\n  echo x"]
+
+
+def test_steps_comments_and_indexes():
+    text = "1. Update\n```bash\n# refresh the lists\nsudo apt update\n```\n2. Check\n```bash\ndf -h\n```\n"
+    first, second = parse_response(text)
+    assert (first.step, first.index, first.comment) == (1, 0, "refresh the lists")
+    assert (second.step, second.index) == (2, 1)
+
+
+@pytest.mark.parametrize("command, risky", [
+    ("rm -rf build", True), ("rm build", False), ("curl -fsSL x.sh | sh", True), ("curl -O x.sh", False),
+    ("git push --force", True), ("git push", False), ("sudo ls", True), ("ls -la", False),
+])
+def test_assess_risk(command, risky):
+    assert (assess_risk(command) is not None) == risky
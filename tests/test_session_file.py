@@ -0,0 +1,90 @@
+# tests/test_session_file.py
+import gzip
+import json
+import pytest
+from models.session import COMPRESS_THRESHOLD, SessionStore
+from services.conversation_context import Exchange
+from services.session_file import FORMAT_VERSION, load_session, save_session
+
+
+def make_session():
+    session = SessionStore(cwd="/home/user")
+    first = session.new_record("ls")
+    first.output = "a\nb\n"
+    first.exit_code = 0
+    first.duration = 0.01
+    first.finished_at = first.created_at + 0.01
+    second = session.new_record("cat big.log", cwd="/var/log")
+    second.output = "line\n" * COMPRESS_THRESHOLD
+    second.exit_code = 1
+    second.is_error = True
+    second.cwd_after = "/var/log"
+    deleted = session.new_record("rm nothing")
+    session.delete(deleted)
+    session.new_record("sleep 1") # Never ran
+    return session
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "nested" / "session.json.gz")
+    session = make_session()
+    exchanges = [Exchange("list files", ["ls"], created_at=1.0, response="**Command:**\n```bash\nls\n```\n")]
+    save_session(path, session, exchanges, response="last response")
+
+    saved = load_session(path)
+    assert saved.cwd == "/home/user"
+    assert saved.response == "last response"
+    assert saved.exchanges == exchanges
+    expected = [record for record in session.export() if not record.pop("deleted")]
+    restored = SessionStore()
+    restored.restore(saved.records)
+    assert [{**record, "deleted": False} for record in expected] == restored.export()
+    assert saved.records[1].output_lines == COMPRESS_THRESHOLD + 1
+    assert isinstance(saved.records[1]._output, bytes) # Compressed again
+    assert saved.records[2].output is None
+
+
+def test_new_cells_continue_the_ids(tmp_path):
+    path = str(tmp_path / "session.json.gz")
+    save_session(path, make_session())
+    restored = SessionStore()
+    restored.restore(load_session(path).records)
+    assert restored.new_record("pwd").cell_id == 5
+
+
+def write(path, data, compress=True):
+    raw = json.dumps(data).encode("utf-8")
+    with open(path, "wb") as file:
+        file.write(gzip.compress(raw) if compress else raw)
+
+
+@pytest.mark.parametrize("data, compress", [
+    ({"version": FORMAT_VERSION, "cwd": "/", "cells": []}, False), # Not gzipped
+    ([1, 2], True),
+    ({"version": FORMAT_VERSION + 1, "cwd": "/", "cells": []}, True),
+    ({"version": FORMAT_VERSION, "cells": []}, True), # No cwd
+    ({"version": FORMAT_VERSION, "cwd": "/", "cells": [{"command": "ls"}]}, True), # No output
+    ({"version": FORMAT_VERSION, "cwd": "/", "cells": [{"output": "", "unknown": 1}]}, True),
+    ({"version": FORMAT_VERSION, "cwd": "/", "cells": [], "exchanges": [{"request": "x"}]}, True),
+])
+def test_malformed_files(tmp_path, data, compress):
+    path = str(tmp_path / "session.json.gz")
+    write(path, data, compress)
+    with pytest.raises(ValueError):
+        load_session(path)
+
+
+def test_truncated_file(tmp_path):
+    path = str(tmp_path / "session.json.gz")
+    save_session(path, make_session())
+    with open(path, "rb") as file:
+        data = file.read()
+    with open(path, "wb") as file:
+        file.write(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        load_session(path)
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(OSError):
+        load_session(str(tmp_path / "none.json.gz"))
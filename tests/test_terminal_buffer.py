@@ -0,0 +1,80 @@
+# tests/test_terminal_buffer.py
+from services.terminal_buffer import ANSI_COLORS, DEFAULT_STYLE, Style, TerminalBuffer, color_256
+
+
+def test_plain_lines():
+    buffer = TerminalBuffer()
+    buffer.write("one\ntwo\n")
+    assert buffer.get_text() == "one\ntwo"
+    assert buffer.line_count() == 3
+
+
+def test_carriage_return_redraws_the_line():
+    buffer = TerminalBuffer()
+    buffer.write("progress 10%\rprogress 100%\n")
+    assert buffer.get_text() == "progress 100%"
+
+
+def test_erase_line():
+    buffer = TerminalBuffer()
+    buffer.write("downloading...\r\x1b[Kdone")
+    assert buffer.get_text() == "done"
+
+
+def test_escape_sequence_split_across_chunks():
+    buffer = TerminalBuffer()
+    buffer.write("\x1b[3")
+    buffer.write("1mred\x1b[")
+    buffer.write("0m plain")
+    spans = buffer.line_spans(0)
+    assert spans[0] == ("red", Style(fg=ANSI_COLORS[1]))
+    assert spans[1] == (" plain", DEFAULT_STYLE)
+
+
+def test_sgr_attributes_and_colors():
+    buffer = TerminalBuffer()
+    buffer.write("\x1b[1;4;38;5;196;48;2;1;2;3mx\x1b[22;24;39;49my")
+    (_, styled), (_, reset) = buffer.line_spans(0)
+    assert styled.bold and styled.underline
+    assert styled.fg == color_256(196) == "#ff0000"
+    assert styled.bg == "#010203"
+    assert reset == DEFAULT_STYLE
+
+
+def test_color_256_palette():
+    assert color_256(1) == ANSI_COLORS[1]
+    assert color_256(16) == "#000000"
+    assert color_256(231) == "#ffffff"
+    assert color_256(232) == "#080808"
+
+
+def test_huge_cursor_position_is_clamped():
+    buffer = TerminalBuffer(rows=24, max_line_length=80)
+    buffer.write("\x1b[999999;999999Hx")
+    # Stopped at the last column of the screen, the character then wraps once
+    assert buffer.line_count() <= 24 + 2
+    assert all(len(line) <= 80 for line in buffer.chars)
+
+
+def test_long_line_wraps():
+    buffer = TerminalBuffer(max_line_length=4)
+    buffer.write("abcdefghij")
+    assert buffer.get_text() == "abcd\nefgh\nij"
+
+
+def test_scrollback_is_trimmed():
+    buffer = TerminalBuffer(max_lines=3)
+    buffer.write("".join(f"{number}\n" for number in range(10)))
+    assert buffer.dropped_lines == 8
+    assert buffer.get_text() == "[... 8 earlier lines dropped ...]\n8\n9"
+    assert buffer.line_spans(9) == [("9", DEFAULT_STYLE)]
+    assert buffer.line_spans(0) == []
+
+
+def test_dirty_lines():
+    buffer = TerminalBuffer()
+    buffer.write("a\nb\n")
+    assert buffer.take_dirty() == [0, 1, 2]
+    buffer.write("\x1b[1Ac")
+    assert buffer.take_dirty() == [1]
+    assert buffer.take_dirty() == []
@@ -0,0 +1,145 @@
+# utils/constants.py
+import os
+
+# --- Command output streaming ---
+# Max lines kept in memory per stream (stdout / stderr) for a running command.
+# Older lines are dropped from the ring buffer once this limit is reached.
+OUTPUT_SCROLLBACK_LINES = int(os.getenv("AI_TERMINAL_SCROLLBACK_LINES", "2000"))
+# Lines longer than this are split so a single huge line can't grow unbounded
+OUTPUT_MAX_LINE_LENGTH = 4096
+# Minimum seconds between two UI refreshes while a command is producing output
+OUTPUT_FLUSH_INTERVAL = float(os.getenv("AI_TERMINAL_FLUSH_INTERVAL", "0.1"))
+# Bytes read from a pipe at a time
+OUTPUT_READ_SIZE = 64 * 1024
+# Run commands on a pseudo-terminal so tools keep their colors and progress bars
+OUTPUT_PTY = os.getenv("AI_TERMINAL_PTY", "1") != "0"
+# Size of that terminal, as reported to the commands
+TERMINAL_COLUMNS = int(os.getenv("AI_TERMINAL_COLUMNS", "120"))
+TERMINAL_ROWS = 24
+
+# --- Shell sessions ---
+# Commands of a notebook run in a long-lived shell so cd/export/activate persist
+SHELL_PATH = os.getenv("AI_TERMINAL_SHELL", "/bin/bash")
+# Shells per notebook: one owning the state, the others for commands running at the same time
+SHELL_POOL_SIZE = int(os.getenv("AI_TERMINAL_SHELL_POOL_SIZE", "4"))
+
+# --- Command supervision ---
+# Seconds before a command is stopped, 0 for no limit
+COMMAND_TIMEOUT = float(os.getenv("AI_TERMINAL_COMMAND_TIMEOUT", "0"))
+# Seconds between SIGINT, SIGTERM and SIGKILL when stopping a command
+COMMAND_STOP_GRACE_PERIOD = 2.0
+# CPU seconds and memory (MB) per process started by a command, 0 for no limit
+COMMAND_CPU_LIMIT = int(os.getenv("AI_TERMINAL_CPU_LIMIT", "0"))
+COMMAND_MEMORY_LIMIT_MB = int(os.getenv("AI_TERMINAL_MEMORY_LIMIT_MB", "0"))
+
+# --- Command executor ---
+# Max commands running at the same time (cells and Run all), extra ones are queued
+EXECUTOR_MAX_WORKERS = int(os.getenv("AI_TERMINAL_MAX_RUNNING", "4"))
+# Recent queue wait times kept for the metrics
+EXECUTOR_WAIT_SAMPLES = 1000
+
+# --- LLM requests ---
+# Max model requests running at the same time, extra ones wait in a queue
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_TERMINAL_LLM_CONCURRENCY", "4"))
+# Seconds before a model request is given up (measured from when it starts running)
+LLM_REQUEST_TIMEOUT = float(os.getenv("AI_TERMINAL_LLM_TIMEOUT", "60"))
+# Show suggested commands while the model is still answering (AI_TERMINAL_LLM_STREAMING=0 to wait for the full answer)
+LLM_STREAMING = os.getenv("AI_TERMINAL_LLM_STREAMING", "1") not in ("", "0", "false")
+
+# --- Conversation context ---
+# Tokens of session history (commands, exit codes, outputs, earlier requests) sent with a chat request, 0 to send none
+LLM_CONTEXT_BUDGET_TOKENS = int(os.getenv("AI_TERMINAL_CONTEXT_TOKENS", "1500"))
+# Tokens kept of each command output in that history
+LLM_CONTEXT_OUTPUT_TOKENS = 200
+# Tokens kept of a failed command's output sent with "Ask AI"
+LLM_ERROR_BUDGET_TOKENS = int(os.getenv("AI_TERMINAL_ERROR_TOKENS", "1000"))
+# Longer output lines are cut in prompts
+LLM_CONTEXT_MAX_LINE_LENGTH = 300
+
+# --- Error request coalescing ---
+# Seconds "Ask AI" requests made while another is answered wait for others to share one model call (0 only merges identical requests)
+LLM_COALESCE_WINDOW = float(os.getenv("AI_TERMINAL_LLM_COALESCE_WINDOW", "0.1"))
+# Max errors sent in one prompt
+LLM_COALESCE_MAX_BATCH = 8
+
+# --- Speculative AI fixes ---
+# Ask the model for a fix as soon as a command fails, before "Ask AI" is clicked (off by default, it spends requests)
+LLM_PREFETCH_ENABLED = os.getenv("AI_TERMINAL_AI_PREFETCH", "0") not in ("", "0", "false")
+# Max speculative requests started per minute
+LLM_PREFETCH_PER_MINUTE = int(os.getenv("AI_TERMINAL_AI_PREFETCH_PER_MINUTE", "6"))
+
+# --- LLM providers ---
+# Backend answering the AI requests: gemini, local (OpenAI-compatible server) or mock (offline)
+LLM_PROVIDER = os.getenv("AI_TERMINAL_LLM_PROVIDER", "gemini")
+# OpenAI-compatible endpoint for the local provider (llama.cpp server, Ollama, vLLM...)
+LLM_LOCAL_URL = os.getenv("AI_TERMINAL_LOCAL_URL", "http://127.0.0.1:8080/v1")
+LLM_LOCAL_MODEL = os.getenv("AI_TERMINAL_LOCAL_MODEL", "local-model")
+LLM_LOCAL_API_KEY = os.getenv("AI_TERMINAL_LOCAL_API_KEY", "")
+# Seconds the mock provider takes to answer, spread over its streamed chunks
+LLM_MOCK_LATENCY = float(os.getenv("AI_TERMINAL_MOCK_LATENCY", "0"))
+
+# --- LLM response cache ---
+CACHE_DIR = os.getenv("AI_TERMINAL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-terminal"))
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite3")
+# Cached responses older than this (seconds) are ignored and cleaned up
+LLM_CACHE_TTL = float(os.getenv("AI_TERMINAL_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries are evicted above this size
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("AI_TERMINAL_CACHE_MAX_ENTRIES", "5000"))
+# Set AI_TERMINAL_NO_CACHE=1 to always ask the model
+LLM_CACHE_DISABLED = os.getenv("AI_TERMINAL_NO_CACHE", "") not in ("", "0", "false")
+
+# --- Error fingerprint index ---
+ERROR_INDEX_PATH = os.path.join(CACHE_DIR, "error_fixes.sqlite3")
+# Minimum similarity (0-1) between two masked errors to reuse a past fix
+ERROR_MATCH_THRESHOLD = float(os.getenv("AI_TERMINAL_ERROR_MATCH_THRESHOLD", "0.75"))
+# Max past fixes suggested for one error
+ERROR_MATCH_MAX_SUGGESTIONS = 3
+# Oldest fingerprints are forgotten above this size
+ERROR_INDEX_MAX_ENTRIES = 10000
+
+# --- Command history ---
+HISTORY_PATH = os.path.join(CACHE_DIR, "history.sqlite3")
+# Distinct commands remembered, the lowest ranked are forgotten above this
+HISTORY_MAX_COMMANDS = int(os.getenv("AI_TERMINAL_HISTORY_SIZE", "200000"))
+# Individual runs (cwd, exit code, duration, time) kept
+HISTORY_MAX_RUNS = 1000000
+# Seconds for a run to count half as much when ranking suggestions
+HISTORY_HALF_LIFE = 14 * 24 * 3600
+# Suggestions shown under a command while typing, 0 to show none
+HISTORY_SUGGESTIONS = int(os.getenv("AI_TERMINAL_HISTORY_SUGGESTIONS", "5"))
+# Set AI_TERMINAL_NO_HISTORY=1 to not record the commands run
+HISTORY_DISABLED = os.getenv("AI_TERMINAL_NO_HISTORY", "") not in ("", "0", "false")
+
+# --- Session files ---
+# The session is saved here when the app closes, and restored from it on launch
+SESSION_PATH = os.getenv("AI_TERMINAL_SESSION_FILE", os.path.join(CACHE_DIR, "session.json.gz"))
+# Set AI_TERMINAL_RESTORE_SESSION=0 to start with an empty session (it is still saved)
+SESSION_RESTORE = os.getenv("AI_TERMINAL_RESTORE_SESSION", "1") not in ("", "0", "false")
+
+# --- Output search ---
+# Memory (MB) the index of the session's outputs may use, the oldest outputs are scanned instead above it
+SEARCH_INDEX_MAX_BYTES = int(float(os.getenv("AI_TERMINAL_SEARCH_INDEX_MB", "32")) * 1024 * 1024)
+
+# --- Tracing and logging ---
+# Set AI_TERMINAL_TRACE=0 to stop recording timing spans (commands, AI requests, UI updates)
+TRACE_ENABLED = os.getenv("AI_TERMINAL_TRACE", "1") not in ("", "0", "false")
+# Spans kept in memory, the oldest are overwritten (the performance panel's window)
+TRACE_BUFFER_SPANS = int(os.getenv("AI_TERMINAL_TRACE_SPANS", "10000"))
+# Where the spans are exported, on exit when set and by the performance panel's Export button
+TRACE_FILE = os.getenv("AI_TERMINAL_TRACE_FILE", "")
+TRACE_DEFAULT_FILE = os.path.join(CACHE_DIR, "trace.json")
+# Layout of the exported file: "json" (flat list of spans) or "otlp" (OpenTelemetry JSON)
+TRACE_FORMAT = os.getenv("AI_TERMINAL_TRACE_FORMAT", "json")
+# Seconds between two refreshes of the performance panel while it is open
+PERF_PANEL_REFRESH = 1.0
+# DEBUG shows the prompts and responses, OFF silences everything
+LOG_LEVEL = os.getenv("AI_TERMINAL_LOG_LEVEL", "INFO").upper()
+
+# --- Virtualized cell list ---
+# Cells kept as full Flet controls when the scroll position is unknown (the newest ones)
+VIRTUAL_LIVE_CELLS = int(os.getenv("AI_TERMINAL_LIVE_CELLS", "40"))
+# Pixels above and below the visible area where cells are still materialized
+VIRTUAL_MARGIN_PX = 1200
+# Height estimates used for off-screen placeholders
+VIRTUAL_CELL_HEIGHT = 80
+VIRTUAL_LINE_HEIGHT = 20
@@ -0,0 +1,45 @@
+# utils/logger.py
+import logging
+import sys
+import threading
+from utils.constants import LOG_LEVEL
+
+# Parent of every logger of the app, its level and handler apply to all of them
+ROOT_LOGGER = "ai_terminal"
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Sends the app's log records to stderr, at `level` and above.
+
+    Args:
+        level (str): DEBUG, INFO, WARNING, ERROR or OFF to silence them.
+    """
+    global _configured
+    with _configure_lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        if not _configured:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+            root.addHandler(handler)
+            # Records stop here, a library configuring the root logger doesn't print them twice
+            root.propagate = False
+            _configured = True
+        level = level.upper()
+        root.setLevel(logging.CRITICAL + 1 if level == "OFF" else getattr(logging, level, logging.INFO))
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger of a module, e.g. get_logger(__name__).
+
+    Disabled levels cost a single check, so debug logging can stay in the
+    hot paths; pass arguments (log.debug("x %s", y)) rather than f-strings
+    so the message is only built when it is shown.
+    """
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -1,19 +1,32 @@
 # views/notebook_view.py
-import os
+import threading
+from contextlib import contextmanager
+from difflib import SequenceMatcher
 import flet as ft
 from components.command.command_cell import CommandCell # Import the component
 from components.chat_box.chat_box_cell import ChatBoxCell
 from models.app import App
-from colorama import Fore, Style
+from services.llm_model_sdks.client_registry import LLMClientRegistry, get_client_registry
+from services.command_scheduler import CommandScheduler, build_dependencies
+from services.command_executor import get_command_executor
+from services.shell_session import ShellSessionPool
+from services.conversation_context import ConversationContext
+from services.session_file import SavedSession, save_session
+from services import tracing
+from utils.constants import (
+    VIRTUAL_LIVE_CELLS, VIRTUAL_MARGIN_PX, SESSION_PATH, TRACE_FILE, TRACE_DEFAULT_FILE, TRACE_FORMAT, PERF_PANEL_REFRESH,
+)
+from utils.logger import get_logger
 
-PROMPT = f"{os.getcwd()}" # Default prompt showing current dir
+log = get_logger(__name__)
 
 class AppView:
     """Manages the main view containing the command cells."""
 
-    def __init__(self, page: ft.Page):
-        global PROMPT
+    def __init__(self, page: ft.Page, llm_clients: LLMClientRegistry | None = None):
         self.page = page
+        # Shared by every cell, the LLM client itself is created lazily
+        self.llm_clients = llm_clients or get_client_registry()
         # List to hold the CommandCell *instances*
         self.all_cells: list[CommandCell] = []
         # Flet control that displays the cell views
@@ -21,70 +34,425 @@ class AppView:
             controls=[],
             spacing=0, # Let cell container handle padding/margins
             scroll=ft.ScrollMode.ADAPTIVE,
-            expand=True # Make the list fill available vertical space
+            expand=True, # Make the list fill available vertical space
+            on_scroll=self._on_scroll,
+            on_scroll_interval=100, # ms between scroll events
         )
+        # Last known scroll position, used to only materialize visible cells
+        self._scroll_offset: float | None = None
+        self._viewport_height: float | None = None
         self.app_logic = App()
+        # Long-lived shells the cells run in, started on the first command
+        self.shells = ShellSessionPool(self.app_logic.session.cwd)
+        # Session history sent with chat requests, so follow-ups keep their context
+        self.context = ConversationContext(self.app_logic.session)
+        # AI responses are delivered from request pool threads, serialize them
+        self._response_lock = threading.RLock()
+        # batch_update() state: nesting depth, pending page.update() and focus
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._batch_focus: ft.TextField | None = None
+        # Cells of the previous response not yet matched by the one streaming in
+        self._stream_stale_cells: list[CommandCell] = []
+        # Search bar state: text searched, matching cells and the one scrolled to
+        self._search_query = ""
+        self._search_hits: list[CommandCell] = []
+        self._search_position = -1
+        # Set to stop refreshing the performance panel once it is closed
+        self._perf_stop: threading.Event | None = None
+
+    @contextmanager
+    def batch_update(self):
+        """
+        Groups control changes into a single page.update().
+
+        Inside the block, methods that would refresh the page only mark it as
+        dirty; the outermost block flushes once on exit. Blocks can be nested.
+        """
+        with self._response_lock:
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush()
+
+    def _request_update(self, focus: ft.TextField | None = None):
+        """page.update() now, or once the current batch ends."""
+        if focus is not None:
+            self._batch_focus = focus
+        if self._batch_depth:
+            self._batch_dirty = True
+        else:
+            self._batch_dirty = True
+            self._flush()
+
+    def _flush(self):
+        with tracing.get_tracer().span(tracing.UI_FLUSH):
+            self._update_window()
+            if self._batch_dirty:
+                self._batch_dirty = False
+                self.page.update()
+        # Focus needs the control to be on the page, so it comes after the update
+        focus, self._batch_focus = self._batch_focus, None
+        if focus is not None:
+            focus.focus()
+
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        self._scroll_offset = e.pixels
+        self._viewport_height = e.viewport_dimension
+        with self.batch_update():
+            self._update_window()
+
+    def _update_window(self) -> bool:
+        """
+        Keeps Flet controls only for the cells in (or near) the visible area,
+        the others are reduced to their record and a placeholder of the same
+        estimated height. Returns True if any cell changed.
+        """
+        focused = self._batch_focus
+        if self._scroll_offset is None or not self._viewport_height:
+            # Scroll position unknown yet: the newest cells are the visible ones
+            keep = set(map(id, self.all_cells[-VIRTUAL_LIVE_CELLS:]))
+        else:
+            top = self._scroll_offset - VIRTUAL_MARGIN_PX
+            bottom = self._scroll_offset + self._viewport_height + VIRTUAL_MARGIN_PX
+            keep = set()
+            y = 0
+            for cell in self.all_cells:
+                height = cell.estimate_height()
+                if y + height >= top and y <= bottom:
+                    keep.add(id(cell))
+                y += height
+
+        changed = False
+        for cell in self.all_cells:
+            if id(cell) in keep or (focused is not None and cell.command_input is focused):
+                if not cell.materialized:
+                    cell.materialize()
+                    changed = True
+            elif cell.materialized:
+                changed |= cell.dematerialize()
+        self._batch_dirty |= changed
+        return changed
 
     def delete_cell(self, cell_to_delete: CommandCell):
         """Callback function to remove a cell from the list and UI."""
-        view_to_remove = cell_to_delete.get_view()
-        if view_to_remove in self.command_list_view.controls:
-            self.command_list_view.controls.remove(view_to_remove)
-        if cell_to_delete in self.all_cells:
-            self.all_cells.remove(cell_to_delete)
-
-        print(f"Deleted cell. Remaining cells: {len(self.all_cells)}") # Debugging
-        self.page.update() # Update the page to reflect the removal
+        with self.batch_update():
+            cell_to_delete.close() # Its suggestion would have nowhere to go, its command no one to report to
+            self.app_logic.session.delete(cell_to_delete.record)
+            view_to_remove = cell_to_delete.get_view()
+            if view_to_remove in self.command_list_view.controls:
+                self.command_list_view.controls.remove(view_to_remove)
+            if cell_to_delete in self.all_cells:
+                self.all_cells.remove(cell_to_delete)
+
+            log.debug("Deleted cell. Remaining cells: %d", len(self.all_cells))
+            self._request_update() # Update the page to reflect the removal
         
     def delete_all_cells(self):
-        for _, command_cell in enumerate(self.all_cells):
-            self.delete_cell(command_cell)
-        self.page.update()
+        with self.batch_update():
+            # Iterate over a copy, delete_cell() removes from all_cells
+            for command_cell in list(self.all_cells):
+                self.delete_cell(command_cell)
+
+    def _reconcile_cells(self, command_list: list[str]) -> list[CommandCell]:
+        """
+        Makes the cells match `command_list`, reusing the cells whose command
+        is unchanged and only building or deleting the ones that differ.
+        Returns the cells created.
+        """
+        old_cells = list(self.all_cells)
+        old_commands = [cell.get_command() for cell in old_cells]
+        new_cells: list[CommandCell] = []
+        created: list[CommandCell] = []
+
+        matcher = SequenceMatcher(None, old_commands, command_list, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                new_cells.extend(old_cells[i1:i2])
+                continue
+            for cell in old_cells[i1:i2]:
+                cell.close()
+                self.app_logic.session.delete(cell.record)
+            for command in command_list[j1:j2]:
+                cell = self._create_cell(command)
+                created.append(cell)
+                new_cells.append(cell)
+
+        # Other controls (e.g. the chat box) keep their place before the cells
+        old_views = {id(cell.get_view()) for cell in old_cells}
+        self.command_list_view.controls = [
+            control for control in self.command_list_view.controls if id(control) not in old_views
+        ] + [cell.get_view() for cell in new_cells]
+        self.all_cells = new_cells
+        self._request_update()
+        return created
     
     def update_response(self, response: str):
-        """Callback function to remove a cell from the list and UI."""
-        self.delete_all_cells()
-        self.app_logic.set_response(response)
-        command_list = self.app_logic.get_commands()
+        """Replaces the cells with the commands of a new AI response (may run on a request pool thread)."""
+        with self.batch_update():
+            self.app_logic.set_response(response)
+            command_list = self.app_logic.get_commands()
+            self._reconcile_cells(command_list)
         
-        for _, command in enumerate(command_list):
+    def begin_streamed_response(self):
+        """A new response starts streaming, its commands will replace the current cells."""
+        with self.batch_update():
+            self._stream_stale_cells = list(self.all_cells)
+
+    def add_streamed_command(self, command: str):
+        """Adds one command of a response that is still streaming."""
+        with self.batch_update():
+            stale = self._stream_stale_cells
+            if stale and stale[0].get_command() == command:
+                # Same command at the same position as before, keep the cell
+                stale.pop(0)
+                return
+            # The responses diverge here, the rest of the old cells go away
+            for cell in stale:
+                self.delete_cell(cell)
+            self._stream_stale_cells = []
             self.add_cell_click(command, None)
-            
-        self.page.update() # Update the page
-        
+
+    def end_streamed_response(self, response: str):
+        """Keeps the full text of a streamed response once it is complete."""
+        with self.batch_update():
+            for cell in self._stream_stale_cells:
+                self.delete_cell(cell)
+            self._stream_stale_cells = []
+            self.app_logic.set_response(response)
+            self._request_update()
+
     def ask_ai(self, cell_to_process: CommandCell):
-        self.app_logic.set_response(cell_to_process.get_ai_command_error_suggestion())
-        command_list = self.app_logic.get_commands()
-        
-        for _, command in enumerate(command_list):
-            self.add_cell_click(command, None)
+        """Adds the commands suggested for a failed cell (may run on a request pool thread)."""
+        with self.batch_update():
+            self.app_logic.set_response(cell_to_process.get_ai_command_error_suggestion())
+            command_list = self.app_logic.get_commands()
             
-        self.page.update() # Update the page
+            for _, command in enumerate(command_list):
+                new_cell = self.add_cell_click(command, None)
+                # Lets the new cell report back when it fixed the original error
+                new_cell.fix_for = cell_to_process.ai_request_context
 
     def add_chat_box_cell_click(self, e: ft.ControlEvent | None):
         """Adds a new command cell to the list and UI."""
         # Pass the page and the delete_cell method of this view instance
-        new_cell = ChatBoxCell(self.page, self.update_response)
+        new_cell = ChatBoxCell(
+            self.page, self.update_response, self.llm_clients,
+            self.begin_streamed_response, self.add_streamed_command, self.end_streamed_response,
+            self.context,
+        )
         #self.all_cells.append(new_cell)
         self.command_list_view.controls.append(new_cell.get_view())
         #print(f"Added cell. Total cells: {len(self.all_cells)}") # Debugging
-        self.page.update() # Update the page to show the new cell
-        # Optionally focus the new cell's input
-        new_cell.command_input.focus()
-        # self.page.update() # Update again if focus needs it
+        # Update the page to show the new cell and focus its input
+        self._request_update(focus=new_cell.command_input)
 
-    def add_cell_click(self, command_text: str, e: ft.ControlEvent | None):
-        """Adds a new command cell to the list and UI."""
+    def _create_cell(self, command_text: str, **options) -> CommandCell:
         # Pass the page and the delete_cell method of this view instance
-        new_cell = CommandCell(PROMPT, command_text, self.page, self.delete_cell, self.ask_ai)
-        self.all_cells.append(new_cell)
-        self.command_list_view.controls.append(new_cell.get_view())
-        print(f"Added cell. Total cells: {len(self.all_cells)}") # Debugging
-        self.page.update() # Update the page to show the new cell
-        # Optionally focus the new cell's input
-        new_cell.command_input.focus()
-        # self.page.update() # Update again if focus needs it
+        session = self.app_logic.session
+        return CommandCell(session.cwd, command_text, self.page, self.delete_cell, self.ask_ai, self.llm_clients, session, self.shells,
+                           **options)
+
+    def add_cell_click(self, command_text: str, e: ft.ControlEvent | None) -> CommandCell:
+        """Adds a new command cell to the list and UI."""
+        with self.batch_update():
+            new_cell = self._create_cell(command_text)
+            self.all_cells.append(new_cell)
+            self.command_list_view.controls.append(new_cell.get_view())
+            log.debug("Added cell. Total cells: %d", len(self.all_cells))
+            # Update the page to show the new cell and focus its input
+            self._request_update(focus=new_cell.command_input)
+        return new_cell
+
+
+    def run_all_click(self, e: ft.ControlEvent | None):
+        """Runs every cell, in parallel where the commands don't depend on each other."""
+        cells = [cell for cell in self.all_cells if not cell.is_busy()]
+        if not cells:
+            return
+        self.run_all_button.disabled = True
+        self.run_all_button.update()
+        threading.Thread(target=self._run_all, args=(cells,), daemon=True).start()
+
+    def _run_all(self, cells: list[CommandCell]):
+        try:
+            dependencies = build_dependencies([cell.get_command() for cell in cells])
+            CommandScheduler().run(
+                len(cells),
+                dependencies,
+                run_step=lambda index: cells[index].run_and_wait(),
+                on_status=lambda index, status: cells[index].set_status(status),
+            )
+        finally:
+            self.run_all_button.disabled = False
+            self.run_all_button.update()
 
+    def _on_executor_metrics(self, metrics: dict):
+        """Shows how many commands run or wait for a worker (called from executor threads)."""
+        if metrics["queued"]:
+            text = f"{metrics['running']} running, {metrics['queued']} queued (avg wait {metrics['wait_avg']:.1f}s)"
+        elif metrics["running"]:
+            text = f"{metrics['running']} running"
+        else:
+            text = ""
+        if text != self.executor_status.value:
+            self.executor_status.value = text
+            self.executor_status.visible = bool(text)
+            self.executor_status.update()
+
+    def search(self, query: str):
+        """Highlights the cells whose command or output contains `query` and scrolls to the first one."""
+        with self.batch_update():
+            self._search_query = query
+            found = {record.cell_id for record in self.app_logic.session.search(query)}
+            previous = self._search_hits
+            self._search_hits = [cell for cell in self.all_cells if cell.record.cell_id in found]
+            for cell in previous:
+                if cell.record.cell_id not in found:
+                    cell.set_search(None)
+            for cell in self._search_hits:
+                cell.set_search(query)
+            self._search_position = -1
+            if self._search_hits:
+                self._show_search_hit(0)
+            else:
+                self._show_search_status()
+
+    def _show_search_hit(self, position: int):
+        """Scrolls to the `position`-th matching cell (wrapping around)."""
+        # Cells deleted since the search are skipped
+        hits = self._search_hits = [cell for cell in self._search_hits if not cell.record.deleted]
+        if not hits:
+            self._show_search_status()
+            return
+        self._search_position = position % len(hits)
+        cell = hits[self._search_position]
+        if not cell.materialized:
+            cell.materialize()
+            self._batch_dirty = True
+        self.command_list_view.scroll_to(key=cell.get_view().key, duration=300)
+        self._show_search_status()
+
+    def _show_search_status(self):
+        if not self._search_query:
+            text = ""
+        elif self._search_hits:
+            text = f"{self._search_position + 1}/{len(self._search_hits)}"
+        else:
+            text = "No match"
+        self.search_status.value = text
+        self.search_status.visible = bool(text)
+        self.search_previous.disabled = self.search_next.disabled = len(self._search_hits) < 2
+        self._request_update()
+
+    def _on_search_change(self, e: ft.ControlEvent):
+        self.search(self.search_field.value.strip())
+
+    def _on_search_submit(self, e: ft.ControlEvent):
+        """Enter goes to the next match (new output may have come in for a new search)."""
+        query = self.search_field.value.strip()
+        if query != self._search_query or not self._search_hits:
+            self.search(query)
+        else:
+            with self.batch_update():
+                self._show_search_hit(self._search_position + 1)
+
+    def _on_search_step(self, step: int):
+        with self.batch_update():
+            self._show_search_hit(self._search_position + step)
+
+    def save_session(self, path: str = SESSION_PATH):
+        """Saves the cells, their outputs and the chat history (see services.session_file)."""
+        try:
+            save_session(path, self.app_logic.session, self.context.exchanges, self.app_logic.response)
+        except OSError as e:
+            log.error("Error saving the session to %s: %s", path, e)
+
+    def restore_session(self, saved: SavedSession):
+        """Shows the cells of a saved session, only the visible ones get their controls."""
+        with self.batch_update():
+            session = self.app_logic.session
+            session.restore(saved.records, saved.cwd)
+            # Commands carry on from the directory the session was left in (the shells start lazily)
+            self.shells.close()
+            self.shells = ShellSessionPool(session.cwd)
+            self.context.restore(saved.exchanges)
+            if saved.response is not None:
+                self.app_logic.set_response(saved.response)
+            for record in session.active():
+                cell = self._create_cell(record.command, record=record, lazy=True)
+                self.all_cells.append(cell)
+                self.command_list_view.controls.append(cell.get_view())
+            log.info("Restored %d cells", len(self.all_cells))
+            self._request_update()
+
+    def _toggle_perf_panel(self, e: ft.ControlEvent | None):
+        """Opens or closes the panel of stage timings, it refreshes itself while open."""
+        self.perf_panel.visible = not self.perf_panel.visible
+        if self._perf_stop is not None:
+            self._perf_stop.set()
+            self._perf_stop = None
+        self._request_update()
+        if self.perf_panel.visible:
+            self._perf_stop = threading.Event()
+            threading.Thread(target=self._refresh_perf_panel, args=(self._perf_stop,), daemon=True,
+                             name="perf-panel").start()
+
+    def _refresh_perf_panel(self, stop: threading.Event):
+        while not stop.is_set():
+            self._show_perf_stats()
+            stop.wait(PERF_PANEL_REFRESH)
+
+    def _show_perf_stats(self):
+        """Fills the panel with the count, p50, p95 and max of each stage in the trace buffer."""
+        def ms(value: float) -> str:
+            return f"{value:.2f}" if value < 10 else f"{value:.0f}"
+
+        def row(cells: list[str], bold: bool = False) -> ft.Row:
+            weight = ft.FontWeight.BOLD if bold else None
+            return ft.Row([
+                ft.Text(cell, size=12, weight=weight, width=150 if index == 0 else 70,
+                        text_align=ft.TextAlign.LEFT if index == 0 else ft.TextAlign.RIGHT)
+                for index, cell in enumerate(cells)
+            ], spacing=8)
+
+        stats = tracing.get_tracer().stage_stats()
+        rows = [row(["stage", "count", "p50 ms", "p95 ms", "max ms"], bold=True)]
+        rows += [
+            row([name, str(stage["count"]), ms(stage["p50_ms"]), ms(stage["p95_ms"]), ms(stage["max_ms"])])
+            for name, stage in stats.items()
+        ]
+        if not stats:
+            rows.append(ft.Text("Nothing measured yet", size=12, italic=True))
+        self.perf_table.controls = rows
+        self.perf_table.update()
+
+    def _export_trace(self, e: ft.ControlEvent | None):
+        """Writes the buffered spans to the trace file."""
+        path = TRACE_FILE or TRACE_DEFAULT_FILE
+        try:
+            count = tracing.get_tracer().export(path, TRACE_FORMAT)
+            self.perf_status.value = f"Exported {count} spans to {path}"
+        except (OSError, ValueError) as error:
+            log.error("Error exporting the trace to %s: %s", path, error)
+            self.perf_status.value = f"Export failed: {error}"
+        self.perf_status.update()
+
+    def _clear_trace(self, e: ft.ControlEvent | None):
+        tracing.get_tracer().clear()
+        self.perf_status.value = ""
+        self.perf_status.update()
+        self._show_perf_stats()
+
+    def close(self):
+        """Teardown hook: ends the notebook's shell sessions."""
+        if self._perf_stop is not None:
+            self._perf_stop.set()
+        get_command_executor().remove_listener(self._on_executor_metrics)
+        self.shells.close()
 
     def build(self) -> list[ft.Control]:
         """Builds the list of controls for the main page view."""
@@ -94,16 +462,83 @@ class AppView:
             on_click=lambda e: self.add_cell_click("ls -a", e)
         )
 
+        self.run_all_button = ft.ElevatedButton(
+            "Run all",
+            icon=ft.icons.PLAYLIST_PLAY,
+            tooltip="Run every command, independent ones in parallel",
+            on_click=self.run_all_click
+        )
+
+        # Search through the commands and outputs of the session
+        self.search_field = ft.TextField(
+            hint_text="Search outputs",
+            prefix_icon=ft.icons.SEARCH,
+            dense=True,
+            width=240,
+            on_change=self._on_search_change,
+            on_submit=self._on_search_submit,
+        )
+        self.search_status = ft.Text("", size=12, italic=True, visible=False)
+        self.search_previous = ft.IconButton(
+            icon=ft.icons.KEYBOARD_ARROW_UP,
+            tooltip="Previous match",
+            on_click=lambda e: self._on_search_step(-1),
+            disabled=True,
+        )
+        self.search_next = ft.IconButton(
+            icon=ft.icons.KEYBOARD_ARROW_DOWN,
+            tooltip="Next match (Enter)",
+            on_click=lambda e: self._on_search_step(1),
+            disabled=True,
+        )
+
+        # Load of the command executor, only shown while commands run
+        self.executor_status = ft.Text("", size=12, italic=True, visible=False)
+        get_command_executor().add_listener(self._on_executor_metrics)
+
+        # p50/p95 of each traced stage (commands, AI requests, UI updates), hidden until asked for
+        self.perf_button = ft.IconButton(
+            icon=ft.icons.SPEED,
+            tooltip="Performance",
+            on_click=self._toggle_perf_panel,
+            visible=tracing.get_tracer().enabled,
+        )
+        self.perf_table = ft.Column([], spacing=2)
+        self.perf_status = ft.Text("", size=12, italic=True)
+        self.perf_panel = ft.Container(
+            content=ft.Column([
+                ft.Row([
+                    ft.Text("Performance (recent spans)", weight=ft.FontWeight.BOLD),
+                    ft.Container(expand=True),
+                    self.perf_status,
+                    ft.TextButton("Export", on_click=self._export_trace),
+                    ft.TextButton("Clear", on_click=self._clear_trace),
+                ]),
+                self.perf_table,
+            ], spacing=4),
+            padding=10,
+            border=ft.border.all(1, ft.colors.with_opacity(0.2, ft.colors.OUTLINE)),
+            visible=False,
+        )
+
         # Return the list of top-level controls for this view
         return [
             ft.Row(
                 [
                     ft.Text("AI Terminal", size=20, weight=ft.FontWeight.BOLD),
                     ft.Container(expand=True), # Pushes button to the right
+                    self.search_field,
+                    self.search_status,
+                    self.search_previous,
+                    self.search_next,
+                    self.executor_status,
+                    self.perf_button,
+                    self.run_all_button,
                     add_button
                 ],
                 alignment=ft.MainAxisAlignment.SPACE_BETWEEN
             ),
             ft.Divider(height=1),
+            self.perf_panel,
             self.command_list_view # The scrollable column holding the cells
         ]
\ No newline at end of file